@@ -0,0 +1,200 @@
+'''
+
+This code times run.py on synthetic cohorts of several sizes, end to end and section by section, so the scaling
+of every section can be seen and a section that grows faster than the cohort is caught.
+
+How to use:
+
+$ python3 benchmark.py --scales 1000,10000,100000
+
+Every scale is a cohort written by synthetic.py into a directory of its own under --directory, which is kept and
+reused by later runs with the same seed. run.py runs there with --profile, and the wall time of every stage is
+taken from its report. The table printed has a column per scale and the scaling exponent between the two largest
+scales, where 1 is linear and 2 is quadratic. With three scales or more it also has how many times longer a stage
+takes per patient at the largest scale than at the smallest, when it rises at every scale: a per-patient scan of a
+whole table hides behind the per-patient cost and keeps the exponent near 1 at these scales, but its time per
+patient still grows with the cohort.
+
+Options:
+
+--scales N,N,...    numbers of patients of the cohorts, 2000,8000,32000 by default
+--seed N            seed of the synthetic cohorts
+--repeat N          run every scale N times and keep the fastest time of every stage, 3 by default, since the
+                    time per patient of a single run is too noisy to tell a quadratic stage
+--directory DIR     directory of the cohorts, benchmark_cohorts by default
+--output PATH       also write the times to PATH as csv
+--check             exit with status 1 when a stage scales worse than SUPERLINEAR_EXPONENT, or its time per
+                    patient grows by more than PER_PATIENT_GROWTH
+-- ARGS             arguments for run.py, e.g. -- --workers 4
+
+'''
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import pandas as pd
+
+import synthetic
+
+
+RUN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run.py')
+PROFILE_NAME = 'profile.json'
+# a stage whose time grows by more than this power of the number of patients is reported as superlinear
+SUPERLINEAR_EXPONENT = 1.5
+# a stage whose time per patient rises at every scale, and by more than this from the smallest scale to the largest,
+# is reported as superlinear. Over the 16 times more patients of the default scales, timing noise of 10% gives a
+# linear stage 1.22 and a sort n log n 1.36 at most
+PER_PATIENT_GROWTH = 1.4
+# stages faster than this at the largest scale are too noisy to have a per-patient growth
+PER_PATIENT_MINIMUM_SECONDS = 0.5
+# stages faster than this at the largest scale are too noisy to have a scaling exponent
+MINIMUM_SECONDS = 0.05
+
+
+def prepare_cohort(directory, patient_count, seed):
+    '''
+    write the synthetic cohort of a scale, unless the directory already has it
+    :param directory: directory of the cohort
+    :param patient_count: number of patients
+    :param seed: seed of the random generator
+    :return:
+    '''
+    key_path = os.path.join(directory, 'cohort.json')
+    key = {'patients': patient_count, 'seed': seed}
+    if os.path.exists(key_path):
+        with open(key_path) as f:
+            if json.load(f) == key:
+                return
+    synthetic.write_cohort(directory, patient_count, seed)
+    with open(key_path, 'w') as f:
+        json.dump(key, f)
+
+def run_once(directory, run_args):
+    '''
+    run run.py in the directory of a cohort with --profile
+    :param directory: directory of the cohort
+    :param run_args: other arguments of run.py
+    :return: dict of stage name to its wall seconds, with the whole run as 'end_to_end'
+    '''
+    start = time.perf_counter()
+    subprocess.run([sys.executable, RUN_PATH, '--profile', PROFILE_NAME] + run_args, cwd=directory, check=True,
+                   stdout=subprocess.DEVNULL)
+    seconds = {'end_to_end': time.perf_counter() - start}
+    with open(os.path.join(directory, PROFILE_NAME)) as f:
+        for stage in json.load(f)['stages']:
+            seconds[stage['stage']] = stage['wall_seconds']
+    return seconds
+
+def get_exponent(patients_1, seconds_1, patients_2, seconds_2):
+    '''
+    give the times of a stage at two scales, return the power of the number of patients its time grows with
+    :return: the exponent, None when a time is too short to tell
+    '''
+    if seconds_1 <= 0 or seconds_2 < MINIMUM_SECONDS or patients_1 == patients_2:
+        return None
+    return math.log(seconds_2 / seconds_1) / math.log(patients_2 / patients_1)
+
+def get_per_patient_growth(patient_counts, seconds):
+    '''
+    give the times of a stage at three scales or more, return how many times longer it takes per patient at the largest
+    scale than at the smallest. A stage with a per-patient scan of a whole table is quadratic, and its time per patient
+    rises with every scale even while the per-patient cost keeps the exponent near 1.
+    :param patient_counts: list of numbers of patients, in increasing order
+    :param seconds: list of the times of the stage at these numbers of patients
+    :return: the growth, None when there are too few scales, the times are too short to tell or the time per patient
+    falls between two scales
+    '''
+    if len(patient_counts) < 3 or min(seconds) <= 0 or seconds[-1] < PER_PATIENT_MINIMUM_SECONDS:
+        return None
+    per_patient = [seconds_at_scale / patient_count for patient_count, seconds_at_scale in zip(patient_counts, seconds)]
+    if any(later <= earlier for earlier, later in zip(per_patient, per_patient[1:])):
+        return None
+    return per_patient[-1] / per_patient[0]
+
+def find_superlinear(times_df):
+    '''
+    give the times of benchmark, return the stages that grow faster than the number of patients
+    :param times_df: dataframe of benchmark, with its 'exponent' and 'per_patient_growth' columns
+    :return: list of (stage, reason) pairs
+    '''
+    superlinear = []
+    for stage, row in times_df.iterrows():
+        exponent = row.get('exponent')
+        growth = row.get('per_patient_growth')
+        if exponent is not None and exponent > SUPERLINEAR_EXPONENT:
+            superlinear.append((stage, 'grows with the power %.2f of the patients' % exponent))
+        elif growth is not None and growth > PER_PATIENT_GROWTH:
+            superlinear.append((stage, 'takes %.2f times longer per patient at the largest scale' % growth))
+    return superlinear
+
+def benchmark(scales, seed=7, repeat=3, directory='benchmark_cohorts', run_args=()):
+    '''
+    Time run.py at every scale.
+    :param scales: list of numbers of patients
+    :param seed: seed of the synthetic cohorts
+    :param repeat: number of runs per scale, the fastest time of every stage is kept
+    :param directory: directory of the cohorts
+    :param run_args: other arguments of run.py
+    :return: dataframe of the wall seconds with a row per stage and a column per scale, an 'exponent' column and
+    a 'per_patient_growth' column, see get_exponent and get_per_patient_growth
+    '''
+    times = {}
+    for patient_count in scales:
+        cohort_directory = os.path.join(directory, str(patient_count))
+        prepare_cohort(cohort_directory, patient_count, seed)
+        for _ in range(repeat):
+            for stage, seconds in run_once(cohort_directory, list(run_args)).items():
+                times.setdefault(stage, {})
+                times[stage][patient_count] = min(seconds, times[stage].get(patient_count, seconds))
+        print('%d patients: %.2fs' % (patient_count, times['end_to_end'][patient_count]), file=sys.stderr)
+
+    return add_scaling(pd.DataFrame.from_dict(times, orient='index')[list(scales)], scales)
+
+def add_scaling(times_df, scales):
+    '''
+    add the scaling exponent and the per-patient growth of every stage to the times of benchmark
+    :param times_df: dataframe of the wall seconds with a row per stage and a column per scale
+    :param scales: list of numbers of patients, the columns of times_df
+    :return: times_df with the 'exponent' and 'per_patient_growth' columns, when there are enough scales
+    '''
+    scales = sorted(scales)
+    if len(scales) > 1:
+        largest = scales[-2:]
+        times_df['exponent'] = [get_exponent(largest[0], row[largest[0]], largest[1], row[largest[1]])
+                                for _, row in times_df.iterrows()]
+    if len(scales) > 2:
+        times_df['per_patient_growth'] = [get_per_patient_growth(scales, [row[scale] for scale in scales])
+                                          for _, row in times_df.iterrows()]
+    return times_df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time run.py on synthetic cohorts of several sizes.')
+    parser.add_argument('--scales', default='2000,8000,32000', metavar='N,N,...',
+                        help='numbers of patients of the cohorts')
+    parser.add_argument('--seed', type=int, default=7, metavar='N', help='seed of the synthetic cohorts')
+    parser.add_argument('--repeat', type=int, default=3, metavar='N', help='runs per scale')
+    parser.add_argument('--directory', default='benchmark_cohorts', metavar='DIR', help='directory of the cohorts')
+    parser.add_argument('--output', metavar='PATH', help='write the times to PATH as csv')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with status 1 when a stage scales worse than linear')
+    parser.add_argument('run_args', nargs=argparse.REMAINDER, help='arguments for run.py after --')
+    args = parser.parse_args()
+
+    run_args = args.run_args[1:] if args.run_args[:1] == ['--'] else args.run_args
+    scales = sorted(int(scale) for scale in args.scales.split(','))
+    times_df = benchmark(scales, args.seed, args.repeat, args.directory, run_args)
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(times_df.round(3))
+    if args.output:
+        times_df.to_csv(args.output, index_label='stage')
+
+    superlinear = find_superlinear(times_df)
+    for stage, reason in superlinear:
+        print('%s %s' % (stage, reason), file=sys.stderr)
+    if args.check and superlinear:
+        sys.exit(1)
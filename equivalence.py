@@ -0,0 +1,167 @@
+'''
+
+This code checks the sections of run.py against the row-loop implementation of legacy.py on the same input, so a
+faster section can only replace the one target.csv was first made with when it gives the same columns.
+
+How to use:
+
+Run it in the directory of the source tables, as run.py, or point it to one, for instance one written by synthetic.py.
+
+$ python3 equivalence.py --sections COMORBIDITIES,GRACE_SCORE --sample 500
+
+Every section runs on the target table the sections of run.py before it made, once with run.py and once with
+legacy.py, and every column they give is compared. Numbers are equal within the tolerances of numpy.isclose, an
+empty text equals a missing value, and other values are compared as text. The mismatching PERSON_IDs of every column
+are reported, and the exit status is 1 when there are any.
+
+Options:
+
+--directory DIR     directory of the source tables, the working directory by default
+--synthetic N       first write a synthetic cohort of N patients into DIR with synthetic.py
+--sections A,B,...  only check these sections, all by default
+--sample N          only check a random sample of N patients
+--seed N            seed of the sample and of the synthetic cohort
+--rtol X, --atol X  relative and absolute tolerance of the numbers
+--output PATH       write the mismatches to PATH as csv
+
+'''
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+import legacy
+import run
+
+
+# the number of mismatching PERSON_IDs printed for a column, the csv report has all of them
+PRINTED_PERSON_IDS = 10
+
+
+def get_equal_values(values_1, values_2, rtol=1e-6, atol=1e-9):
+    '''
+    compare two columns of values as they would be written to target.csv
+    :param values_1: pd.Series
+    :param values_2: pd.Series of the same length
+    :param rtol: relative tolerance of numbers
+    :param atol: absolute tolerance of numbers
+    :return: np.array of bool, True where the values are equal
+    '''
+    numbers_1 = pd.to_numeric(values_1, errors='coerce').values.astype(float)
+    numbers_2 = pd.to_numeric(values_2, errors='coerce').values.astype(float)
+    empty_1 = values_1.isna().values | (values_1.astype(str).values == '')
+    empty_2 = values_2.isna().values | (values_2.astype(str).values == '')
+    numeric = ~np.isnan(numbers_1) & ~np.isnan(numbers_2)
+    equal = values_1.astype(str).values == values_2.astype(str).values
+    equal[numeric] = np.isclose(numbers_1[numeric], numbers_2[numeric], rtol=rtol, atol=atol)
+    equal[empty_1 & empty_2] = True
+    return equal
+
+def compare_section(fast_df, legacy_df, pat_ids, rtol=1e-6, atol=1e-9):
+    '''
+    compare the columns two implementations of a section gave
+    :param fast_df: section_df of run.py, indexed by PERSON_ID
+    :param legacy_df: section_df of legacy.py, indexed by PERSON_ID
+    :param pat_ids: the patients to compare
+    :param rtol: relative tolerance of numbers
+    :param atol: absolute tolerance of numbers
+    :return: list of dicts with the column, what is wrong and the mismatching PERSON_IDs
+    '''
+    mismatches = []
+    columns = list(fast_df.columns) + [column for column in legacy_df.columns if column not in fast_df.columns]
+    for column in columns:
+        if column not in legacy_df.columns or column not in fast_df.columns:
+            side = 'legacy' if column not in legacy_df.columns else 'fast'
+            mismatches.append({'column': column, 'problem': 'missing in ' + side, 'person_ids': list(pat_ids)})
+            continue
+        equal = get_equal_values(fast_df[column].reindex(pat_ids), legacy_df[column].reindex(pat_ids), rtol, atol)
+        if not equal.all():
+            mismatches.append({'column': column, 'problem': 'different values', 'person_ids': list(pat_ids[~equal])})
+    return mismatches
+
+def check_sections(section_names=None, sample=0, seed=7, rtol=1e-6, atol=1e-9):
+    '''
+    Run every section with run.py and with legacy.py on the source tables of the working directory and compare them.
+    The sections not checked still run with run.py, since the later sections need their columns.
+    :param section_names: names of the sections to check, all of them when None
+    :param sample: number of patients to check, all of them when 0
+    :param seed: seed of the sample
+    :param rtol: relative tolerance of numbers
+    :param atol: absolute tolerance of numbers
+    :return: list of dicts with the section, its times, and its mismatches, see compare_section
+    '''
+    tables = {name: run.add_date_columns(run.load_table(name)) for name in run.SOURCE_TABLES}
+    pat_ids = run.encode_keys(tables)['PAT_ID']
+    if 0 < sample < len(pat_ids):
+        pat_ids = np.sort(np.random.RandomState(seed).choice(pat_ids, sample, replace=False))
+        tables = run.slice_tables(tables, pat_ids)
+    for df in tables.values():
+        run.build_key_index(df, 'PAT_ID')
+    inputs = dict(tables)
+    inputs['index_events'] = run.resolve_index_events(tables['diagnoses'], tables['visits_w_prov_type'])
+
+    results = []
+    target_df = pd.DataFrame({'PERSON_ID': run.get_person_ids(tables, pat_ids)})
+    for section in run.SECTIONS + run.COHORT_SECTIONS:
+        start = time.perf_counter()
+        if section in run.COHORT_SECTIONS:
+            fast_df = run.POST_VANDERNILT(target_df)[0]
+        else:
+            fast_df = run.call_section(section, target_df, inputs)
+        fast_seconds = time.perf_counter() - start
+
+        if section_names is None or section['section'] in section_names:
+            start = time.perf_counter()
+            legacy_df = legacy.call_section(section, target_df)
+            results.append({'section': section['section'], 'fast_seconds': fast_seconds,
+                            'legacy_seconds': time.perf_counter() - start,
+                            'mismatches': compare_section(fast_df, legacy_df, pat_ids, rtol, atol)})
+        target_df = run.add_columns(target_df, fast_df)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the sections of run.py against the ones of legacy.py.')
+    parser.add_argument('--directory', default='.', metavar='DIR', help='directory of the source tables')
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N',
+                        help='first write a synthetic cohort of N patients into DIR')
+    parser.add_argument('--sections', metavar='A,B,...', help='only check these sections')
+    parser.add_argument('--sample', type=int, default=0, metavar='N', help='only check N random patients')
+    parser.add_argument('--seed', type=int, default=7, metavar='N', help='seed of the sample and the cohort')
+    parser.add_argument('--rtol', type=float, default=1e-6, help='relative tolerance of the numbers')
+    parser.add_argument('--atol', type=float, default=1e-9, help='absolute tolerance of the numbers')
+    parser.add_argument('--output', metavar='PATH', help='write the mismatches to PATH as csv')
+    args = parser.parse_args()
+
+    section_names = [name.strip() for name in args.sections.split(',')] if args.sections else None
+    known_names = [section['section'] for section in run.SECTIONS + run.COHORT_SECTIONS]
+    if section_names is not None and set(section_names) - set(known_names):
+        parser.error('unknown sections %s' % ', '.join(sorted(set(section_names) - set(known_names))))
+    output = os.path.abspath(args.output) if args.output else None
+    if args.synthetic > 0:
+        import synthetic
+        synthetic.write_cohort(args.directory, args.synthetic, args.seed)
+    os.chdir(args.directory)
+
+    results = check_sections(section_names, args.sample, args.seed, args.rtol, args.atol)
+    rows = []
+    for result in results:
+        mismatches = result['mismatches']
+        person_ids = set(person_id for mismatch in mismatches for person_id in mismatch['person_ids'])
+        print('%s: %s, fast %.2fs, legacy %.2fs' % (
+            result['section'], 'equal' if not mismatches else '%d columns differ for %d patients'
+            % (len(mismatches), len(person_ids)), result['fast_seconds'], result['legacy_seconds']))
+        for mismatch in mismatches:
+            print('    %s %s: %s' % (mismatch['column'], mismatch['problem'],
+                                     ' '.join(str(person_id) for person_id in mismatch['person_ids'][:PRINTED_PERSON_IDS])
+                                     + (' ...' if len(mismatch['person_ids']) > PRINTED_PERSON_IDS else '')))
+            rows.append({'section': result['section'], 'column': mismatch['column'], 'problem': mismatch['problem'],
+                         'patients': len(mismatch['person_ids']),
+                         'person_ids': ' '.join(str(person_id) for person_id in mismatch['person_ids'])})
+    if output:
+        pd.DataFrame(rows, columns=['section', 'column', 'problem', 'patients', 'person_ids']).to_csv(output, index=False)
+    if rows:
+        sys.exit(1)
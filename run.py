@@ -11,6 +11,30 @@ $ python3 elements.py
 
 The script will create a target.csv file with all the data columns in it.
 
+Options:
+
+--engine pyarrow    read the source tables with the pyarrow csv parser instead of the default c parser
+--rebuild-cache     parse the source tables again instead of loading them from the .feather cache next to them
+--workers N         compute the patients in N shards on N processes, the cohort percentiles are taken after merging
+--threads N         run the sections that do not depend on each other on N threads
+--incremental       only compute the patients whose source rows changed since the last --incremental run and reuse
+                    the others, the state of the run is kept in target.incremental.pkl
+--blocks N          partition the source tables by patient into N blocks on disk and process one block at a time,
+                    so the memory needed is bounded by the block size
+--columns A,B,...   only compute and write the columns A, B, ..., running only the sections they need and reading
+                    only the source tables those sections use
+--thresholds PATH   use the cohort thresholds of POST_VANDERNILT saved from another cohort, e.g. a training cohort
+--save-thresholds PATH
+                    write the cohort thresholds of this run to PATH
+--legacy-sections SECTION,...
+                    run these sections, or all of them, with the row-loop implementation of legacy.py that the
+                    faster sections are checked against, see equivalence.py
+--profile PATH      write the wall time, CPU time, peak memory growth, rows and patients of every section and every
+                    ingestion step to PATH, as JSON when PATH ends with .json and as CSV otherwise
+--profile-dumps DIRECTORY
+                    write a cProfile dump of every section and ingestion step to DIRECTORY, to open with pstats
+                    or snakeviz
+
 Code configuration:
 
 The code organize all the features in tables by splitting them to different functions.
@@ -23,12 +47,28 @@ For any further questions, please email to zhenduow@cs.utah.edu
 
 
 
+import argparse
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import cProfile
 import datetime
+import hashlib
+import json
+import os
+import threading
 import time
-import statistics as stat
 import pandas as pd
 import re
 import numpy as np
+import shutil
+import weakref
+try:
+    import resource
+except ImportError:
+    # there is no resource module on Windows, so the peak memory is not reported there
+    resource = None
 pd.set_option('display.max_rows', None)
 
 DIAGNOSES_PATH = ".\\IRB_90679_Chapman_AMI_diagnoses_12132018.txt"
@@ -39,6 +79,39 @@ PROCEDURES_PATH = ".\\IRB_90679_Chapman_AMI_procedures_12132018.txt"
 VISITS_W_PROV_TYPE_PATH = ".\\IRB_90679_Chapman_AMI_visits_w_prov_type_12132018.txt"
 DEMOGRAPHICS_PATH = ".\\IRB_90679_Chapman_AMI_demographics_12132018.txt"
 TARGET_PATH = '.\\target.csv'
+INCREMENTAL_STATE_PATH = '.\\target.incremental.pkl'
+BLOCKS_DIRECTORY = '.\\target.blocks'
+# rows of a source table read at a time while it is partitioned into blocks
+STREAM_CHUNK_ROWS = 1 << 18
+
+# how each source table is read: the columns the sections use, whether stray quotation marks are removed, and the
+# columns read as categories or as numbers. Text that is not a number reads as 0, as try_float does.
+SOURCE_TABLES = {
+    'diagnoses': {'path': DIAGNOSES_PATH, 'strip_quotes': True,
+                  'columns': ['PAT_ID', 'VISIT_NO', 'ADM_DATE', 'CODE', 'CODE_VERSION', 'CODE_DESC'],
+                  'category': ['CODE_VERSION'], 'numeric': []},
+    'labs': {'path': LABS_PATH, 'strip_quotes': True,
+             'columns': ['PAT_ID', 'VISIT_NO', 'ITEM', 'OBS_VALUE', 'OBS_VALUE_NUM', 'OBS_DTM'],
+             'category': ['ITEM'], 'numeric': ['OBS_VALUE', 'OBS_VALUE_NUM']},
+    'med_admin': {'path': MED_ADMIN_PATH, 'strip_quotes': True,
+                  'columns': ['PAT_ID'],
+                  'category': [], 'numeric': []},
+    'med_orders': {'path': MED_ORDERS_PATH, 'strip_quotes': True,
+                   'columns': ['PAT_ID', 'VISIT_NO', 'ITEM', 'ORDER_TYPE'],
+                   'category': ['ORDER_TYPE'], 'numeric': []},
+    'procedures': {'path': PROCEDURES_PATH, 'strip_quotes': True,
+                   'columns': ['PAT_ID', 'VISIT_NO', 'CODE', 'CODE_DESC', 'PROC_DT'],
+                   'category': [], 'numeric': []},
+    # the visits have always been used with their quotation marks
+    'visits_w_prov_type': {'path': VISITS_W_PROV_TYPE_PATH, 'strip_quotes': False,
+                           'columns': ['PAT_ID', 'VISIT_NO', 'ADM_DATE', 'DSCH_DATE', 'PAT_CLASS', 'CLINICAL_LOS',
+                                       'VISIT_TYPE'],
+                           'category': ['PAT_CLASS', 'VISIT_TYPE'], 'numeric': ['CLINICAL_LOS']},
+    'demographics': {'path': DEMOGRAPHICS_PATH, 'strip_quotes': True,
+                     'columns': ['PAT_ID', 'VISIT_NO', 'PAT_GENDER', 'SSN', 'ZIP', 'FIRST_NAME', 'LAST_NAME',
+                                 'MIDDLE_NAME', 'DOB', 'AMI_ADM_DATE', 'AMI_DSCH_DATE'],
+                     'category': ['PAT_GENDER'], 'numeric': []},
+}
 
 ACUTE_MYOCARDIAL_INFARCTION_CODE = ['410.00','410.01','410.10','410.11','410.20','410.21','410.30','410.31',
                                     '410.40','410.41','410.50','410.51','410.60','410.61','410.70','410.71',
@@ -212,6 +285,568 @@ HISTORY_STROKE_FLAG_PATTERN = ['430\..*','431\..*','432\..*','433\..*','434\..*'
 
 IN_HOSPITAL_PCI_CODE = ['V45.82', 'Z98.61']
 
+# Code lists and code patterns that the code classifier sorts codes into, by the name of their constant, in bit
+# order. Names with _PATTERN are regular expressions matched at the start of a code, the others are lists of values.
+# The discharge medication patterns are substrings of medication names and are matched separately.
+CODE_CATEGORIES = ['ACUTE_MYOCARDIAL_INFARCTION_CODE', 'CHEST_PAIN_CODE', 'CARDIAC_ARREST_CODE', 'CLOPIDOGREL_NAMES',
+                   'PRIOR_SEPSIS_30D_CODE', 'PRIOR_HYPERKALEMIA_30D_CODE', 'PRIOR_HYPOKALEMIA_30D_CODE',
+                   'PRIOR_HYPERVOLEMIA_30D_CODE', 'PRIOR_AKF_30D_CODE', 'PRIOR_UTI_30D_CODE',
+                   'PRIOR_LONGTERM_ANTICOAGULANTS_30D_CODE', 'PRIOR_DIS_MAGN_METAB_90D_CODE', 'PRIOR_LVEF_90D_CODE',
+                   'PRIOR_CARDIAC_DEVICE_90D_CODE', 'REVASCULARIZATION_CODE', 'ONE_VESSEL_CODE', 'CHEST_PAIN_NAMES',
+                   'FAMILY_DEPRESSION_CODE', 'AMI_FLAG_CODE', 'CABG_FLAG_CODE', 'PCI_FLAG_CODE', 'PVD_FLAG_CODE',
+                   'ANGINA_FLAG_CODE', 'UNSTABLE_ANGINA_FLAG_CODE', 'DEPRESSION_FLAG_CODE', 'HYPERTENSION_FLAG_CODE',
+                   'ECHOCARDIOGRAPHY_CODE', 'IN_HOSPITAL_HF_CODE', 'IN_HOSPITAL_ISCHEMIA_CODE',
+                   'CARDIAC_PROCEDURE_FLAG_PATTERN', 'COMORBID_ARRHYTHMIA_PATTERN', 'COMORBID_ANEMIA_PATTERN',
+                   'COMORBID_HYPERTENSION_PATTERN', 'COMORBID_COPD_PATTERN', 'COMORBID_CKD_PATTERN',
+                   'COMORBID_STROKE_PATTERN', 'COMORBID_TOBACCO_USE_CODE', 'COMORBID_DEPRESSION_CODE',
+                   'COMORBID_HYPERCHOLESTEROLEMIA_PATTERN', 'COMORBID_CAD_PATTERN', 'PRIOR_REVASCULARIZATION_PATTERN',
+                   'COMORBID_DIABETES_CC_PATTERN', 'COMORBID_DIABETES_PATTERN', 'COMORBID_CHF_CODE',
+                   'COMORBID_MI_PATTERN', 'COMORBID_PERIPHERAL_VASCULAR_DISEASE_CODE',
+                   'COMORBID_CEREBROVASCULAR_DISEASE_PATTERN', 'COMORBID_DEMENTIA_PATTERN',
+                   'COMORBID_CHRONIC_PULMONARY_DISEASE_PATTERN', 'COMORBID_RHEUMATOLOGIC_DISEASE_PATTERN',
+                   'COMORBID_PEPTIC_ULCER_DISEASE_PATTERN', 'COMORBID_MILD_LIVER_DISEASE_PATTERN',
+                   'COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_PATTERN', 'COMORBID_RENAL_DISEASE_PATTERN',
+                   'COMORBID_MODERATE_OR_SEVERE_LIVER_DISEASE_PATTERN', 'COMORBID_AIDS_PATTERN', 'CHF_CODE',
+                   'NSTEMI_FLAG_CODE', 'REHAB_FLAG_CODE', 'KILLIP_CLASS_CODE_I', 'KILLIP_CLASS_CODE_II',
+                   'KILLIP_CLASS_CODE_III', 'KILLIP_CLASS_CODE_IV', 'LVEF_CODE', 'CHF_FLAG_CODE',
+                   'POST_MI_CABG_FLAG_CODE1', 'POST_MI_CABG_FLAG_PATTERN2', 'HISTORY_STROKE_FLAG_PATTERN',
+                   'IN_HOSPITAL_PCI_CODE']
+
+# Discharge medication classes, by the name of their constant, in bit order. Each is a list of substrings of
+# medication names.
+MEDICATION_CATEGORIES = ['DISCH_MED_BB_FLAG_PATTERN', 'DISCH_MED_ANTIDEP_FLAG_PATTERN',
+                         'DISCH_MED_ACE_ARB_FLAG_PATTERN', 'DISCH_MED_ASPIRIN_FLAG_PATTERN']
+
+# Diagnosis flags evaluated together by evaluate_flag_specs. Each spec names the output column, the code category
+# (one of CODE_CATEGORIES) the value of 'key', CODE by default, has to belong to, and the window of days before the
+# 'reference' day of the index admission in which a diagnosis counts, with None for an open end. 'index_visit' only
+# counts codes that also appear on the index visit and 'count' returns the number of matching diagnoses instead of a
+# 0/1 flag.
+PRIOR_MONTH_DIAGNOSIS_FLAGS = [
+    {'column': 'PRIOR_SEPSIS_30D', 'category': 'PRIOR_SEPSIS_30D_CODE', 'window': (0, 30)},
+    {'column': 'PRIOR_HYPERKALEMIA_30D', 'category': 'PRIOR_HYPERKALEMIA_30D_CODE', 'window': (0, 30)},
+    {'column': 'PRIOR_HYPOKALEMIA_30D', 'category': 'PRIOR_HYPOKALEMIA_30D_CODE', 'window': (0, 30)},
+    {'column': 'PRIOR_HYPERVOLEMIA_30D', 'category': 'PRIOR_HYPERVOLEMIA_30D_CODE', 'window': (0, 30)},
+    {'column': 'PRIOR_AKF_30D', 'category': 'PRIOR_AKF_30D_CODE', 'window': (0, 30)},
+    {'column': 'PRIOR_UTI_30D', 'category': 'PRIOR_UTI_30D_CODE', 'window': (0, 30)},
+    {'column': 'PRIOR_LONGTERM_ANTICOAGULANTS_30D', 'category': 'PRIOR_LONGTERM_ANTICOAGULANTS_30D_CODE', 'window': (0, 30)},
+    {'column': 'PRIOR_SEPSIS_90D', 'category': 'PRIOR_SEPSIS_30D_CODE', 'window': (0, 90)},
+    {'column': 'PRIOR_DIS_MAGN_METAB_90D', 'category': 'PRIOR_DIS_MAGN_METAB_90D_CODE', 'window': (0, 90)},
+    {'column': 'PRIOR_HYPOKALEMIA_90D', 'category': 'PRIOR_HYPOKALEMIA_30D_CODE', 'window': (0, 90)},
+    # the LVEF and cardiac device flags have always been computed from the metabolism codes
+    {'column': 'PRIOR_LVEF_90D', 'category': 'PRIOR_DIS_MAGN_METAB_90D_CODE', 'window': (0, 90)},
+    {'column': 'PRIOR_AKF_90D', 'category': 'PRIOR_AKF_30D_CODE', 'window': (0, 90)},
+    {'column': 'PRIOR_CARDIAC_DEVICE_90D', 'category': 'PRIOR_DIS_MAGN_METAB_90D_CODE', 'window': (0, 90)},
+]
+PATIENT_HISTORY_FLAGS = [
+    {'column': 'HISTORY_CHEST_PAIN_FLAG', 'key': 'CODE_DESC', 'category': 'CHEST_PAIN_NAMES', 'window': (1, None)},
+    {'column': 'HISTORY_AMI_FLAG', 'category': 'AMI_FLAG_CODE', 'window': (1, None)},
+    {'column': 'HISTORY_CABG_FLAG', 'category': 'CABG_FLAG_CODE', 'window': (1, None)},
+    {'column': 'HISTORY_PCI_FLAG', 'category': 'PCI_FLAG_CODE', 'window': (1, None)},
+    {'column': 'HISTORY_PVD_FLAG', 'category': 'PVD_FLAG_CODE', 'window': (1, None)},
+    {'column': 'HISTORY_ANGINA_FLAG', 'category': 'ANGINA_FLAG_CODE', 'window': (1, None)},
+    {'column': 'HISTORY_UNSTABLE_ANGINA_FLAG', 'category': 'UNSTABLE_ANGINA_FLAG_CODE', 'window': (1, None)},
+    {'column': 'HISTORY_HYPERTENSION_FLAG', 'category': 'HYPERTENSION_FLAG_CODE', 'window': (1, None)},
+    {'column': 'HISTORY_DEPRESSION_FLAG', 'category': 'DEPRESSION_FLAG_CODE', 'window': (1, None)},
+    {'column': 'FAMILY_DEPRESSION_FLAG', 'category': 'FAMILY_DEPRESSION_CODE', 'window': (1, None)},
+    {'column': 'MAJOR_DEPRESSION_COUNT', 'category': 'DEPRESSION_FLAG_CODE', 'window': (1, None), 'count': True},
+]
+COMORBIDITY_FLAGS = [
+    {'column': 'COMORBID_ARRHYTHMIA_FLAG', 'category': 'COMORBID_ARRHYTHMIA_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_ANEMIA_FLAG', 'category': 'COMORBID_ANEMIA_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_HYPERTENSION_FLAG', 'category': 'COMORBID_HYPERTENSION_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_COPD_FLAG', 'category': 'COMORBID_COPD_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_CKD_FLAG', 'category': 'COMORBID_CKD_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_STROKE_FLAG', 'category': 'COMORBID_STROKE_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_TOBACCO_USE_FLAG', 'category': 'COMORBID_TOBACCO_USE_CODE', 'window': (1, None)},
+    {'column': 'COMORBID_DEPRESSION_FLAG', 'category': 'COMORBID_DEPRESSION_CODE', 'window': (1, None)},
+    {'column': 'COMORBID_HYPERCHOLESTEROLEMIA_FLAG', 'category': 'COMORBID_HYPERCHOLESTEROLEMIA_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_CAD_FLAG', 'category': 'COMORBID_CAD_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'PRIOR_REVASCULARIZATION_FLAG', 'category': 'PRIOR_REVASCULARIZATION_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_DIABETES_CC_FLAG', 'category': 'COMORBID_DIABETES_CC_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_DIABETES_FLAG', 'category': 'COMORBID_DIABETES_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_CHF_FLAG', 'category': 'COMORBID_CHF_CODE', 'window': (1, None)},
+    {'column': 'COMORBID_MI_FLAG', 'category': 'COMORBID_MI_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_PERIPHERAL_VASCULAR_DISEASE_FLAG', 'category': 'COMORBID_PERIPHERAL_VASCULAR_DISEASE_CODE', 'window': (1, None)},
+    {'column': 'COMORBID_CEREBROVASCULAR_DISEASE_FLAG', 'category': 'COMORBID_CEREBROVASCULAR_DISEASE_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_DEMENTIA_FLAG', 'category': 'COMORBID_DEMENTIA_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_CHRONIC_PULMONARY_DISEASE_FLAG', 'category': 'COMORBID_CHRONIC_PULMONARY_DISEASE_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_RHEUMATOLOGIC_DISEASE_FLAG', 'category': 'COMORBID_RHEUMATOLOGIC_DISEASE_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_PEPTIC_ULCER_DISEASE_FLAG', 'category': 'COMORBID_PEPTIC_ULCER_DISEASE_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_MILD_LIVER_DISEASE_FLAG', 'category': 'COMORBID_MILD_LIVER_DISEASE_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG', 'category': 'COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_RENAL_DISEASE_FLAG', 'category': 'COMORBID_RENAL_DISEASE_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_MODERATE_OR_SEVERE_LIVER_DISEASE_FLAG', 'category': 'COMORBID_MODERATE_OR_SEVERE_LIVER_DISEASE_PATTERN', 'window': (1, None), 'index_visit': True},
+    {'column': 'COMORBID_AIDS_FLAG', 'category': 'COMORBID_AIDS_PATTERN', 'window': (1, None), 'index_visit': True},
+]
+ENRICHD_FLAGS = [
+    {'column': 'KILLIP_CLASS_I_FLAG', 'category': 'KILLIP_CLASS_CODE_I', 'window': (1, None)},
+    {'column': 'CHF_FLAG', 'category': 'CHF_FLAG_CODE', 'window': (1, None)},
+    {'column': 'HISTORY_STROKE_FLAG', 'category': 'HISTORY_STROKE_FLAG_PATTERN', 'window': (1, None), 'index_visit': True},
+]
+
+# Visit counts evaluated together by count_visit_windows. Each spec names the output column, the visit date 'day'
+# column the window applies to, and the window of days from the 'reference' day of the index admission to the visit,
+# negative before it, with None for an open end. 'pat_class' only counts visits of that PAT_CLASS, 'sum' adds up
+# that column of the visits instead of counting them and 'flag' returns 0/1 instead of the count.
+HOSPITAL_SCORE_VISIT_WINDOWS = [
+    {'column': 'PRIOR_YEAR_ADMISSIONS_COUNT', 'day': 'DSCH_DATE_DAY', 'window': (-365, -1)},
+    {'column': 'NONELECTIVE_ADMISSION_FLAG', 'day': 'ADM_DATE_DAY', 'window': (-1, 0), 'pat_class': 'EMERGENCY', 'flag': True},
+]
+ADMINISTRATIVE_VISIT_WINDOWS = [
+    {'column': 'ED_VISIT_PRIOR_180_DAYS_COUNT', 'day': 'DSCH_DATE_DAY', 'window': (-180, 0), 'pat_class': 'EMERGENCY'},
+    {'column': 'ADMISSION_PRIOR_30_DAYS_COUNT', 'day': 'DSCH_DATE_DAY', 'window': (-30, 0), 'pat_class': 'INPATIENT'},
+    {'column': 'ED_VISIT_PRIOR_30_DAYS_COUNT', 'day': 'DSCH_DATE_DAY', 'window': (-30, 0), 'pat_class': 'EMERGENCY'},
+    {'column': 'ED_VISIT_PRIOR_30_DAYS_TIME_IN_ED', 'day': 'DSCH_DATE_DAY', 'window': (-30, 0), 'pat_class': 'EMERGENCY',
+     'sum': 'CLINICAL_LOS'},
+    {'column': 'ED_TO_IP_VISIT_PRIOR_30_DAYS_COUNT', 'day': 'DSCH_DATE_DAY', 'window': (-1, 0), 'pat_class': 'EMERGENCY'},
+]
+DATA_MANAGEMENT_VISIT_WINDOWS = [
+    {'column': 'PREVIOUS_30D_SUM', 'day': 'DSCH_DATE_DAY', 'window': (-30, -1)},
+    {'column': 'MORE_PREVIOUS_YR_SUM', 'day': 'DSCH_DATE_DAY', 'window': (None, -366)},
+    {'column': 'READMISSIONS_SUM', 'day': 'ADM_DATE_DAY', 'window': (1, None)},
+    {'column': 'FLG_30D_SUM', 'day': 'ADM_DATE_DAY', 'window': (1, 30)},
+]
+
+# Risk score tables evaluated by evaluate_score_table. Each component names the output column and the 'source'
+# column it scores, and gives its points in one of three ways: 'edges' and 'points', where points[i] is given to
+# values between edges[i] and edges[i + 1], the bins closed on the 'right' or on the left; 'categories', a map of
+# value to points; or 'weight', a factor of the value. Values outside all bins or categories get 'default', 0
+# unless given. The score is the sum of its components.
+GRACE_SCORE_TABLE = [
+    {'column': 'GRACE_SCORE_AGE', 'source': 'AGE_AT_ADMIT', 'right': True,
+     'edges': [0, 30, 39, 49, 59, 69, 79, 89, np.inf], 'points': [0, 8, 25, 41, 58, 75, 91, 100]},
+    {'column': 'GRACE_SCORE_HEART_RATE', 'source': 'HEART_RATE_AVG',
+     'edges': [-np.inf, 50, 70, 90, 110, 150, 200, np.inf], 'points': [0, 3, 9, 15, 24, 38, 46]},
+    {'column': 'GRACE_SCORE_SYSTOLIC_BP', 'source': 'SYSTOLIC_BP_AVG',
+     'edges': [-np.inf, 80, 100, 120, 140, 160, 200, np.inf], 'points': [0, 53, 43, 34, 24, 10, 0]},
+    # the lowest creatinine bin leaves out 0
+    {'column': 'GRACE_SCORE_CREATININE_LEVEL_FIRST', 'source': 'CREATININE_LEVEL_FIRST',
+     'edges': [np.nextafter(0, 1), 0.4, 0.8, 1.2, 1.6, 2.0, 4.0, np.inf], 'points': [1, 4, 7, 10, 13, 21, 28]},
+    {'column': 'GRACE_SCORE_KILLIP_CLASS', 'source': 'KILLIP_CLASS', 'categories': {'I': 0, 'II': 20, 'III': 39, 'IV': 59}},
+    {'column': 'GRACE_SCORE_CARDIAC_MARKER_ELEVATION', 'source': 'CARDIAC_MARKER_ELEVATION_FLAG', 'weight': 14},
+    {'column': 'GRACE_SCORE_CARDIAC_ARREST', 'source': 'CARDIAC_ARREST_FLAG', 'weight': 39},
+    {'column': 'GRACE_SCORE_STEMI', 'source': 'STEMI_FLAG', 'weight': 28},
+]
+LACE_SCORE_TABLE = [
+    {'column': 'LACE_ACUITY_SCORE', 'source': 'NONELECTIVE_ADMISSION_FLAG', 'weight': 3},
+    {'column': 'LACE_LOS_SCORE', 'source': 'LOS', 'right': True,
+     'edges': [0, 1, 2, 3, 6, 13, np.inf], 'points': [1, 2, 3, 4, 5, 7]},
+    {'column': 'LACE_CHARLSON_SCORE', 'source': 'CHARLSON_DEYO_SCORE',
+     'edges': [-np.inf, 1, 2, 3, 4, np.inf], 'points': [0, 1, 2, 3, 5]},
+    {'column': 'LACE_ED_SCORE', 'source': 'ED_VISIT_PRIOR_180_DAYS_COUNT',
+     'edges': [-np.inf, 1, 2, 3, 4, np.inf], 'points': [0, 1, 2, 3, 4]},
+]
+HOSPITAL_SCORE_TABLE = [
+    {'column': 'HOSPITAL_SCORE_LOS', 'source': 'LOS5_FLAG', 'weight': 2},
+    {'column': 'HOSPITAL_SCORE_PROCEDURE', 'source': 'PROCEDURE_FLAG', 'weight': 1},
+    {'column': 'HOSPITAL_SCORE_PRIOR_YEAR_ADMISSIONS', 'source': 'PRIOR_YEAR_ADMISSIONS_COUNT', 'right': True,
+     'edges': [-np.inf, 2, 5, np.inf], 'points': [0, 2, 5]},
+    {'column': 'HOSPITAL_SCORE_NONELECTIVE_ADMISSION', 'source': 'NONELECTIVE_ADMISSION_FLAG', 'weight': 1},
+    {'column': 'HOSPITAL_SCORE_ONCOLOGY_SERVICE', 'source': 'ONCOLOGY_SERVICE_FLAG', 'weight': 2},
+    {'column': 'HOSPITAL_SCORE_HEMOGLOBIN', 'source': 'HEMOGLOBIN_LEVEL_LAST_12_FLAG', 'weight': 1},
+    {'column': 'HOSPITAL_SCORE_SODIUM', 'source': 'SODIUM_LEVEL_LAST_135_FLAG', 'weight': 1},
+]
+
+# Cohort thresholds of POST_VANDERNILT, computed once over the whole cohort by compute_cohort_thresholds. Each spec
+# names the flag column, the 'source' column and the percentile of the source taken as the threshold of the flag.
+# The thresholds can be saved from a training cohort and given again when new patients are scored.
+COHORT_THRESHOLDS = [
+    {'column': 'CREATININE_75DIFF_FLAG', 'source': 'CREATININE_LEVEL_DIFF', 'percentile': 75},
+    {'column': 'HEMOGLOBIN_75DIFF_FLAG', 'source': 'HEMOGLOBIN_LEVEL_DIFF', 'percentile': 75},
+    {'column': 'BNP_LEVEL_75DIFF_FLAG', 'source': 'BNP_LEVEL_DIFF', 'percentile': 75},
+]
+
+# Product terms computed by compute_terms. A term is the product of its factor columns, a column repeated d times
+# is raised to the power d. POLYNOMIAL_TERMS raises each base column to the POLYNOMIAL_DEGREES, named with the prefix
+# of the degree and the base name.
+POLYNOMIAL_BASES = [
+    ('CREATININE_MAX', 'CREATININE_LEVEL_MAX'),
+    ('HEMOGLOBIN_MAX', 'HEMOGLOBIN_LEVEL_MAX'),
+    ('LOS_NEW', 'LOS'),
+    ('HOSPITAL_SCORE', 'HOSPITAL_SCORE'),
+    ('GRACE_SCORE', 'GRACE_SCORE'),
+    ('LACE_SCORE', 'LACE_SCORE'),
+    ('AKI_DURATION', 'AKI_DURATION'),
+]
+POLYNOMIAL_DEGREES = [(2, 'QUAD'), (3, 'CUBIC')]
+POLYNOMIAL_TERM_SPECS = [('%s_%s' % (prefix, name), [column] * degree)
+                         for name, column in POLYNOMIAL_BASES for degree, prefix in POLYNOMIAL_DEGREES]
+# pairwise interactions of INTERACTION_TERMS. Most factors are flags, so the terms are kept sparse.
+INTERACTION_TERM_SPECS = [
+    ('i_AKI_BNP_CAT', ['AKI_FLAG', 'BNP_FIRST_CAT']),
+    ('i_AKI_CARDIAC_A', ['AKI_FLAG', 'CARDIAC_ARREST_FLAG']),
+    ('i_AKI_Sodium', ['AKI_FLAG', 'SODIUM_LEVEL_AVG_136_FLAG']),
+    ('i_AKI_CK_MAX', ['AKI_FLAG', 'CK_LEVEL_MAX']),
+    ('i_AKI_CKD', ['AKI_FLAG', 'COMORBID_CKD_FLAG']),
+    ('i_AKI_DEMENTIA', ['AKI_FLAG', 'COMORBID_DEMENTIA_FLAG']),
+    ('i_AKI_STROKE', ['AKI_FLAG', 'COMORBID_STROKE_FLAG']),
+    ('i_AKI_CUB_GRACE', ['AKI_FLAG', 'CUBIC_GRACE_SCORE']),
+    ('i_AKI_CUB_HEMOG', ['AKI_FLAG', 'CUBIC_HEMOGLOBIN_MAX']),
+    ('i_AKI_MED_ACE', ['AKI_FLAG', 'DISCH_MED_ACE_ARB_FLAG']),
+    ('i_AKI_MED_ANTIDEP', ['AKI_FLAG', 'DISCH_MED_ANTIDEP_FLAG']),
+    ('i_AKI_PRIOR_ED_COUNT', ['AKI_FLAG', 'ED_VISIT_PRIOR_30_DAYS_COUNT']),
+    ('i_AKI_PVD', ['AKI_FLAG', 'HISTORY_PVD_FLAG']),
+    ('i_AKI_HOSPITAL', ['AKI_FLAG', 'HOSPITAL_SCORE']),
+    ('I_AKI_INHOSP_ISCHEMI', ['AKI_FLAG', 'IN_HOSPITAL_ISCHEMIA_FLAG']),
+    ('i_AKI_LACE', ['AKI_FLAG', 'LACE_SCORE']),
+    ('i_AKI_NONELECTIVE', ['AKI_FLAG', 'NONELECTIVE_ADMISSION_FLAG']),
+    ('i_AKI_ONCOLOGY', ['AKI_FLAG', 'ONCOLOGY_FLAG']),
+    ('i_AKI_DIS_METAB_90D', ['AKI_FLAG', 'PRIOR_DIS_MAGN_METAB_90D']),
+    ('i_AKI_PRIOR_YR_COUNT', ['AKI_FLAG', 'PRIOR_YEAR_ADMISSIONS_COUNT']),
+    ('i_AKI_QUAD_GRACE', ['AKI_FLAG', 'QUAD_GRACE_SCORE']),
+    ('i_AKI_REVASC', ['AKI_FLAG', 'REVASCULARIZATION_FLAG']),
+    ('i_AKI_TRANSFER_PT', ['AKI_FLAG', 'TRANSFER_PATIENT_FLAG']),
+    ('i_AKI_VESSE_COUNT', ['AKI_FLAG', 'VESSELS_COUNT']),
+    ('i_BNP_CARDIAC_A', ['BNP_FIRST_CAT', 'CARDIAC_ARREST_FLAG']),
+    ('i_BNP_SODIUM', ['BNP_FIRST_CAT', 'SODIUM_LEVEL_AVG_136_FLAG']),
+    ('i_BNP_CK_MAX', ['BNP_FIRST_CAT', 'CK_LEVEL_MAX']),
+    ('i_BNP_CKD', ['BNP_FIRST_CAT', 'COMORBID_CKD_FLAG']),
+    ('i_BNP_DEMENTIA', ['BNP_FIRST_CAT', 'COMORBID_DEMENTIA_FLAG']),
+    ('i_BNP_STROKE', ['BNP_FIRST_CAT', 'COMORBID_STROKE_FLAG']),
+    ('i_BNP_CUB_GRACE', ['BNP_FIRST_CAT', 'CUBIC_GRACE_SCORE']),
+    ('i_BNP_CUB_HEMOG', ['BNP_FIRST_CAT', 'CUBIC_HEMOGLOBIN_MAX']),
+    ('i_BNP_MED_ACE', ['BNP_FIRST_CAT', 'DISCH_MED_ACE_ARB_FLAG']),
+    ('i_BNP_MED_ANTIDEP', ['BNP_FIRST_CAT', 'DISCH_MED_ANTIDEP_FLAG']),
+    ('i_BNP_PRIOR_ED_COUNT', ['BNP_FIRST_CAT', 'ED_VISIT_PRIOR_30_DAYS_COUNT']),
+    ('i_BNP_PVD', ['BNP_FIRST_CAT', 'HISTORY_PVD_FLAG']),
+    ('i_BNP_HOSPITAL', ['BNP_FIRST_CAT', 'HOSPITAL_SCORE']),
+    ('i_BNP_INHOSP_ISCHEMIA', ['BNP_FIRST_CAT', 'IN_HOSPITAL_ISCHEMIA_FLAG']),
+    ('i_BNP_LACE', ['BNP_FIRST_CAT', 'LACE_SCORE']),
+    ('i_BNP_NONELECTIVE', ['BNP_FIRST_CAT', 'NONELECTIVE_ADMISSION_FLAG']),
+    ('i_BNP_ONCOLOGY', ['BNP_FIRST_CAT', 'ONCOLOGY_FLAG']),
+    ('i_BNP_DIS_METAB_90D', ['BNP_FIRST_CAT', 'PRIOR_DIS_MAGN_METAB_90D']),
+    ('i_BNP_PRIOR_YR_COUNT', ['BNP_FIRST_CAT', 'PRIOR_YEAR_ADMISSIONS_COUNT']),
+    ('i_BNP_QUAD_GRACE', ['BNP_FIRST_CAT', 'QUAD_GRACE_SCORE']),
+    ('i_BNP_REVASCULARIZATION', ['BNP_FIRST_CAT', 'REVASCULARIZATION_FLAG']),
+    ('i_BNP_TRANSFER_PT', ['BNP_FIRST_CAT', 'TRANSFER_PATIENT_FLAG']),
+    ('i_BNP_VESSEL_COUNT', ['BNP_FIRST_CAT', 'VESSELS_COUNT']),
+    ('i_BNP_AKI_DUR', ['BNP_FIRST_CAT', 'AKI_DURATION']),
+    ('i_CARDIAC_A_Sodium', ['CARDIAC_ARREST_FLAG', 'SODIUM_LEVEL_AVG_136_FLAG']),
+    ('i_CARDIAC_A_CK_MAX', ['CARDIAC_ARREST_FLAG', 'CK_LEVEL_MAX']),
+    ('i_CARDIAC_A_CKD', ['CARDIAC_ARREST_FLAG', 'COMORBID_CKD_FLAG']),
+    ('i_CARDIAC_A_DEMENTIA', ['CARDIAC_ARREST_FLAG', 'COMORBID_DEMENTIA_FLAG']),
+    ('i_CARDIAC_A_STROKE', ['CARDIAC_ARREST_FLAG', 'COMORBID_STROKE_FLAG']),
+    ('i_CARDIAC_A_CUB_GRACE', ['CARDIAC_ARREST_FLAG', 'CUBIC_GRACE_SCORE']),
+    ('i_CARDIAC_A_CUB_HEMOG', ['CARDIAC_ARREST_FLAG', 'CUBIC_HEMOGLOBIN_MAX']),
+    ('i_CARDIAC_A_MED_ACE', ['CARDIAC_ARREST_FLAG', 'DISCH_MED_ACE_ARB_FLAG']),
+    ('i_CARDIAC_A_MED_ANTIDEP', ['CARDIAC_ARREST_FLAG', 'DISCH_MED_ANTIDEP_FLAG']),
+    ('i_CARDIAC_A_PRIOR_ED_COUNT', ['CARDIAC_ARREST_FLAG', 'ED_VISIT_PRIOR_30_DAYS_COUNT']),
+    ('i_CARDIAC_A_PVD', ['CARDIAC_ARREST_FLAG', 'HISTORY_PVD_FLAG']),
+    ('i_CARDIAC_A_HOSPITAL', ['CARDIAC_ARREST_FLAG', 'HOSPITAL_SCORE']),
+    ('i_CARDIAC_A_INHOSP_ISCHEMIA', ['CARDIAC_ARREST_FLAG', 'IN_HOSPITAL_ISCHEMIA_FLAG']),
+    ('i_CARDIAC_A_LACE', ['CARDIAC_ARREST_FLAG', 'LACE_SCORE']),
+    ('i_CARDIAC_A_NONELECTIVE', ['CARDIAC_ARREST_FLAG', 'NONELECTIVE_ADMISSION_FLAG']),
+    ('i_CARDIAC_A_ONCOLOGY', ['CARDIAC_ARREST_FLAG', 'ONCOLOGY_FLAG']),
+    ('i_CARDIAC_A_DIS_METAB_90D', ['CARDIAC_ARREST_FLAG', 'PRIOR_DIS_MAGN_METAB_90D']),
+    ('i_CARDIAC_A_PRIOR_YR_COUNT', ['CARDIAC_ARREST_FLAG', 'PRIOR_YEAR_ADMISSIONS_COUNT']),
+    ('i_CARDIAC_A_QUAD_GRACE', ['CARDIAC_ARREST_FLAG', 'QUAD_GRACE_SCORE']),
+    ('i_CARDIAC_A_REVASCULARIZATION', ['CARDIAC_ARREST_FLAG', 'REVASCULARIZATION_FLAG']),
+    ('i_CARDIAC_A_TRANSFER_PT', ['CARDIAC_ARREST_FLAG', 'TRANSFER_PATIENT_FLAG']),
+    ('i_CARDIAC_A_VESSEL_C', ['CARDIAC_ARREST_FLAG', 'VESSELS_COUNT']),
+    ('i_CARDIAC_A_AKI_DUR', ['CARDIAC_ARREST_FLAG', 'AKI_DURATION']),
+    ('i_SODIUM_CK_MAX', ['SODIUM_LEVEL_AVG_136_FLAG', 'CK_LEVEL_MAX']),
+]
+
+# The per-patient sections, in the order their columns appear in the target table. Every section is called with
+# target_df and its 'inputs', source tables by name or 'index_events', reads the 'requires' columns of target_df and
+# returns the 'produces' columns. run_sections runs a section after the earlier sections producing a column it
+# requires or produces, and the earlier sections requiring a column it produces. INTERACTION_TERMS is not listed,
+# since some of its factors are not produced.
+SECTIONS = [
+    {'section': 'DEMOGRAPHICS', 'inputs': ['demographics', 'diagnoses'],
+     'requires': [],
+     'produces': ['MRN', 'GENDER', 'RACE', 'ETHNICITY', 'SSN', 'ZIPCODE', 'FIRST_NAME', 'LAST_NAME', 'MIDDLE_NAME',
+                  'DOB', 'PRIM_DIAG', 'ADMIT_DATE', 'DISCHARGE_DATE', 'INDEX_ADMIT_DATE', 'INDEX_DISCHARGE_DATE',
+                  'VISIT_OCCURRENCE_ID']},
+    {'section': 'PRIOR_MONTH_DIAGNOSIS', 'inputs': ['diagnoses', 'index_events'],
+     'requires': [],
+     'produces': ['PRIOR_SEPSIS_30D', 'PRIOR_HYPERKALEMIA_30D', 'PRIOR_HYPOKALEMIA_30D', 'PRIOR_HYPERVOLEMIA_30D',
+                  'PRIOR_AKF_30D', 'PRIOR_UTI_30D', 'PRIOR_LONGTERM_ANTICOAGULANTS_30D', 'PRIOR_SEPSIS_90D',
+                  'PRIOR_DIS_MAGN_METAB_90D', 'PRIOR_HYPOKALEMIA_90D', 'PRIOR_LVEF_90D', 'PRIOR_AKF_90D',
+                  'PRIOR_CARDIAC_DEVICE_90D']},
+    {'section': 'HOSPITAL_SCORE', 'inputs': ['procedures', 'diagnoses', 'visits_w_prov_type', 'labs', 'index_events'],
+     'requires': [],
+     'produces': ['LOS', 'LOS5_FLAG', 'PROCEDURE_FLAG', 'PRIOR_YEAR_ADMISSIONS_COUNT', 'NONELECTIVE_ADMISSION_FLAG',
+                  'ONCOLOGY_SERVICE_FLAG', 'HEMOGLOBIN_LEVEL_LAST_12_FLAG', 'SODIUM_LEVEL_LAST_135_FLAG',
+                  'HOSPITAL_SCORE', 'VISIT_NO']},
+    {'section': 'LABORATORIES', 'inputs': ['labs', 'index_events'],
+     'requires': [],
+     'produces': ['SODIUM_LEVEL_AVG', 'SODIUM_LEVEL_MIN', 'SODIUM_LEVEL_MAX', 'SODIUM_LEVEL_FIRST',
+                  'SODIUM_LEVEL_LAST', 'SODIUM_LEVEL_AVG_136_FLAG', 'CALCIUM_LEVEL_AVG', 'CALCIUM_LEVEL_MIN',
+                  'CALCIUM_LEVEL_MAX', 'CALCIUM_LEVEL_FIRST', 'CALCIUM_LEVEL_LAST', 'CALCIUM_LEVEL_AVG_86_FLAG',
+                  'CREATININE_LEVEL_AVG', 'CREATININE_LEVEL_MIN', 'CREATININE_LEVEL_MAX', 'CREATININE_LEVEL_FIRST',
+                  'CREATININE_LEVEL_LAST', 'HEMOGLOBIN_LEVEL_AVG', 'HEMOGLOBIN_LEVEL_MIN', 'HEMOGLOBIN_LEVEL_MAX',
+                  'HEMOGLOBIN_LEVEL_FIRST', 'HEMOGLOBIN_LEVEL_LAST', 'CKI_LEVEL_AVG', 'CKI_LEVEL_MIN',
+                  'CKI_LEVEL_MAX', 'CKI_LEVEL_FIRST', 'CKI_LEVEL_LAST', 'CKT_LEVEL_AVG', 'CKT_LEVEL_MIN',
+                  'CKT_LEVEL_MAX', 'CKT_LEVEL_FIRST', 'CKT_LEVEL_LAST', 'BNP_LEVEL_AVG', 'BNP_LEVEL_MIN',
+                  'BNP_LEVEL_MAX', 'BNP_LEVEL_FIRST', 'BNP_LEVEL_LAST']},
+    {'section': 'PRESENTATION_DISEASE', 'inputs': ['diagnoses', 'visits_w_prov_type', 'med_orders', 'procedures', 'index_events'],
+     'requires': [],
+     'produces': ['TRANSFER_PATIENT_FLAG', 'CHEST_PAIN_FLAG', 'CARDIAC_ARREST_FLAG', 'REVASCULARIZATION_FLAG',
+                  'VESSELS_1_FLAG', 'VESSELS_2_FLAG', 'VESSELS_3_FLAG', 'VESSELS_4_FLAG', 'VESSELS_COUNT',
+                  'CLOPIDOGREL_FLAG', 'AMI_LOCATION']},
+    {'section': 'ADMINISTRATIVE_DATA', 'inputs': ['visits_w_prov_type', 'index_events'],
+     'requires': ['LOS'],
+     'produces': ['INDEX_LOS', 'ED_VISIT_PRIOR_180_DAYS_COUNT', 'ADMISSION_PRIOR_30_DAYS_COUNT',
+                  'ED_VISIT_PRIOR_30_DAYS_COUNT', 'ED_VISIT_PRIOR_30_DAYS_TIME_IN_ED',
+                  'ED_VISIT_PRIOR_30_DAYS_MINUTES_IN_ED', 'ED_TO_IP_VISIT_PRIOR_30_DAYS_COUNT']},
+    {'section': 'DISCHARGE_INFORMATION', 'inputs': ['diagnoses', 'visits_w_prov_type', 'med_orders', 'index_events'],
+     'requires': [],
+     'produces': ['UNSTABLE_ANGINA_FLAG', 'STEMI_FLAG', 'NSTEMI_FLAG', 'TRANSFER_AT_DISCHARGE_FLAG',
+                  'DISCH_MED_BB_FLAG', 'DISCH_MED_ANTIDEP_FLAG', 'DISCH_MED_ACE_ARB_FLAG', 'DISCH_MED_ASPIRIN_FLAG',
+                  'DISCH_MED_BB_METHOD', 'DISCH_MED_ANTIDEP_METHOD', 'DISCH_MED_ACE_ARB_METHOD',
+                  'DISCH_MED_ASPIRIN_METHOD']},
+    {'section': 'DEMOGRAPHICS_ADDITIONS', 'inputs': ['visits_w_prov_type', 'diagnoses'],
+     'requires': ['ADMIT_DATE', 'DOB'],
+     'produces': ['AGE_AT_ADMIT', 'INDEX_ADMISSION_FLAG', 'DISCHARGE_LOCATION', 'TRANSFER_AT_DISCHARGE_FLAG',
+                  'REHAB_FLAG']},
+    {'section': 'PATIENT_HISTORY', 'inputs': ['diagnoses', 'visits_w_prov_type', 'index_events'],
+     'requires': [],
+     'produces': ['HISTORY_CHEST_PAIN_FLAG', 'HISTORY_AMI_FLAG', 'HISTORY_CABG_FLAG', 'HISTORY_PCI_FLAG',
+                  'HISTORY_PVD_FLAG', 'HISTORY_ANGINA_FLAG', 'HISTORY_UNSTABLE_ANGINA_FLAG',
+                  'HISTORY_HYPERTENTION_FLAG', 'HISTORY_DEPRESSION_FLAG', 'FAMILY_DEPRESSION_FLAG',
+                  'MAJOR_DEPRESSION_COUNT', 'HISTORY_HYPERTENSION_FLAG']},
+    {'section': 'IN_HOSPITAL_OUTCOMES', 'inputs': ['diagnoses', 'procedures', 'index_events'],
+     'requires': [],
+     'produces': ['ECHOCARDIOGRAPHY_FLAG', 'IN_HOSPITAL_HF_FLAG', 'IN_HOSPITAL_ISCHEMIA_FLAG',
+                  'CARDIAC_PROCEDURE_FLAG']},
+    {'section': 'COMORBIDITIES', 'inputs': ['diagnoses', 'index_events'],
+     'requires': [],
+     'produces': ['AGE_80_FLAG', 'COMORBID_ARRHYTHMIA_FLAG', 'COMORBID_ANEMIA_FLAG', 'COMORBID_HYPERTENSION_FLAG',
+                  'COMORBID_COPD_FLAG', 'COMORBID_CKD_FLAG', 'COMORBID_STROKE_FLAG', 'COMORBID_TOBACCO_USE_FLAG',
+                  'COMORBID_DEPRESSION_FLAG', 'COMORBID_HYPERCHOLESTEROLEMIA_FLAG', 'COMORBID_CAD_FLAG',
+                  'PRIOR_REVASCULARIZATION_FLAG', 'COMORBID_DIABETES_CC_FLAG', 'COMORBID_DIABETES_FLAG',
+                  'COMORBID_CHF_FLAG', 'COMORBID_MI_FLAG', 'COMORBID_PERIPHERAL_VASCULAR_DISEASE_FLAG',
+                  'COMORBID_CEREBROVASCULAR_DISEASE_FLAG', 'COMORBID_DEMENTIA_FLAG',
+                  'COMORBID_CHRONIC_PULMONARY_DISEASE_FLAG', 'COMORBID_RHEUMATOLOGIC_DISEASE_FLAG',
+                  'COMORBID_PEPTIC_ULCER_DISEASE_FLAG', 'COMORBID_MILD_LIVER_DISEASE_FLAG',
+                  'COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG', 'COMORBID_RENAL_DISEASE_FLAG',
+                  'COMORBID_MODERATE_OR_SEVERE_LIVER_DISEASE_FLAG', 'COMORBID_AIDS_FLAG',
+                  'COMORBID_DIABETES_CC_FLAG_SCORE', 'COMORBID_DIABETES_FLAG_SCORE', 'COMORBID_CHF_FLAG_SCORE',
+                  'COMORBID_MI_FLAG_SCORE', 'COMORBID_PERIPHERAL_VASCULAR_DISEASE_FLAG_SCORE',
+                  'COMORBID_CEREBROVASCULAR_DISEASE_FLAG_SCORE', 'COMORBID_DEMENTIA_FLAG_SCORE',
+                  'COMORBID_CHRONIC_PULMONARY_DISEASE_FLAG_SCORE', 'COMORBID_RHEUMATOLOGIC_DISEASE_FLAG_SCORE',
+                  'COMORBID_PEPTIC_ULCER_DISEASE_FLAG_SCORE', 'COMORBID_MILD_LIVER_DISEASE_FLAG_SCORE',
+                  'COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG_SCORE', 'COMORBID_RENAL_DISEASE_FLAG_SCORE',
+                  'COMORBID_MODERATE_OR_SEVERE_LIVER_DISEASE_FLAG_SCORE', 'COMORBID_AIDS_FLAG_SCORE',
+                  'CHARLSON_DEYO_SCORE']},
+    {'section': 'LACE_SCORE', 'inputs': [],
+     'requires': [component['source'] for component in LACE_SCORE_TABLE],
+     'produces': ['LACE_ACUITY_SCORE', 'LACE_LOS_SCORE', 'LACE_CHARLSON_SCORE', 'LACE_ED_SCORE', 'LACE_SCORE']},
+    {'section': 'ENRICHD_SCORE', 'inputs': ['diagnoses', 'index_events'],
+     'requires': [],
+     'produces': ['KILLIP_CLASS', 'LVEF_FLAG', 'POST_MI_CABG_FLAG', 'CHF_FLAG', 'HISTORY_STROKE_FLAG']},
+    {'section': 'GRACE_SCORE', 'inputs': ['diagnoses', 'labs', 'index_events'],
+     'requires': ['AGE_AT_ADMIT', 'CREATININE_LEVEL_FIRST', 'KILLIP_CLASS', 'CARDIAC_ARREST_FLAG', 'STEMI_FLAG'],
+     'produces': ['IN_HOSPITAL_PCI_FLAG', 'SYSTOLIC_BP_AVG', 'HEART_RATE_AVG', 'ST_SEGMENT_AVG', 'TROPONIN_AVG',
+                  'CARDIAC_MARKER_ELEVATION_FLAG', 'GRACE_SCORE_AGE', 'GRACE_SCORE_HEART_RATE',
+                  'GRACE_SCORE_SYSTOLIC_BP', 'GRACE_SCORE_CREATININE_LEVEL_FIRST', 'GRACE_SCORE_KILLIP_CLASS',
+                  'GRACE_SCORE_CARDIAC_MARKER_ELEVATION', 'GRACE_SCORE_CARDIAC_ARREST', 'GRACE_SCORE_STEMI',
+                  'AKI_STAGE_VARIABLE', 'AKI_FLAG', 'AKI_STAGE_MAX', 'AKI_STAGE_MIN', 'AKI_RECOVERED_FLAG',
+                  'AKI_UNRESOLVED_FLAG', 'AKI_DURATION', 'GRACE_SCORE']},
+    {'section': 'POLYNOMIAL_TERMS', 'inputs': [],
+     'requires': [column for name, column in POLYNOMIAL_BASES],
+     'produces': [name for name, factors in POLYNOMIAL_TERM_SPECS]},
+    {'section': 'DATA_MANAGEMENT', 'inputs': ['visits_w_prov_type', 'index_events'],
+     'requires': ['LOS', 'LOS5_FLAG', 'PRIOR_YEAR_ADMISSIONS_COUNT'],
+     'produces': ['GAP', 'LOS_NEW', 'NEW_LOS5_FLAG', 'PREVIOUS_30_DAY', 'PREVIOUS_30D_SUM', 'MORE_PREVIOUS_YR',
+                  'MORE_PREVIOUS_YR_SUM', 'READMISSIONS', 'READMISSIONS_SUM', 'FLG_30D', 'FLG_30D_SUM',
+                  'OUTCOME_30DRED', 'NEW_LOS5_FLAG_SUM', 'PREVIOUS_YR', 'PREVIOUS_YR_SUM', 'VISIT_NO']},
+]
+# The sections computed over the whole cohort after the per-patient sections, declared the same way.
+COHORT_SECTIONS = [
+    {'section': 'POST_VANDERNILT', 'inputs': [],
+     'requires': ['CREATININE_LEVEL_MAX', 'CREATININE_LEVEL_MIN', 'HEMOGLOBIN_LEVEL_MAX', 'HEMOGLOBIN_LEVEL_MIN',
+                  'BNP_LEVEL_MAX', 'BNP_LEVEL_MIN'],
+     'produces': ['CREATININE_LEVEL_DIFF', 'HEMOGLOBIN_LEVEL_DIFF', 'BNP_LEVEL_DIFF']
+                 + [spec['column'] for spec in COHORT_THRESHOLDS]},
+]
+
+# lab ITEM spellings of each analyte, in the order their results are listed when they share a date
+LAB_ITEM_ALIASES = {
+    'SODIUM': ['Sodium, Serum or Plasma'],
+    'CALCIUM': ['CALCIUM'],
+    'CREATININE': ['CREATININE'],
+    'HEMOGLOBIN': ['Hemoglobin'],
+    'CKI': ['Creatine Kinase, Isoenzyme MB'],
+    'CKT': ['Creatine Kinase, Total, Ser/Pla'],
+    'BNP': ['proBrain Natriuretic Peptide, NT', 'PROBRAIN NATRIURETIC PEPTIDE_NT'],
+    'TROPONIN': ['Troponin I', 'Troponin-I'],
+}
+# analytes summarized by LABORATORIES into <analyte>_LEVEL_AVG, _MIN, _MAX, _FIRST and _LAST
+LABORATORY_ANALYTES = ['SODIUM', 'CALCIUM', 'CREATININE', 'HEMOGLOBIN', 'CKI', 'CKT', 'BNP']
+# statistics computed for every analyte
+LAB_STATISTICS = ['AVG', 'MIN', 'MAX', 'FIRST', 'LAST']
+
+# Compact dtype of every produced column, a section's columns are cast to these by get_section_df. A column whose
+# values do not fit its dtype keeps the one it was computed with, e.g. a flag that is 'NA' or missing for some
+# patients, so what is written to target.csv does not change. Columns not listed, the demographics, ids, dates and
+# the 'NA' placeholders, keep theirs too.
+PRODUCED_COLUMNS = [column for section in SECTIONS + COHORT_SECTIONS for column in section['produces']]
+COLUMN_DTYPES = {}
+# 0/1 flags
+COLUMN_DTYPES.update({column: 'int8' for column in PRODUCED_COLUMNS
+                      if column.endswith(('_FLAG', '_FLAG_SCORE', '_METHOD', '_30D', '_90D'))
+                      or column in ['AKI_STAGE_VARIABLE', 'PREVIOUS_30_DAY', 'MORE_PREVIOUS_YR', 'READMISSIONS',
+                                    'FLG_30D', 'OUTCOME_30DRED']})
+# counts
+COLUMN_DTYPES.update({column: 'uint16' for column in PRODUCED_COLUMNS if column.endswith(('_COUNT', '_SUM'))})
+# lab values other columns are computed from, the differences of POST_VANDERNILT and the lab powers of
+# POLYNOMIAL_TERMS, and the differences themselves stay float64, so these are the ones of the values as read
+FLOAT64_LAB_COLUMNS = ['CREATININE_LEVEL_MAX', 'CREATININE_LEVEL_MIN', 'HEMOGLOBIN_LEVEL_MAX', 'HEMOGLOBIN_LEVEL_MIN',
+                       'BNP_LEVEL_MAX', 'BNP_LEVEL_MIN',
+                       'CREATININE_LEVEL_DIFF', 'HEMOGLOBIN_LEVEL_DIFF', 'BNP_LEVEL_DIFF']
+# lab values, and the flags and sums that were always written as floats
+COLUMN_DTYPES.update({column: 'float32' for column in PRODUCED_COLUMNS
+                      if '_LEVEL_' in column and not column.endswith('_FLAG') and column not in FLOAT64_LAB_COLUMNS
+                      or column.endswith('75DIFF_FLAG')
+                      or column in ['TROPONIN_AVG', 'AKI_STAGE_MAX', 'AKI_STAGE_MIN', 'HISTORY_HYPERTENSION_FLAG',
+                                    'PREVIOUS_YR', 'PREVIOUS_YR_SUM']})
+# days and score points, also the points given to a lab value
+COLUMN_DTYPES.update({column: 'int16' for column in PRODUCED_COLUMNS
+                      if column.startswith(('GRACE_SCORE', 'LACE_'))
+                      or column in ['LOS', 'INDEX_LOS', 'LOS_NEW', 'GAP', 'AKI_DURATION', 'HOSPITAL_SCORE',
+                                    'CHARLSON_DEYO_SCORE']})
+# powers of the integer columns, the powers of lab values stay float64
+COLUMN_DTYPES.update({name: 'int32' for name, factors in POLYNOMIAL_TERM_SPECS
+                      if COLUMN_DTYPES.get(factors[0], '').startswith('int')})
+# text with a few distinct values
+COLUMN_DTYPES.update({column: 'category' for column in ['KILLIP_CLASS', 'AMI_LOCATION', 'DISCHARGE_LOCATION']})
+
+# date columns of the source tables that are converted to day numbers at load time
+DATE_COLUMNS = ['ADM_DATE', 'DSCH_DATE', 'PROC_DT', 'OBS_DTM', 'DOB', 'AMI_ADM_DATE', 'AMI_DSCH_DATE']
+# date columns that also carry a time of day and get a minute number
+DATETIME_COLUMNS = ['OBS_DTM']
+# day or minute number of a date that cannot be parsed
+MISSING_DATE = np.iinfo(np.int32).min
+# key columns encode_keys turns into categories, with one vocabulary per key shared by all the source tables
+KEY_COLUMNS = ['PAT_ID', 'VISIT_NO', 'CODE', 'ITEM']
+
+# row-position indices of the source tables, keyed by (id(table), key column), and the columns of the tables in
+# the row order of an index, keyed by (id(table), key column, column)
+_KEY_INDEX = {}
+_KEY_COLUMNS = {}
+# key columns that are looked up too rarely to index the whole table by, their recent lookups are remembered instead
+LOOKUP_CACHE_KEYS = ['DSCH_DATE', 'CODE_DESC']
+LOOKUP_CACHE_SIZE = 4096
+_LOOKUP_CACHE = collections.OrderedDict()
+# the sections can run on threads, which share the cache
+_LOOKUP_CACHE_LOCK = threading.Lock()
+# compiled matchers of the CODE_CATEGORIES, and the category bitmask of every code classified so far
+_CODE_MATCHERS = {}
+_CODE_BITS = {}
+# compiled matchers of the MEDICATION_CATEGORIES, and the class bitmask of every medication name classified so far
+_MEDICATION_MATCHERS = {}
+_MEDICATION_BITS = {}
+
+# the records of the profiled stages of the run, see profile_stage
+_PROFILE = {'enabled': False, 'directory': None, 'records': [], 'dumps': 0}
+_PROFILE_LOCK = threading.Lock()
+
+def start_profiling(directory=None):
+    '''
+    turn on the profiling of the stages of the run, see profile_stage
+    :param directory: directory to write a cProfile dump of every stage to, no dumps when None
+    :return:
+    '''
+    _PROFILE['enabled'] = True
+    _PROFILE['directory'] = directory
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+def get_peak_rss():
+    '''
+    give the peak resident memory of the process so far in kilobytes, None where it is not known
+    :return:
+    '''
+    if resource is None:
+        return None
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss // 1024 if os.uname().sysname == 'Darwin' else peak_rss
+
+@contextlib.contextmanager
+def profile_stage(stage, rows=0, patients=0):
+    '''
+    Record the wall time, CPU time and peak memory growth of a stage of the run when profiling is on. The record is
+    yielded, so a stage that only knows its rows at the end can set record['df'] to the table it read, whose rows
+    and patients are then counted. The CPU time is the one of the running thread, while the peak memory is the
+    one of the process, so it also grows with the stages running on other threads.
+    :param stage: name of the stage, like the section name
+    :param rows: number of source rows the stage scans
+    :param patients: number of patients the stage processes
+    :return: generator
+    '''
+    record = {'stage': stage, 'process': os.getpid(), 'rows': rows, 'patients': patients}
+    if not _PROFILE['enabled']:
+        yield record
+        return
+    profiler = cProfile.Profile() if _PROFILE['directory'] else None
+    peak_rss = get_peak_rss()
+    wall_time = time.perf_counter()
+    cpu_time = time.thread_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        record['wall_seconds'] = time.perf_counter() - wall_time
+        record['cpu_seconds'] = time.thread_time() - cpu_time
+        record['peak_rss_delta_kb'] = None if peak_rss is None else get_peak_rss() - peak_rss
+        df = record.pop('df', None)
+        if df is not None:
+            record['rows'] = len(df)
+            record['patients'] = df['PAT_ID'].nunique() if 'PAT_ID' in df.columns else 0
+        with _PROFILE_LOCK:
+            _PROFILE['records'].append(record)
+            _PROFILE['dumps'] += 1
+            dump = _PROFILE['dumps']
+        if profiler is not None:
+            profiler.dump_stats(os.path.join(_PROFILE['directory'], '%s.%d.%d.prof' % (stage, os.getpid(), dump)))
+
+def call_profiled(settings, function, *arguments):
+    '''
+    call a function in a worker process with the profiling settings of the parent process, and return the
+    records of its profiled stages along with its result
+    :param settings: (enabled, directory) of the parent process
+    :param function:
+    :param arguments:
+    :return: (result, records)
+    '''
+    _PROFILE['enabled'], _PROFILE['directory'] = settings
+    # a forked worker starts with a copy of the records of the parent process
+    _PROFILE['records'] = []
+    result = function(*arguments)
+    return result, _PROFILE['records']
+
+def write_profile_report(path):
+    '''
+    Write the profiled stages of the run, summed per stage in the order they first ran. A stage runs more than once
+    with --workers and --blocks, so the report has the number of calls and the largest peak memory growth of a call.
+    :param path: a .json file, or a csv file for any other extension
+    :return:
+    '''
+    stages = collections.OrderedDict()
+    for record in _PROFILE['records']:
+        stage = stages.setdefault(record['stage'], {'stage': record['stage'], 'calls': 0, 'wall_seconds': 0.0,
+                                                    'cpu_seconds': 0.0, 'peak_rss_delta_kb': None,
+                                                    'rows': 0, 'patients': 0})
+        stage['calls'] += 1
+        for field in ['wall_seconds', 'cpu_seconds', 'rows', 'patients']:
+            stage[field] += record[field]
+        if record['peak_rss_delta_kb'] is not None:
+            stage['peak_rss_delta_kb'] = max(stage['peak_rss_delta_kb'] or 0, record['peak_rss_delta_kb'])
+    report = list(stages.values())
+    if path.endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump({'peak_rss_kb': get_peak_rss(), 'stages': report}, f, indent=1)
+    else:
+        pd.DataFrame(report, columns=['stage', 'calls', 'wall_seconds', 'cpu_seconds', 'peak_rss_delta_kb',
+                                      'rows', 'patients']).to_csv(path, index=False)
+
 def get_date_diff(discharge_date, admit_date):
     '''
     give two date string in the format YYYY-MM-DD, return the difference of first - second
@@ -273,6 +908,118 @@ def datecmp(date1, date2):
     date_2 = datetime.date(int(year_2), int(month_2), int(day_2))
     return (date_1 - date_2).days < 0
 
+def parse_dates(values):
+    '''
+    convert date strings in the format MM/DD/YYYY or MM-DD-YYYY, optionally followed by a time of day,
+    to day and minute numbers counted from 1970-01-01. Each distinct string is parsed only once.
+    :param values:
+    :return: (days, minutes) int32 arrays, MISSING_DATE where a string is not a date
+    '''
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    text = pd.Series(uniques, dtype=object).astype(str).str.replace('"', '', regex=False).str.strip()
+    text = text.str.replace('-', '/', regex=False)
+    date_text = text.str.split(n=1).str[0]
+    dates = pd.to_datetime(date_text, format='%m/%d/%Y', errors='coerce')
+    unique_days = dates.values.astype('datetime64[D]').astype(np.int64)
+    unique_days[dates.isna().values] = MISSING_DATE
+
+    # the time of day is optional, dates without a readable time count from midnight
+    times = pd.to_datetime(text, format='%m/%d/%Y %H:%M', errors='coerce')
+    times = times.fillna(pd.to_datetime(text, format='%m/%d/%Y %H:%M:%S', errors='coerce')).fillna(dates)
+    unique_minutes = times.values.astype('datetime64[m]').astype(np.int64)
+    unique_minutes[times.isna().values] = MISSING_DATE
+
+    days = np.full(len(codes), MISSING_DATE, dtype=np.int32)
+    minutes = np.full(len(codes), MISSING_DATE, dtype=np.int32)
+    found = codes >= 0
+    days[found] = unique_days[codes[found]]
+    minutes[found] = unique_minutes[codes[found]]
+    return days, minutes
+
+def add_date_columns(df):
+    '''
+    Add an int32 <column>_DAY column for every date column of df, and a <column>_MINUTE column for
+    date-time columns, so date windows can be computed with integer arithmetic.
+    :param df:
+    :return:
+    '''
+    with profile_stage('add_date_columns') as record:
+        for column in DATE_COLUMNS:
+            if column in df.columns:
+                days, minutes = parse_dates(df[column].values)
+                df[column + '_DAY'] = days
+                if column in DATETIME_COLUMNS:
+                    df[column + '_MINUTE'] = minutes
+        record['df'] = df
+    return df
+
+def encode_keys(tables):
+    '''
+    Dictionary-encode the KEY_COLUMNS of the source tables once they are read. The values of a key in all the tables
+    get one sorted vocabulary, and its columns become categories of it, so the same value has the same integer code
+    in every table and the codes sort like the values. Comparisons, isin, group-bys and sorts of a key then run on
+    its codes, and the categories map the codes back to the values.
+    :param tables: dict of the source tables by name, encoded in place
+    :return: dict of key column to its vocabulary, a sorted array of the values
+    '''
+    vocabularies = {}
+    with profile_stage('encode_keys', sum(len(df) for df in tables.values())) as record:
+        for key in KEY_COLUMNS:
+            columns = [df[key] for df in tables.values() if key in df.columns]
+            if not columns:
+                continue
+            values = [column.cat.categories.values if isinstance(column.dtype, pd.CategoricalDtype)
+                      else pd.unique(column.values) for column in columns]
+            values = np.concatenate(values).astype(object)
+            vocabularies[key] = np.unique(values[pd.notna(values)])
+            dtype = pd.CategoricalDtype(vocabularies[key])
+            for df in tables.values():
+                if key in df.columns:
+                    df[key] = df[key].astype(dtype)
+        if 'PAT_ID' in vocabularies:
+            record['patients'] = len(vocabularies['PAT_ID'])
+    return vocabularies
+
+def get_person_ids(tables, pat_ids):
+    '''
+    give the encoded source tables, return the PERSON_ID column of the target table for pat_ids as categories of
+    the PAT_ID vocabulary of the tables. The sections then look their patients up in the tables and in index_events
+    by the integer codes, and to_csv writes the ids back.
+    :param tables: dict of the source tables by name, encoded by encode_keys
+    :param pat_ids: sorted patient ids
+    :return: pd.Categorical of pat_ids, or pat_ids when the tables are not encoded
+    '''
+    dtype = next(iter(tables.values()))['PAT_ID'].dtype
+    if not isinstance(dtype, pd.CategoricalDtype):
+        return pat_ids
+    return pd.Categorical(pat_ids, dtype=dtype)
+
+def get_day_diff(day_1, day_2):
+    '''
+    give two day numbers, return the difference of first - second, or -1 if either date is missing as get_date_diff does.
+    Works on single days and on arrays.
+    :param day_1:
+    :param day_2:
+    :return:
+    '''
+    day_1 = np.asarray(day_1, dtype=np.int64)
+    day_2 = np.asarray(day_2, dtype=np.int64)
+    diff = np.where((day_1 == MISSING_DATE) | (day_2 == MISSING_DATE), -1, day_1 - day_2)
+    return diff if diff.ndim else int(diff)
+
+def is_day_before(day_1, day_2):
+    '''
+    give two day numbers, return true if the first one is earlier than the second as datecmp does.
+    Works on single days and on arrays.
+    :param day_1:
+    :param day_2:
+    :return:
+    '''
+    day_1 = np.asarray(day_1)
+    day_2 = np.asarray(day_2)
+    before = (day_1 != MISSING_DATE) & (day_2 != MISSING_DATE) & (day_1 < day_2)
+    return before if before.ndim else bool(before)
+
 def remove_quotes(content):
     '''
     Remove quotation marks
@@ -291,8 +1038,8 @@ def get_one_value_by_foreign_key(df, foreign_key, foreign_value, target_key):
     :param target_key:
     :return:
     '''
-    return df[df[foreign_key] == foreign_value][target_key].values[0]\
-        if len(df[df[foreign_key] == foreign_value]) > 0 else ''
+    values = get_values_by_key(df, foreign_key, foreign_value, target_key)
+    return values[0] if len(values) > 0 else ''
 
 def get_values_by_foreign_key(df, foreign_key, foreign_value, target_key):
     '''
@@ -303,8 +1050,8 @@ def get_values_by_foreign_key(df, foreign_key, foreign_value, target_key):
     :param target_key:
     :return:
     '''
-    return list(df[df[foreign_key] == foreign_value][target_key].values)\
-        if len(df[df[foreign_key] == foreign_value]) > 0 else ''
+    values = get_values_by_key(df, foreign_key, foreign_value, target_key)
+    return list(values) if len(values) > 0 else ''
 
 def try_float(s):
     try:
@@ -312,180 +1059,787 @@ def try_float(s):
     except:
         return 0
 
+def to_numbers(values):
+    '''
+    convert an array of text to floats as try_float does, converting each distinct text only once
+    :param values:
+    :return:
+    '''
+    labels, uniques = pd.factorize(values)
+    # labels of -1 are missing values and pick the 0 appended at the end
+    return np.array([try_float(value) for value in uniques] + [0.0], dtype=float)[labels]
+
+def strip_quotes(column):
+    '''
+    remove the quotation marks from the text of a column, only on the rows or categories that have them
+    :param column: pd.Series of text or categories
+    :return: the column without quotation marks
+    '''
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        categories = column.cat.categories
+        if not categories.str.contains('"', regex=False).any():
+            return column
+        # categories that only differ by their quotation marks become one, in sorted order as astype gives
+        stripped, relabel = np.unique(np.asarray(categories.str.replace('"', '', regex=False), dtype=object),
+                                      return_inverse=True)
+        codes = column.cat.codes.values
+        codes = np.where(codes >= 0, relabel[np.maximum(codes, 0)], -1)
+        return pd.Series(pd.Categorical.from_codes(codes, stripped), index=column.index, name=column.name)
+    quoted = column.str.contains('"', regex=False).values
+    if quoted.any():
+        column = column.copy()
+        column[quoted] = column[quoted].str.replace('"', '', regex=False)
+    return column
+
+def load_table(name, engine='c', path=None, columns=None):
+    '''
+    Read a pipe-delimited source table of SOURCE_TABLES. The file is parsed from its path with quotation marks
+    kept as text and only the used columns are kept. The category and numeric columns, and the KEY_COLUMNS
+    encode_keys turns into categories, are parsed into categories, then the quotation marks are removed from the
+    kept columns and the numeric columns are converted once per distinct text.
+    :param name: key of SOURCE_TABLES
+    :param engine: 'c' or 'pyarrow'
+    :param path: file to read instead of the source file, such as a block of it written by partition_table
+    :param columns: columns to keep instead of all the used columns
+    :return:
+    '''
+    table = SOURCE_TABLES[name]
+    path = path or table['path']
+    used_columns = table['columns'] if columns is None else columns
+    with profile_stage('load_table.' + name) as record:
+        with open(path, 'rb') as f:
+            header = f.readline().decode().rstrip('\r\n')
+        if table['strip_quotes']:
+            header = header.replace('"', '')
+        header = header.split('|')
+        positions = [position for position, column in enumerate(header) if column in used_columns]
+        columns = [header[position] for position in positions]
+        categories = set(table['category'] + table['numeric'] + KEY_COLUMNS)
+        dtypes = {column: 'category' if column in categories else object for column in columns}
+
+        if engine == 'pyarrow' and table['strip_quotes']:
+            # the pyarrow parser always knows quotes, the ones left inside the values are removed below
+            df = pd.read_csv(path, sep='|', header=0, names=columns, usecols=positions, dtype=dtypes,
+                             keep_default_na=False, engine='pyarrow')
+            df = df.fillna({column: '' for column, dtype in dtypes.items() if dtype is object})
+        else:
+            df = pd.read_csv(path, sep='|', header=0, names=columns, usecols=positions, dtype=dtypes, quoting=3,
+                             na_filter=False)
+
+        for column in df.columns:
+            if table['strip_quotes']:
+                df[column] = strip_quotes(df[column])
+            if column in table['numeric']:
+                df[column] = to_numbers(df[column].values)
+        record['df'] = df
+    return df
+
+def get_file_hash(path):
+    '''
+    give a file path, return the sha1 hex digest of its content
+    :param path:
+    :return:
+    '''
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_cached_table(name, engine='c', rebuild=False, columns=None):
+    '''
+    Read a source table through a Feather cache stored next to the source file as <path>.feather, with its key
+    in <path>.cache.json. The cache is used while the source file has the same size and modification time, or the
+    same content hash if only the modification time changed, and the table is read the same way. Otherwise, or when
+    rebuild is set, the table is parsed with load_table and the cache is written again. Without pyarrow the table
+    is always parsed.
+    :param name: key of SOURCE_TABLES
+    :param engine: 'c' or 'pyarrow'
+    :param rebuild: ignore the cache and write it again
+    :param columns: columns to keep instead of all the used columns. Such a table is parsed without the cache.
+    :return:
+    '''
+    if columns is not None and columns != SOURCE_TABLES[name]['columns']:
+        return load_table(name, engine, columns=columns)
+    try:
+        from pyarrow import feather
+    except ImportError:
+        return load_table(name, engine)
+
+    table = SOURCE_TABLES[name]
+    cache_path = table['path'] + '.feather'
+    key_path = table['path'] + '.cache.json'
+    source = os.stat(table['path'])
+    reading = {option: value for option, value in table.items() if option != 'path'}
+
+    if not rebuild and os.path.exists(cache_path) and os.path.exists(key_path):
+        with open(key_path) as f:
+            key = json.load(f)
+        valid = key.get('reading') == reading and key.get('size') == source.st_size
+        if valid and key.get('mtime') != source.st_mtime_ns:
+            # the file was touched, check if the content changed
+            valid = key.get('hash') == get_file_hash(table['path'])
+            if valid:
+                key['mtime'] = source.st_mtime_ns
+                with open(key_path, 'w') as f:
+                    json.dump(key, f)
+        if valid:
+            with profile_stage('read_cache.' + name) as record:
+                df = feather.read_table(cache_path, memory_map=True).to_pandas()
+                record['df'] = df
+            return df
+
+    df = load_table(name, engine)
+    try:
+        feather.write_feather(df, cache_path, compression='uncompressed')
+        with open(key_path, 'w') as f:
+            json.dump({'size': source.st_size, 'mtime': source.st_mtime_ns, 'hash': get_file_hash(table['path']),
+                       'reading': reading}, f)
+    except OSError:
+        # a read-only data directory only means there is no cache
+        pass
+    return df
+
+def build_key_index(df, key='PAT_ID'):
+    '''
+    Sort the row positions of df by the key column once and record where each key value starts and ends,
+    so the rows of one key value can be taken without scanning the whole table.
+    The index is remembered for df and reused by get_rows_by_key.
+    :param df:
+    :param key:
+    :return: (order, offsets, lookup) where the rows of value are order[offsets[lookup[value]]:offsets[lookup[value] + 1]]
+    '''
+    codes, uniques = pd.factorize(df[key])
+    order = np.argsort(codes, kind='stable')
+    # rows with a missing key sort first and are never looked up
+    offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+    offsets[0] = np.count_nonzero(codes < 0)
+    offsets[1:] = offsets[0] + np.cumsum(np.bincount(codes[codes >= 0], minlength=len(uniques)))
+    lookup = dict(zip(uniques, range(len(uniques))))
+
+    entry_key = (id(df), key)
+    ref = weakref.ref(df, lambda _, entry_key=entry_key: _KEY_INDEX.pop(entry_key, None))
+    _KEY_INDEX[entry_key] = (ref, (order, offsets, lookup))
+    return order, offsets, lookup
+
+def get_key_index(df, key='PAT_ID'):
+    '''
+    Get the key index of df, building it on first use
+    :param df:
+    :param key:
+    :return:
+    '''
+    entry = _KEY_INDEX.get((id(df), key))
+    if entry is None or entry[0]() is not df:
+        return build_key_index(df, key)
+    return entry[1]
+
+def get_rows_by_key(df, key, value):
+    '''
+    find all rows in df with key equals value, in table order
+    :param df:
+    :param key:
+    :param value:
+    :return:
+    '''
+    order, offsets, lookup = get_key_index(df, key)
+    position = lookup.get(value)
+    if position is None:
+        return df.iloc[0:0]
+    return df.iloc[order[offsets[position]:offsets[position + 1]]]
+
+def get_patient_rows(df, pat_id):
+    '''
+    find all rows of one patient in df
+    :param df:
+    :param pat_id:
+    :return:
+    '''
+    return get_rows_by_key(df, 'PAT_ID', pat_id)
+
+def get_key_column(df, key, target_key):
+    '''
+    Get the values of target_key in the row order of the key index of df, so the values of one key value
+    are a contiguous slice. It is built on first use and remembered for df like the key index.
+    :param df:
+    :param key:
+    :param target_key:
+    :return:
+    '''
+    entry_key = (id(df), key, target_key)
+    entry = _KEY_COLUMNS.get(entry_key)
+    if entry is None or entry[0]() is not df:
+        order, offsets, lookup = get_key_index(df, key)
+        values = np.asarray(df[target_key].values)[order]
+        ref = weakref.ref(df, lambda _, entry_key=entry_key: _KEY_COLUMNS.pop(entry_key, None))
+        entry = _KEY_COLUMNS[entry_key] = (ref, values)
+    return entry[1]
+
+def get_values_by_key(df, key, value, target_key):
+    '''
+    find all values of target_key in df with key equals value, in table order. The answer is a slice of the
+    target column sorted by the key index; keys in LOOKUP_CACHE_KEYS are scanned instead, and the recent
+    answers remembered.
+    :param df:
+    :param key:
+    :param value:
+    :param target_key:
+    :return: array of the values
+    '''
+    if key in LOOKUP_CACHE_KEYS:
+        cache_key = (id(df), key, value, target_key)
+        with _LOOKUP_CACHE_LOCK:
+            entry = _LOOKUP_CACHE.get(cache_key)
+            if entry is not None and entry[0]() is df:
+                _LOOKUP_CACHE.move_to_end(cache_key)
+                return entry[1]
+        values = np.asarray(df[target_key].values)[(df[key] == value).values]
+        with _LOOKUP_CACHE_LOCK:
+            _LOOKUP_CACHE[cache_key] = (weakref.ref(df), values)
+            if len(_LOOKUP_CACHE) > LOOKUP_CACHE_SIZE:
+                _LOOKUP_CACHE.popitem(last=False)
+        return values
+
+    order, offsets, lookup = get_key_index(df, key)
+    position = lookup.get(value)
+    values = get_key_column(df, key, target_key)
+    if position is None:
+        return values[0:0]
+    return values[offsets[position]:offsets[position + 1]]
+
+def resolve_index_events(diagnoses_df, visits_df):
+    '''
+    Find the index AMI admission of every patient in one pass.
+    The index admission is the earliest diagnosis row with an ACUTE_MYOCARDIAL_INFARCTION_CODE, the last AMI
+    admission is the latest one. Rows with the same date keep their table order.
+    :param diagnoses_df:
+    :param visits_df:
+    :return: dataframe indexed by PERSON_ID with INDEX_ADM_DATE, INDEX_VISIT_NO, INDEX_DSCH_DATE,
+             LAST_AMI_ADM_DATE and LAST_AMI_VISIT_NO, and the day numbers of the dates
+    '''
+    ami_df = diagnoses_df.loc[diagnoses_df['CODE'].isin(ACUTE_MYOCARDIAL_INFARCTION_CODE),
+                              ['PAT_ID', 'ADM_DATE', 'ADM_DATE_DAY', 'VISIT_NO']]
+    # admissions without a readable date sort last
+    adm_days = ami_df['ADM_DATE_DAY'].values
+    adm_days = np.where(adm_days == MISSING_DATE, np.iinfo(np.int32).max, adm_days)
+    ami_df = ami_df.iloc[np.argsort(adm_days, kind='stable')]
+
+    first_df = ami_df.drop_duplicates('PAT_ID', keep='first').set_index('PAT_ID')
+    last_df = ami_df.drop_duplicates('PAT_ID', keep='last').set_index('PAT_ID')
+    index_events = pd.DataFrame({'INDEX_ADM_DATE': first_df['ADM_DATE'],
+                                 'INDEX_ADM_DAY': first_df['ADM_DATE_DAY'],
+                                 'INDEX_VISIT_NO': first_df['VISIT_NO']})
+    index_events['LAST_AMI_ADM_DATE'] = last_df['ADM_DATE']
+    index_events['LAST_AMI_ADM_DAY'] = last_df['ADM_DATE_DAY']
+    index_events['LAST_AMI_VISIT_NO'] = last_df['VISIT_NO']
+
+    # the discharge date comes from the first visit row of the index visit
+    index_visits_df = visits_df.drop_duplicates('VISIT_NO', keep='first').set_index('VISIT_NO')
+    index_events['INDEX_DSCH_DATE'] = index_events['INDEX_VISIT_NO'].map(index_visits_df['DSCH_DATE']).fillna('')
+    index_events['INDEX_DSCH_DAY'] = index_events['INDEX_VISIT_NO'].map(index_visits_df['DSCH_DATE_DAY'])\
+        .fillna(MISSING_DATE).astype(np.int32)
+    index_events.index.name = 'PERSON_ID'
+    return index_events
+
+def get_code_matchers():
+    '''
+    compile the code lists and patterns of CODE_CATEGORIES once. The patterns of a category are combined
+    into one regular expression.
+    :return: dict of category name to a function telling if a code belongs to the category
+    '''
+    if not _CODE_MATCHERS:
+        for category in CODE_CATEGORIES:
+            values = globals()[category]
+            if '_PATTERN' in category:
+                _CODE_MATCHERS[category] = re.compile('|'.join('(?:%s)' % pattern for pattern in values)).match
+            else:
+                _CODE_MATCHERS[category] = frozenset(values).__contains__
+    return _CODE_MATCHERS
+
+def get_code_bits(code):
+    '''
+    give a code, return its category bitmask, bit i is set if the code belongs to CODE_CATEGORIES[i].
+    Every code is classified only once.
+    :param code:
+    :return:
+    '''
+    if code not in _CODE_BITS:
+        bits = 0
+        if isinstance(code, str):
+            matchers = get_code_matchers()
+            for bit, category in enumerate(CODE_CATEGORIES):
+                if matchers[category](code):
+                    bits |= 1 << bit
+        _CODE_BITS[code] = bits
+    return _CODE_BITS[code]
+
+def factorize_values(values):
+    '''
+    number the distinct values of an array as pd.factorize does. The values of an encoded key are numbered from
+    their category codes, without hashing the values.
+    :param values: array, or pd.Categorical of a column of KEY_COLUMNS
+    :return: (labels, uniques), with labels of -1 for missing values
+    '''
+    if isinstance(values, pd.Categorical):
+        return pd.factorize(values)
+    return pd.factorize(np.asarray(values, dtype=object))
+
+def code_in_category(codes, category):
+    '''
+    find which of the codes belong to a category of CODE_CATEGORIES
+    :param codes: array of codes
+    :param category: name of the code list or pattern list
+    :return: boolean array aligned with codes
+    '''
+    bit = 1 << CODE_CATEGORIES.index(category)
+    labels, uniques = factorize_values(codes)
+    # labels of -1 are missing values and pick the False appended at the end
+    in_category = np.array([get_code_bits(code) & bit != 0 for code in uniques] + [False], dtype=bool)
+    return in_category[labels]
+
+def get_medication_matchers():
+    '''
+    compile the name lists of MEDICATION_CATEGORIES once, each into one alternation searched anywhere in a
+    medication name. Matching is case sensitive like the substring test it replaces.
+    :return: dict of class name to a function telling if a medication name contains one of the class names
+    '''
+    if not _MEDICATION_MATCHERS:
+        for category in MEDICATION_CATEGORIES:
+            names = sorted(set(globals()[category]), key=len, reverse=True)
+            _MEDICATION_MATCHERS[category] = re.compile('|'.join(re.escape(name) for name in names)).search
+    return _MEDICATION_MATCHERS
+
+def get_medication_bits(item):
+    '''
+    give a medication name, return its class bitmask, bit i is set if the name belongs to MEDICATION_CATEGORIES[i].
+    Every distinct name is scanned only once.
+    :param item:
+    :return:
+    '''
+    if item not in _MEDICATION_BITS:
+        bits = 0
+        if isinstance(item, str):
+            matchers = get_medication_matchers()
+            for bit, category in enumerate(MEDICATION_CATEGORIES):
+                if matchers[category](item):
+                    bits |= 1 << bit
+        _MEDICATION_BITS[item] = bits
+    return _MEDICATION_BITS[item]
+
+def medication_in_class(items, category):
+    '''
+    find which of the medication names belong to a class of MEDICATION_CATEGORIES
+    :param items: array of medication names
+    :param category: name of the medication name list
+    :return: boolean array aligned with items
+    '''
+    bit = 1 << MEDICATION_CATEGORIES.index(category)
+    labels, uniques = factorize_values(items)
+    # labels of -1 are missing values and pick the False appended at the end
+    in_class = np.array([get_medication_bits(item) & bit != 0 for item in uniques] + [False], dtype=bool)
+    return in_class[labels]
+
+def get_index_visit_categories(df, key, categories, index_events, same_patient=True):
+    '''
+    find for every patient with an index AMI admission whether the index visit has a value of key in each category
+    :param df: table with PAT_ID and VISIT_NO columns
+    :param key: column holding the codes
+    :param categories: names of CODE_CATEGORIES
+    :param index_events:
+    :param same_patient: only look at the rows of the patient, otherwise at all rows with the index visit number
+    :return: dataframe indexed by PERSON_ID with a 0/1 column per category
+    '''
+    if same_patient:
+        patients = index_events.index.get_indexer(df['PAT_ID'].values)
+        rows = np.flatnonzero(patients >= 0)
+        rows = rows[df['VISIT_NO'].values[rows] == index_events['INDEX_VISIT_NO'].values[patients[rows]]]
+        groups, targets = patients[rows], np.arange(len(index_events))
+    else:
+        rows = np.flatnonzero(df['VISIT_NO'].isin(index_events['INDEX_VISIT_NO']).values)
+        groups, targets = df['VISIT_NO'].values[rows], index_events['INDEX_VISIT_NO'].values
+
+    codes = df[key].values[rows]
+    found = pd.DataFrame({category: code_in_category(codes, category) for category in categories},
+                         columns=categories).groupby(groups, observed=True).any()
+    found = found.reindex(targets, fill_value=False).astype(int)
+    found.index = index_events.index
+    return found
+
+def evaluate_flag_specs(flag_specs, diagnoses_df, index_events):
+    '''
+    Evaluate diagnosis flags for every patient with an index AMI admission in one pass over the diagnoses table.
+    A diagnosis counts for a flag if its code is in the spec category and it is dated within the spec window of days
+    before the reference day. Diagnoses without a readable date never count.
+    :param flag_specs: list of flag specs, see PRIOR_MONTH_DIAGNOSIS_FLAGS
+    :param diagnoses_df:
+    :param index_events:
+    :return: dataframe indexed by PERSON_ID with one column per flag spec
+    '''
+    # line up the diagnoses with the index admission of their patient
+    patients = index_events.index.get_indexer(diagnoses_df['PAT_ID'].values)
+    rows = np.flatnonzero(patients >= 0)
+    patients = patients[rows]
+    days = diagnoses_df['ADM_DATE_DAY'].values[rows].astype(np.int64)
+    on_index_visit = diagnoses_df['VISIT_NO'].values[rows] == index_events['INDEX_VISIT_NO'].values[patients]
+
+    factorized = {}
+    matches = {}
+    for flag_spec in flag_specs:
+        key = flag_spec.get('key', 'CODE')
+        if key not in factorized:
+            codes, uniques = pd.factorize(diagnoses_df[key].values[rows])
+            # codes the patient also has on the index visit, as patient * number of codes + code
+            pairs = patients.astype(np.int64) * len(uniques) + codes
+            factorized[key] = codes, uniques, np.isin(pairs, pairs[on_index_visit])
+        codes, uniques, on_index_codes = factorized[key]
+
+        # codes of -1 are missing values and pick the False appended at the end
+        matched = np.append(code_in_category(uniques, flag_spec['category']), False)[codes]
+        if flag_spec.get('index_visit', False):
+            matched &= on_index_codes
+
+        reference = index_events[flag_spec.get('reference', 'INDEX_ADM_DAY')].values.astype(np.int64)[patients]
+        diff = reference - days
+        first_day, last_day = flag_spec['window']
+        matched &= (days != MISSING_DATE) & (reference != MISSING_DATE) & (diff >= first_day)
+        if last_day is not None:
+            matched &= diff <= last_day
+        matches[flag_spec['column']] = matched
+
+    # one group-by for all flags
+    counts = pd.DataFrame(matches, columns=[flag_spec['column'] for flag_spec in flag_specs])\
+        .groupby(patients).sum().reindex(range(len(index_events)), fill_value=0)
+    counts.index = index_events.index
+    for flag_spec in flag_specs:
+        if not flag_spec.get('count', False):
+            counts[flag_spec['column']] = (counts[flag_spec['column']] > 0).astype(int)
+    return counts.astype(int)
+
+def evaluate_score_table(score_table, sources):
+    '''
+    score whole columns with the components of a score table
+    :param score_table: list of component specs, see GRACE_SCORE_TABLE
+    :param sources: mapping of source column name to the column values
+    :return: dict of component column name to its points, in the order of the table
+    '''
+    components = {}
+    for component in score_table:
+        values = np.asarray(sources[component['source']])
+        # compact integer columns are widened so the points cannot overflow them
+        values = values.astype(np.int64) if values.dtype.kind in 'iu' else values
+        default = component.get('default', 0)
+        if 'weight' in component:
+            components[component['column']] = values * component['weight']
+        elif 'categories' in component:
+            categories = component['categories']
+            components[component['column']] = np.select([values == value for value in categories],
+                                                        list(categories.values()), default)
+        else:
+            # text is read as try_float does
+            values = values if values.dtype.kind == 'f' else \
+                values.astype(float) if values.dtype.kind in 'biu' else to_numbers(values)
+            # float32 lab values are binned by the edges rounded the same way, keeping the edges just above 0 above it
+            edges = component['edges']
+            if values.dtype == np.float32:
+                edges = [np.float32(edge) if np.float32(edge) != 0 or edge == 0
+                         else np.nextafter(np.float32(0), np.float32(np.sign(edge))) for edge in edges]
+            # bin 0 and bin len(edges) lie outside the edges, missing values land past the last edge
+            bins = np.digitize(values, edges, right=component.get('right', False))
+            points = np.array([default] + list(component['points']) + [default])
+            components[component['column']] = points[bins]
+    return components
+
+def compute_cohort_thresholds(sources):
+    '''
+    compute the thresholds of COHORT_THRESHOLDS over the cohort, each with one percentile over its whole column
+    :param sources: mapping of source column name to the column values of all the patients
+    :return: dict of flag column name to its threshold
+    '''
+    return {spec['column']: float(np.percentile(sources[spec['source']], spec['percentile']))
+            for spec in COHORT_THRESHOLDS}
+
+def get_wide_values(values):
+    '''
+    give the values of a compact column of COLUMN_DTYPES in int64 or float64, for arithmetic that could overflow them
+    :param values: pd.Series
+    :return: np.array
+    '''
+    values = values.values
+    if values.dtype.kind in 'biu':
+        return values.astype(np.int64)
+    return values.astype(np.float64) if values.dtype.kind == 'f' else values
+
+def compute_terms(target_df, terms, sparse=False):
+    '''
+    compute product terms of the columns of target_df. For a sparse result the rows with a zero factor are not
+    stored, unless another factor of the row is NaN or infinite, which makes the product NaN as in the dense result.
+    :param target_df:
+    :param terms: list of (term name, list of factor columns), see POLYNOMIAL_TERM_SPECS
+    :param sparse: return a scipy.sparse.csc_matrix with one column per term instead of dense columns
+    :return: dict of term name to its column, or the sparse matrix
+    '''
+    if not sparse:
+        columns = {}
+        for name, factors in terms:
+            powers = collections.Counter(factors)
+            columns[name] = np.prod([get_wide_values(target_df[column]) ** power for column, power in powers.items()],
+                                    axis=0)
+        return columns
+
+    import scipy.sparse
+    data, indices, indptr = [], [], [0]
+    for name, factors in terms:
+        powers = collections.Counter(factors)
+        values = [get_wide_values(target_df[column]) ** power for column, power in powers.items()]
+        zero = np.any([factor == 0 for factor in values], axis=0)
+        zero &= np.all([np.isfinite(factor) for factor in values], axis=0)
+        rows = np.flatnonzero(~zero)
+        data.append(np.prod([factor[rows] for factor in values], axis=0))
+        indices.append(rows)
+        indptr.append(indptr[-1] + len(rows))
+    return scipy.sparse.csc_matrix((np.concatenate(data), np.concatenate(indices), indptr),
+                                   shape=(len(target_df), len(terms)))
+
+def count_visit_windows(window_specs, visits_df, index_events):
+    '''
+    Count the visits of every patient with an index AMI admission in the windows of days around the index
+    admission, all windows in one pass over the visits table. Visits without a readable date never count.
+    :param window_specs: list of window specs, see HOSPITAL_SCORE_VISIT_WINDOWS
+    :param visits_df:
+    :param index_events:
+    :return: dataframe indexed by PERSON_ID with one column per window spec
+    '''
+    # line up the visits with the index admission of their patient
+    patients = index_events.index.get_indexer(visits_df['PAT_ID'].values)
+    rows = np.flatnonzero(patients >= 0)
+    patients = patients[rows]
+    pat_classes = np.asarray(visits_df['PAT_CLASS'].values)[rows]
+
+    matches = {}
+    for window_spec in window_specs:
+        days = visits_df[window_spec['day']].values[rows].astype(np.int64)
+        reference = index_events[window_spec.get('reference', 'INDEX_ADM_DAY')].values.astype(np.int64)[patients]
+        offset = days - reference
+        first_day, last_day = window_spec['window']
+        matched = (days != MISSING_DATE) & (reference != MISSING_DATE)
+        if first_day is not None:
+            matched &= offset >= first_day
+        if last_day is not None:
+            matched &= offset <= last_day
+        if 'pat_class' in window_spec:
+            matched &= pat_classes == window_spec['pat_class']
+        if 'sum' in window_spec:
+            matched = np.where(matched, visits_df[window_spec['sum']].values[rows], 0.0)
+        matches[window_spec['column']] = matched
+
+    # one group-by for all windows
+    counts = pd.DataFrame(matches, columns=[window_spec['column'] for window_spec in window_specs])\
+        .groupby(patients).sum().reindex(range(len(index_events)), fill_value=0)
+    counts.index = index_events.index
+    for window_spec in window_specs:
+        if window_spec.get('flag', False):
+            counts[window_spec['column']] = (counts[window_spec['column']] > 0).astype(int)
+        elif 'sum' not in window_spec:
+            counts[window_spec['column']] = counts[window_spec['column']].astype(int)
+    return counts
+
+def aggregate_labs(labs_df, index_events, analytes, value_column='OBS_VALUE'):
+    '''
+    Summarize the lab results of the index visit of every patient for several analytes at once.
+    Results are all lab rows with the index visit number and one of the LAB_ITEM_ALIASES of the analyte,
+    values that are not numbers count as 0. First and last follow the observation day; results of the
+    same day keep the alias order and then the table order.
+    :param labs_df:
+    :param index_events:
+    :param analytes: names of LAB_ITEM_ALIASES
+    :param value_column:
+    :return: dataframe indexed by PERSON_ID with <analyte>_LEVEL_<statistic> columns, empty if there are no results
+    '''
+    # number the analytes and the rank of each spelling
+    item_analytes, item_ranks = {}, {}
+    for analyte_serial, analyte in enumerate(analytes):
+        for rank, item in enumerate(LAB_ITEM_ALIASES[analyte]):
+            item_analytes[item] = analyte_serial
+            item_ranks[item] = rank
+
+    items, item_names = pd.factorize(labs_df['ITEM'].values)
+    analyte_of_item = np.array([item_analytes.get(item, -1) for item in item_names] + [-1])[items]
+    rank_of_item = np.array([item_ranks.get(item, 0) for item in item_names] + [0])[items]
+    rows = np.flatnonzero((analyte_of_item >= 0) & labs_df['VISIT_NO'].isin(index_events['INDEX_VISIT_NO']).values)
+
+    labels, uniques = pd.factorize(labs_df[value_column].values[rows])
+    values = np.array([try_float(value) for value in uniques] + [0.0], dtype=float)[labels]
+    results = pd.DataFrame({'VISIT_NO': labs_df['VISIT_NO'].values[rows],
+                            'ANALYTE': analyte_of_item[rows],
+                            'VALUE': values})
+    # order the results for first and last
+    results = results.iloc[np.lexsort((rows, rank_of_item[rows], labs_df['OBS_DTM_DAY'].values[rows]))]
+
+    groups = results.groupby(['VISIT_NO', 'ANALYTE'], sort=False, observed=True)['VALUE']
+    statistics = pd.DataFrame({'AVG': groups.mean(), 'MIN': groups.min(), 'MAX': groups.max(),
+                               'FIRST': groups.first(), 'LAST': groups.last()}, columns=LAB_STATISTICS)
+    statistics = statistics.unstack('ANALYTE')
+    statistics = statistics.reindex(index_events['INDEX_VISIT_NO'].values)
+
+    summary = pd.DataFrame(index=index_events.index)
+    for analyte_serial, analyte in enumerate(analytes):
+        for statistic in LAB_STATISTICS:
+            column = (statistic, analyte_serial)
+            summary[analyte + '_LEVEL_' + statistic] = statistics[column].values if column in statistics.columns \
+                else np.nan
+    return summary
+
+def fits_dtype(values, dtype):
+    '''
+    tell whether a column can be cast to a compact dtype of COLUMN_DTYPES without changing its values: integers to a
+    narrower integer they fit, floats to float32 and text to a category
+    :param values: pd.Series
+    :param dtype: name of the dtype
+    :return: bool
+    '''
+    if dtype == 'category':
+        return values.dtype.kind == 'O'
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return values.dtype.kind == 'f'
+    if values.dtype.kind not in 'iu':
+        return False
+    return len(values) == 0 or np.iinfo(dtype).min <= values.min() and values.max() <= np.iinfo(dtype).max
+
+def get_section_df(columns, pat_ids):
+    '''
+    make the dataframe a section returns, with its columns in their COLUMN_DTYPES
+    :param columns: dict of column name to its values
+    :param pat_ids: the PERSON_IDs of the rows
+    :return: section_df indexed by PERSON_ID
+    '''
+    section_df = pd.DataFrame(columns, index=pat_ids)
+    dtypes = {column: COLUMN_DTYPES[column] for column in section_df.columns
+              if column in COLUMN_DTYPES and fits_dtype(section_df[column], COLUMN_DTYPES[column])}
+    return section_df.astype(dtypes) if dtypes else section_df
+
+def add_columns(target_df, section_df):
+    '''
+    Add the columns a section computed to target_df in one step. Every section returns its columns as a
+    dataframe indexed by PERSON_ID; columns target_df already has are replaced where they are, the new ones
+    are appended in the order of the section.
+    :param target_df:
+    :param section_df:
+    :return: target_df with the columns of the section
+    '''
+    section_df = section_df.reindex(target_df['PERSON_ID'].values)
+    section_df.index = target_df.index
+    new_columns = []
+    for column in section_df.columns:
+        if column in target_df.columns:
+            target_df[column] = section_df[column]
+        else:
+            new_columns.append(column)
+    return pd.concat([target_df, section_df[new_columns]], axis=1, copy=False)
+
 def DEMOGRAPHICS(target_df, demographics_df, diagnoses_df):
     '''
     Fill the demographics information for each patient.
     :param target_df:
     :param demographics_df:
-    :return:
+    :return: dataframe of the demographics columns indexed by PERSON_ID
     '''
+    pat_ids = target_df['PERSON_ID'].values
+
     # initialize table columns
-    target_df['MRN'] = ['' for patient in target_df['PERSON_ID'].values]
-    target_df['GENDER'] = [get_one_value_by_foreign_key(demographics_df, 'PAT_ID', patient, 'PAT_GENDER')
-                           for patient in target_df['PERSON_ID'].values]
-    target_df['RACE'] = ['' for patient in target_df['PERSON_ID'].values]
-    target_df['ETHNICITY'] = ['' for patient in target_df['PERSON_ID'].values]
-    target_df['SSN'] = [get_one_value_by_foreign_key(demographics_df, 'PAT_ID', patient, 'SSN')
-                        for patient in target_df['PERSON_ID'].values]
-    target_df['ZIPCODE'] = [get_one_value_by_foreign_key(demographics_df, 'PAT_ID', patient, 'ZIP')
-                            for patient in target_df['PERSON_ID'].values]
-    target_df['FIRST_NAME'] = [get_one_value_by_foreign_key(demographics_df, 'PAT_ID', patient, 'FIRST_NAME')
-                               for patient in target_df['PERSON_ID'].values]
-    target_df['LAST_NAME'] = [get_one_value_by_foreign_key(demographics_df, 'PAT_ID', patient, 'LAST_NAME')
-                              for patient in target_df['PERSON_ID'].values]
-    target_df['MIDDLE_NAME'] = [get_one_value_by_foreign_key(demographics_df, 'PAT_ID', patient, 'MIDDLE_NAME')
-                                for patient in target_df['PERSON_ID'].values]
-    target_df['DOB'] = [get_one_value_by_foreign_key(demographics_df, 'PAT_ID', patient, 'DOB')
-                        for patient in target_df['PERSON_ID'].values]
-    target_df['PRIM_DIAG'] = ['' for patient in target_df['PERSON_ID'].values]
-    target_df['ADMIT_DATE'] = ['' for patient in target_df['PERSON_ID'].values]
-    target_df['DISCHARGE_DATE'] = ['' for patient in target_df['PERSON_ID'].values]
-    target_df['INDEX_ADMIT_DATE'] = ['' for patient in target_df['PERSON_ID'].values]
-    target_df['INDEX_DISCHARGE_DATE'] = ['' for patient in target_df['PERSON_ID'].values]
-    target_df['VISIT_OCCURRENCE_ID'] = ['' for patient in target_df['PERSON_ID'].values]
+    columns = {}
+    columns['MRN'] = ['' for patient in pat_ids]
+    columns['GENDER'] = [get_one_value_by_foreign_key(demographics_df, 'PAT_ID', patient, 'PAT_GENDER')
+                         for patient in pat_ids]
+    columns['RACE'] = ['' for patient in pat_ids]
+    columns['ETHNICITY'] = ['' for patient in pat_ids]
+    columns['SSN'] = [get_one_value_by_foreign_key(demographics_df, 'PAT_ID', patient, 'SSN')
+                      for patient in pat_ids]
+    columns['ZIPCODE'] = [get_one_value_by_foreign_key(demographics_df, 'PAT_ID', patient, 'ZIP')
+                          for patient in pat_ids]
+    columns['FIRST_NAME'] = [get_one_value_by_foreign_key(demographics_df, 'PAT_ID', patient, 'FIRST_NAME')
+                             for patient in pat_ids]
+    columns['LAST_NAME'] = [get_one_value_by_foreign_key(demographics_df, 'PAT_ID', patient, 'LAST_NAME')
+                            for patient in pat_ids]
+    columns['MIDDLE_NAME'] = [get_one_value_by_foreign_key(demographics_df, 'PAT_ID', patient, 'MIDDLE_NAME')
+                              for patient in pat_ids]
+    columns['DOB'] = [get_one_value_by_foreign_key(demographics_df, 'PAT_ID', patient, 'DOB')
+                      for patient in pat_ids]
+    columns['PRIM_DIAG'] = ['' for patient in pat_ids]
+    columns['ADMIT_DATE'] = ['' for patient in pat_ids]
+    columns['DISCHARGE_DATE'] = ['' for patient in pat_ids]
+    columns['INDEX_ADMIT_DATE'] = ['' for patient in pat_ids]
+    columns['INDEX_DISCHARGE_DATE'] = ['' for patient in pat_ids]
+    columns['VISIT_OCCURRENCE_ID'] = ['' for patient in pat_ids]
 
     # get prim_diagnoses code version
-    for iter, row in target_df.iterrows():
-        pat_id = row['PERSON_ID']
-        # get the patients all visit rows
-        all_visits_df = diagnoses_df[diagnoses_df['PAT_ID'] == pat_id]
-        all_code_versions = list(all_visits_df['CODE_VERSION'].values)
-        target_df.at[iter, 'PRIM_DIAG'] = 'ICD9CM' if 'ICD9CM' in all_code_versions else 'ICD-10-CM'
+    for position, pat_id in enumerate(pat_ids):
+        # get the code versions of all the patients visit rows
+        all_code_versions = list(get_values_by_key(diagnoses_df, 'PAT_ID', pat_id, 'CODE_VERSION'))
+        columns['PRIM_DIAG'][position] = 'ICD9CM' if 'ICD9CM' in all_code_versions else 'ICD-10-CM'
 
     # get dates and visit_no
-    for iter, row in target_df.iterrows():
-        pat_id = row['PERSON_ID']
+    for position, pat_id in enumerate(pat_ids):
         # get the patients all visit rows
-        all_visits_df = demographics_df[demographics_df['PAT_ID'] == pat_id]
-        all_adm_dates = list(all_visits_df['AMI_ADM_DATE'].values)
-        all_dsch_dates = list(all_visits_df['AMI_DSCH_DATE'].values)
-        all_visit_no = list(all_visits_df['VISIT_NO'].values)
+        all_adm_days = list(get_values_by_key(demographics_df, 'PAT_ID', pat_id, 'AMI_ADM_DATE_DAY'))
+        all_adm_dates = list(get_values_by_key(demographics_df, 'PAT_ID', pat_id, 'AMI_ADM_DATE'))
+        all_dsch_dates = list(get_values_by_key(demographics_df, 'PAT_ID', pat_id, 'AMI_DSCH_DATE'))
+        all_visit_no = list(get_values_by_key(demographics_df, 'PAT_ID', pat_id, 'VISIT_NO'))
 
         # get the earlist adm and dsch date
         if len(all_adm_dates) > 0:
-            date_pairs = list(zip(all_adm_dates, all_dsch_dates,all_visit_no))
-            date_pairs.sort(key=lambda x: time.strptime(x[0], '%m-%d-%Y'))
-            adm_date, dsch_date,visit = date_pairs[0]
-            target_df.at[iter, 'ADMIT_DATE'] = adm_date
-            target_df.at[iter, 'DISCHARGE_DATE'] = dsch_date
-            target_df.at[iter, 'INDEX_ADMIT_DATE'] = adm_date
-            target_df.at[iter, 'INDEX_DISCHARGE_DATE'] = dsch_date
-            target_df.at[iter, 'VISIT_OCCURRENCE_ID'] = visit
-
-    return target_df
-
-def PRIOR_MONTH_DIAGNOSIS(target_df, diagnoses_df):
+            date_pairs = list(zip(all_adm_days, all_adm_dates, all_dsch_dates, all_visit_no))
+            date_pairs.sort(key=lambda x: x[0])
+            _, adm_date, dsch_date, visit = date_pairs[0]
+            columns['ADMIT_DATE'][position] = adm_date
+            columns['DISCHARGE_DATE'][position] = dsch_date
+            columns['INDEX_ADMIT_DATE'][position] = adm_date
+            columns['INDEX_DISCHARGE_DATE'][position] = dsch_date
+            columns['VISIT_OCCURRENCE_ID'][position] = visit
+
+    return get_section_df(columns, pat_ids)
+
+def PRIOR_MONTH_DIAGNOSIS(target_df, diagnoses_df, index_events):
     '''
     generate PRIOR_MONTH_DIAGNOSIS variables
     :param target_df:
     :param diagnose_df:
     :return:
     '''
+    pat_ids = target_df['PERSON_ID'].values
+    columns = {}
     # initialize table columns with default values
-    target_df['PRIOR_SEPSIS_30D'] = [0] * len(target_df)
-    target_df['PRIOR_HYPERKALEMIA_30D'] = [0] * len(target_df)
-    target_df['PRIOR_HYPOKALEMIA_30D'] = [0] * len(target_df)
-    target_df['PRIOR_HYPERVOLEMIA_30D'] = [0] * len(target_df)
-    target_df['PRIOR_AKF_30D'] = [0] * len(target_df)
-    target_df['PRIOR_UTI_30D'] = [0] * len(target_df)
-    target_df['PRIOR_LONGTERM_ANTICOAGULANTS_30D'] = [0] * len(target_df)
-    target_df['PRIOR_SEPSIS_90D'] = [0] * len(target_df)
-    target_df['PRIOR_DIS_MAGN_METAB_90D'] = [0] * len(target_df)
-    target_df['PRIOR_HYPOKALEMIA_90D'] = [0] * len(target_df)
-    target_df['PRIOR_LVEF_90D'] = [0] * len(target_df)
-    target_df['PRIOR_AKF_90D'] = [0] * len(target_df)
-    target_df['PRIOR_CARDIAC_DEVICE_90D'] = [0] * len(target_df)
-
-    # for each patient in the target table
-    for iter, row in target_df.iterrows():
-        pat_id = row['PERSON_ID']
-        # get the patients all visit rows
-        all_visits_df = diagnoses_df[diagnoses_df['PAT_ID'] == pat_id]
-        ACUTE_MYOCARDIAL_INFARCTION_df = all_visits_df[all_visits_df['CODE'].isin(ACUTE_MYOCARDIAL_INFARCTION_CODE)]
-        PRIOR_SEPSIS_30D_df = all_visits_df[all_visits_df['CODE'].isin(PRIOR_SEPSIS_30D_CODE)]
-        PRIOR_HYPERKALEMIA_30D_df = all_visits_df[all_visits_df['CODE'].isin(PRIOR_HYPERKALEMIA_30D_CODE)]
-        PRIOR_HYPOKALEMIA_30D_df = all_visits_df[all_visits_df['CODE'].isin(PRIOR_HYPOKALEMIA_30D_CODE)]
-        PRIOR_HYPERVOLEMIA_30D_df = all_visits_df[all_visits_df['CODE'].isin(PRIOR_HYPERVOLEMIA_30D_CODE)]
-        PRIOR_AKF_30D_df = all_visits_df[all_visits_df['CODE'].isin(PRIOR_AKF_30D_CODE)]
-        PRIOR_UTI_30D_df = all_visits_df[all_visits_df['CODE'].isin(PRIOR_UTI_30D_CODE)]
-        PRIOR_LONGTERM_ANTICOAGULANTS_30D_df = all_visits_df[all_visits_df['CODE'].isin(PRIOR_LONGTERM_ANTICOAGULANTS_30D_CODE)]
-        PRIOR_DIS_MAGN_METAB_90D_df = all_visits_df[all_visits_df['CODE'].isin(PRIOR_DIS_MAGN_METAB_90D_CODE)]
-        PRIOR_LVEF_90D_df = all_visits_df[all_visits_df['CODE'].isin(PRIOR_DIS_MAGN_METAB_90D_CODE)]
-        PRIOR_CARDIAC_DEVICE_90D_df = all_visits_df[all_visits_df['CODE'].isin(PRIOR_DIS_MAGN_METAB_90D_CODE)]
-
-        if len(ACUTE_MYOCARDIAL_INFARCTION_df) > 0:
-            # get the earlist ACUTE_MYOCARDIAL_VISIT date
-            all_dates = list(ACUTE_MYOCARDIAL_INFARCTION_df['ADM_DATE'].values)
-            all_dates.sort(key=lambda all_dates: time.strptime(all_dates, '%m/%d/%Y'))
-            earliest_date = all_dates[0]
-
-            # check if the date of the visit type we care is within 30 days
-            # repeat for all visit type and 90 days.
-            for date in list(PRIOR_SEPSIS_30D_df['ADM_DATE'].values):
-                time_diff = get_date_diff(earliest_date, date)
-                if  time_diff <= 30 and time_diff >= 0:
-                    target_df.at[iter,'PRIOR_SEPSIS_30D'] = 1
-                if  time_diff <= 90 and time_diff >= 0:
-                    target_df.at[iter,'PRIOR_SEPSIS_90D'] = 1
-
-            for date in list(PRIOR_HYPERKALEMIA_30D_df['ADM_DATE'].values):
-                time_diff = get_date_diff(earliest_date, date)
-                if time_diff <= 30 and time_diff >=0 :
-                    target_df.at[iter, 'PRIOR_HYPERKALEMIA_30D'] = 1
-
-            for date in list(PRIOR_HYPOKALEMIA_30D_df['ADM_DATE'].values):
-                time_diff = get_date_diff(earliest_date, date)
-                if 30 >= time_diff >= 0:
-                    target_df.at[iter, 'PRIOR_HYPOKALEMIA_30D'] = 1
-                if time_diff <= 90 and time_diff >= 0:
-                    target_df.at[iter, 'PRIOR_HYPOKALEMIA_90D'] = 1
-
-            for date in list(PRIOR_HYPERVOLEMIA_30D_df['ADM_DATE'].values):
-                time_diff = get_date_diff(earliest_date, date)
-                if time_diff <=30 and time_diff >= 0:
-                    target_df.at[iter, 'PRIOR_HYPERVOLEMIA_30D'] = 1
-
-            for date in list(PRIOR_AKF_30D_df['ADM_DATE'].values):
-                time_diff = get_date_diff(earliest_date, date)
-                if time_diff <= 30 and time_diff >= 0:
-                    target_df.at[iter, 'PRIOR_AKF_30D'] = 1
-                if time_diff <= 90 and time_diff >= 0:
-                    target_df.at[iter, 'PRIOR_AKF_90D'] = 1
-
-            for date in list(PRIOR_UTI_30D_df['ADM_DATE'].values):
-                time_diff = get_date_diff(earliest_date, date)
-                if time_diff <= 30 and time_diff >= 0:
-                    target_df.at[iter, 'PRIOR_UTI_30D'] = 1
-
-            for date in list(PRIOR_LONGTERM_ANTICOAGULANTS_30D_df['ADM_DATE'].values):
-                time_diff = get_date_diff(earliest_date, date)
-                if time_diff <= 30 and time_diff >=0 :
-                    target_df.at[iter, 'PRIOR_LONGTERM_ANTICOAGULANTS_30D'] = 1
-
-            for date in list(PRIOR_DIS_MAGN_METAB_90D_df['ADM_DATE'].values):
-                time_diff = get_date_diff(earliest_date, date)
-                if time_diff <= 90 and time_diff >=0 :
-                    target_df.at[iter, 'PRIOR_DIS_MAGN_METAB_90D'] = 1
-
-            for date in list(PRIOR_LVEF_90D_df['ADM_DATE'].values):
-                time_diff = get_date_diff(earliest_date, date)
-                if time_diff <= 90 and time_diff >=0 :
-                    target_df.at[iter, 'PRIOR_LVEF_90D'] = 1
-
-            for date in list(PRIOR_CARDIAC_DEVICE_90D_df['ADM_DATE'].values):
-                time_diff = get_date_diff(earliest_date, date)
-                if time_diff <= 90 and time_diff >=0 :
-                    target_df.at[iter, 'PRIOR_CARDIAC_DEVICE_90D'] = 1
-
-    return target_df
-
-def HOSPITAL_SCORE(target_df, procedures_df, diagnoses_df, visits_df, labs_df):
+    columns['PRIOR_SEPSIS_30D'] = [0] * len(target_df)
+    columns['PRIOR_HYPERKALEMIA_30D'] = [0] * len(target_df)
+    columns['PRIOR_HYPOKALEMIA_30D'] = [0] * len(target_df)
+    columns['PRIOR_HYPERVOLEMIA_30D'] = [0] * len(target_df)
+    columns['PRIOR_AKF_30D'] = [0] * len(target_df)
+    columns['PRIOR_UTI_30D'] = [0] * len(target_df)
+    columns['PRIOR_LONGTERM_ANTICOAGULANTS_30D'] = [0] * len(target_df)
+    columns['PRIOR_SEPSIS_90D'] = [0] * len(target_df)
+    columns['PRIOR_DIS_MAGN_METAB_90D'] = [0] * len(target_df)
+    columns['PRIOR_HYPOKALEMIA_90D'] = [0] * len(target_df)
+    columns['PRIOR_LVEF_90D'] = [0] * len(target_df)
+    columns['PRIOR_AKF_90D'] = [0] * len(target_df)
+    columns['PRIOR_CARDIAC_DEVICE_90D'] = [0] * len(target_df)
+
+    # evaluate all the flags together
+    flags = evaluate_flag_specs(PRIOR_MONTH_DIAGNOSIS_FLAGS, diagnoses_df, index_events)\
+        .reindex(pat_ids, fill_value=0)
+    for flag_spec in PRIOR_MONTH_DIAGNOSIS_FLAGS:
+        columns[flag_spec['column']] = flags[flag_spec['column']].values
+
+    return get_section_df(columns, pat_ids)
+
+def HOSPITAL_SCORE(target_df, procedures_df, diagnoses_df, visits_df, labs_df, index_events):
     '''
     Compute hospital score and make a new column for it in target_df
     :param target_df:
     :param diagnose_df:
     :return:
     '''
+    pat_ids = target_df['PERSON_ID'].values
+    columns = {}
 
     def get_ONCOLOGY_SERVICE_FLAG(code_list):
         for code in code_list:
@@ -503,337 +1857,169 @@ def HOSPITAL_SCORE(target_df, procedures_df, diagnoses_df, visits_df, labs_df):
         return 0
 
     # initialize table columns with default values
-    target_df['LOS'] = [0] * len(target_df)
-    target_df['LOS5_FLAG'] = [0] * len(target_df)
-    target_df['PROCEDURE_FLAG'] = [0] * len(target_df)
-    target_df['PRIOR_YEAR_ADMISSIONS_COUNT'] = [0] * len(target_df)
-    target_df['NONELECTIVE_ADMISSION_FLAG'] = [0] * len(target_df)
-    target_df['ONCOLOGY_SERVICE_FLAG'] = [0] * len(target_df)
-    target_df['HEMOGLOBIN_LEVEL_LAST_12_FLAG'] = [0] * len(target_df)
-    target_df['SODIUM_LEVEL_LAST_135_FLAG'] = [0] * len(target_df)
-    target_df['HOSPITAL_SCORE'] = [0] * len(target_df)
-
-    for iter, row in target_df.iterrows():
-        pat_id = row['PERSON_ID']
-        # get the patients all visit rows
-        all_visits_df = diagnoses_df[diagnoses_df['PAT_ID'] == pat_id]
-        ACUTE_MYOCARDIAL_INFARCTION_df = all_visits_df[all_visits_df['CODE'].isin(ACUTE_MYOCARDIAL_INFARCTION_CODE)]
-        all_adm_dates = list(ACUTE_MYOCARDIAL_INFARCTION_df['ADM_DATE'].values)
-        all_visit_no = list(ACUTE_MYOCARDIAL_INFARCTION_df['VISIT_NO'].values)
-
-        # get the earlist adm and visit_no
-        if len(all_adm_dates) > 0:
-            date_pairs = list(zip(all_adm_dates,all_visit_no))
-            date_pairs.sort(key=lambda x: time.strptime(x[0], '%m/%d/%Y'))
-            earliest_adm_date, earliest_visit_no = date_pairs[0]
-            target_df.at[iter, 'VISIT_NO'] = earliest_visit_no
+    columns['LOS'] = [0] * len(target_df)
+    columns['LOS5_FLAG'] = [0] * len(target_df)
+    columns['PROCEDURE_FLAG'] = [0] * len(target_df)
+    columns['PRIOR_YEAR_ADMISSIONS_COUNT'] = [0] * len(target_df)
+    columns['NONELECTIVE_ADMISSION_FLAG'] = [0] * len(target_df)
+    columns['ONCOLOGY_SERVICE_FLAG'] = [0] * len(target_df)
+    columns['HEMOGLOBIN_LEVEL_LAST_12_FLAG'] = [0] * len(target_df)
+    columns['SODIUM_LEVEL_LAST_135_FLAG'] = [0] * len(target_df)
+    columns['HOSPITAL_SCORE'] = [0] * len(target_df)
+
+    # the last hemoglobin and sodium results of the index visit
+    last_labs = aggregate_labs(labs_df, index_events, ['HEMOGLOBIN', 'SODIUM']).reindex(pat_ids)
+    columns['HEMOGLOBIN_LEVEL_LAST_12_FLAG'] = (last_labs['HEMOGLOBIN_LEVEL_LAST'] < 12).astype(int).values
+    columns['SODIUM_LEVEL_LAST_135_FLAG'] = (last_labs['SODIUM_LEVEL_LAST'] < 135).astype(int).values
+
+    # count the admissions of the prior year and the emergency visits around the index admission
+    visit_counts = count_visit_windows(HOSPITAL_SCORE_VISIT_WINDOWS, visits_df, index_events)\
+        .reindex(pat_ids, fill_value=0)
+    for window_spec in HOSPITAL_SCORE_VISIT_WINDOWS:
+        columns[window_spec['column']] = visit_counts[window_spec['column']].values
+
+    for position, pat_id in enumerate(pat_ids):
+
+        # get the index AMI admission
+        if pat_id in index_events.index:
+            earliest_adm_day = index_events.at[pat_id, 'INDEX_ADM_DAY']
+            earliest_visit_no = index_events.at[pat_id, 'INDEX_VISIT_NO']
 
             # compute LOS and LOS5_FLAG
-            earliest_dsch_date = get_one_value_by_foreign_key(visits_df, 'VISIT_NO', earliest_visit_no, 'DSCH_DATE')
-            target_df.at[iter, 'LOS'] = get_date_diff(earliest_dsch_date, earliest_adm_date) + 1
-            target_df.at[iter, 'LOS5_FLAG'] = get_LOS5_FLAG(target_df.at[iter, 'LOS'])
+            earliest_dsch_day = index_events.at[pat_id, 'INDEX_DSCH_DAY']
+            columns['LOS'][position] = get_day_diff(earliest_dsch_day, earliest_adm_day) + 1
+            columns['LOS5_FLAG'][position] = get_LOS5_FLAG(columns['LOS'][position])
 
             # compute PROCEDURE_FLAG
-            all_procedures_df = procedures_df[procedures_df['PAT_ID'] == pat_id]
-            procedure_flag = False
-            for p_iter, p_row in all_procedures_df.iterrows():
-                procedure_flag |= datecmp(earliest_adm_date, p_row['PROC_DT']) and datecmp(p_row['PROC_DT'], earliest_dsch_date)
-            target_df.at[iter, 'PROCEDURE_FLAG'] = 1 if procedure_flag else 0
-
-            # compute PRIOR_YEAR_ADMISSIONS_COUNT
-            total_prior_year_admission = 0
-            all_admissions_df = visits_df[visits_df['PAT_ID'] == pat_id]
-            for adm_iter, adm_row in all_admissions_df.iterrows():
-                if 0 < get_date_diff(earliest_adm_date, adm_row['DSCH_DATE']) <= 365:
-                    total_prior_year_admission += 1
-            target_df.at[iter, 'PRIOR_YEAR_ADMISSIONS_COUNT'] = total_prior_year_admission
-
-            # compute NONELECTIVE_ADMISSION_FLAG
-            pat_visits = visits_df[visits_df['PAT_ID'] == pat_id]
-            emergency_visit_dates = get_values_by_foreign_key(pat_visits, 'PAT_CLASS', 'EMERGENCY', 'ADM_DATE')
-            n_flag = 0
-            for date in emergency_visit_dates:
-                if 0 <= get_date_diff(earliest_adm_date, date) <= 1:
-                    n_flag = 1
-            target_df.at[iter, 'NONELECTIVE_ADMISSION_FLAG'] = n_flag
+            procedure_days = get_values_by_key(procedures_df, 'PAT_ID', pat_id, 'PROC_DT_DAY')
+            procedure_flag = np.any(is_day_before(earliest_adm_day, procedure_days)
+                                    & is_day_before(procedure_days, earliest_dsch_day))
+            columns['PROCEDURE_FLAG'][position] = 1 if procedure_flag else 0
 
             # compute ONCOLOGY_SERVICE_FLAG
-            target_df.at[iter, 'ONCOLOGY_SERVICE_FLAG'] = get_ONCOLOGY_SERVICE_FLAG(
+            columns['ONCOLOGY_SERVICE_FLAG'][position] = get_ONCOLOGY_SERVICE_FLAG(
                 set(get_values_by_foreign_key(diagnoses_df, 'VISIT_NO', earliest_visit_no, 'CODE'))
             )
 
-            # compute HEMOGLOBIN_LEVEL_LAST_12_FLAG
-            all_labs_df = labs_df[labs_df['VISIT_NO'] == earliest_visit_no]
-            all_hemoglobin_df = all_labs_df[all_labs_df['ITEM'] == 'Hemoglobin']
-            all_hemoglobin_dates = list(all_hemoglobin_df['OBS_DTM'].values)
-            all_hemoglobin_values = list(all_hemoglobin_df['OBS_VALUE'].values)
-            hemoglobin_dates_values = list(zip(all_hemoglobin_dates, all_hemoglobin_values))
-            hemoglobin_dates_values.sort(key=lambda x: time.strptime(x[0].split()[0], '%m/%d/%Y'))
-            if len(hemoglobin_dates_values) > 0:
-                last_hemoglobin_date, last_hemoglobin_value = hemoglobin_dates_values[-1]
-                target_df.at[iter, 'HEMOGLOBIN_LEVEL_LAST_12_FLAG'] = 1 if try_float(last_hemoglobin_value) < 12 else 0
-            else:
-                target_df.at[iter, 'HEMOGLOBIN_LEVEL_LAST_12_FLAG'] = 0
-
-            # compute SODIUM_LEVEL_LAST_135_FLAG
-            all_labs_df = labs_df[labs_df['VISIT_NO'] == earliest_visit_no]
-            all_sodium_df = all_labs_df[all_labs_df['ITEM'] == 'Sodium, Serum or Plasma']
-            all_sodium_dates = list(all_sodium_df['OBS_DTM'].values)
-            all_sodium_values = list(all_sodium_df['OBS_VALUE'].values)
-            sodium_dates_values = list(zip(all_sodium_dates, all_sodium_values))
-            sodium_dates_values.sort(key=lambda x: time.strptime(x[0].split()[0], '%m/%d/%Y'))
-            if len(sodium_dates_values) > 0:
-                last_sodium_date, last_sodium_value = sodium_dates_values[-1]
-                target_df.at[iter, 'SODIUM_LEVEL_LAST_135_FLAG'] = 1 if try_float(last_sodium_value) < 135 else 0
-            else:
-                target_df.at[iter, 'SODIUM_LEVEL_LAST_135_FLAG'] = 0
+    columns['HOSPITAL_SCORE'] = sum(evaluate_score_table(HOSPITAL_SCORE_TABLE, columns).values())
 
-        target_df.at[iter,'HOSPITAL_SCORE'] = 2 * target_df.at[iter, 'LOS5_FLAG']\
-                                              + target_df.at[iter, 'PROCEDURE_FLAG']\
-                                              + 2 * (float(target_df.at[iter, 'PRIOR_YEAR_ADMISSIONS_COUNT']) > 2)\
-                                              + 3 * (float(target_df.at[iter, 'PRIOR_YEAR_ADMISSIONS_COUNT']) > 5)\
-                                              + target_df.at[iter, 'NONELECTIVE_ADMISSION_FLAG']\
-                                              + 2 * target_df.at[iter, 'ONCOLOGY_SERVICE_FLAG']\
-                                              + target_df.at[iter, 'HEMOGLOBIN_LEVEL_LAST_12_FLAG']\
-                                              + target_df.at[iter, 'SODIUM_LEVEL_LAST_135_FLAG']
+    # VISIT_NO is only added once a patient has an index AMI admission, and is empty for the others
+    index_visit_no = index_events['INDEX_VISIT_NO'].reindex(pat_ids)
+    if index_visit_no.notna().any():
+        columns['VISIT_NO'] = index_visit_no.values
 
-    return target_df
+    return get_section_df(columns, pat_ids)
 
-def LABORATORIES(target_df, diagnoses_df, labs_df):
+def LABORATORIES(target_df, labs_df, index_events):
     '''
     Laboratory statistics
     :return:
     '''
+    pat_ids = target_df['PERSON_ID'].values
+    columns = {}
     # initializing columns
-    target_df['SODIUM_LEVEL_AVG'] = [0.0] * len(target_df)
-    target_df['SODIUM_LEVEL_MIN'] = [0.0] * len(target_df)
-    target_df['SODIUM_LEVEL_MAX'] = [0.0] * len(target_df)
-    target_df['SODIUM_LEVEL_FIRST'] = [0.0] * len(target_df)
-    target_df['SODIUM_LEVEL_LAST'] = [0.0] * len(target_df)
-    target_df['SODIUM_LEVEL_AVG_136_FLAG'] = [0] * len(target_df)
-
-    target_df['CALCIUM_LEVEL_AVG'] = [0.0] * len(target_df)
-    target_df['CALCIUM_LEVEL_MIN'] = [0.0] * len(target_df)
-    target_df['CALCIUM_LEVEL_MAX'] = [0.0] * len(target_df)
-    target_df['CALCIUM_LEVEL_FIRST'] = [0.0] * len(target_df)
-    target_df['CALCIUM_LEVEL_LAST'] = [0.0] * len(target_df)
-    target_df['CALCIUM_LEVEL_AVG_86_FLAG'] = [0] * len(target_df)
-
-    target_df['CREATININE_LEVEL_AVG'] = [0.0] * len(target_df)
-    target_df['CREATININE_LEVEL_MIN'] = [0.0] * len(target_df)
-    target_df['CREATININE_LEVEL_MAX'] = [0.0] * len(target_df)
-    target_df['CREATININE_LEVEL_FIRST'] = [0.0] * len(target_df)
-    target_df['CREATININE_LEVEL_LAST'] = [0.0] * len(target_df)
-
-    target_df['HEMOGLOBIN_LEVEL_AVG'] = [0.0] * len(target_df)
-    target_df['HEMOGLOBIN_LEVEL_MIN'] = [0.0] * len(target_df)
-    target_df['HEMOGLOBIN_LEVEL_MAX'] = [0.0] * len(target_df)
-    target_df['HEMOGLOBIN_LEVEL_FIRST'] = [0.0] * len(target_df)
-    target_df['HEMOGLOBIN_LEVEL_LAST'] = [0.0] * len(target_df)
-
-    target_df['CKI_LEVEL_AVG'] = [0.0] * len(target_df)
-    target_df['CKI_LEVEL_MIN'] = [0.0] * len(target_df)
-    target_df['CKI_LEVEL_MAX'] = [0.0] * len(target_df)
-    target_df['CKI_LEVEL_FIRST'] = [0.0] * len(target_df)
-    target_df['CKI_LEVEL_LAST'] = [0.0] * len(target_df)
-
-    target_df['CKT_LEVEL_AVG'] = [0.0] * len(target_df)
-    target_df['CKT_LEVEL_MIN'] = [0.0] * len(target_df)
-    target_df['CKT_LEVEL_MAX'] = [0.0] * len(target_df)
-    target_df['CKT_LEVEL_FIRST'] = [0.0] * len(target_df)
-    target_df['CKT_LEVEL_LAST'] = [0.0] * len(target_df)
-
-    target_df['BNP_LEVEL_AVG'] = [0.0] * len(target_df)
-    target_df['BNP_LEVEL_MIN'] = [0.0] * len(target_df)
-    target_df['BNP_LEVEL_MAX'] = [0.0] * len(target_df)
-    target_df['BNP_LEVEL_FIRST'] = [0.0] * len(target_df)
-    target_df['BNP_LEVEL_LAST'] = [0.0] * len(target_df)
-
-    for iter, row in target_df.iterrows():
-        pat_id = row['PERSON_ID']
-        # get earliest AMI admission
-        all_visits_df = diagnoses_df[diagnoses_df['PAT_ID'] == pat_id]
-        ACUTE_MYOCARDIAL_INFARCTION_df = all_visits_df[all_visits_df['CODE'].isin(ACUTE_MYOCARDIAL_INFARCTION_CODE)]
-        all_adm_dates = list(ACUTE_MYOCARDIAL_INFARCTION_df['ADM_DATE'].values)
-        all_visit_no = list(ACUTE_MYOCARDIAL_INFARCTION_df['VISIT_NO'].values)
-
-        # get the earlist adm and visit_no
-        if len(all_adm_dates) > 0:
-            date_pairs = list(zip(all_adm_dates, all_visit_no))
-            date_pairs.sort(key=lambda x: time.strptime(x[0], '%m/%d/%Y'))
-            earliest_adm_date, earliest_visit_no = date_pairs[0]
-
-            # get the earliest admission labs
-            adm_labs_df = labs_df[labs_df['VISIT_NO'] == earliest_visit_no]
-
-            # get all the sodium records
-            sodium_df = adm_labs_df[adm_labs_df['ITEM'] == 'Sodium, Serum or Plasma']
-            sodium_values = [try_float(x) for x in list(sodium_df['OBS_VALUE'].values)]
-            sodium_dates = list(sodium_df['OBS_DTM'].values)
-            sodium_dates_values = list(zip(sodium_dates, sodium_values))
-            sodium_dates_values.sort(key=lambda x: time.strptime(x[0].split()[0], '%m/%d/%Y'))
-            if len(sodium_values) > 0:
-                target_df.at[iter, 'SODIUM_LEVEL_AVG'] = stat.mean(sodium_values)
-                target_df.at[iter, 'SODIUM_LEVEL_MIN'] = min(sodium_values)
-                target_df.at[iter, 'SODIUM_LEVEL_MAX'] = max(sodium_values)
-                _, first_sodium_value = sodium_dates_values[0]
-                target_df.at[iter, 'SODIUM_LEVEL_FIRST'] = first_sodium_value
-                _, last_sodium_value = sodium_dates_values[-1]
-                target_df.at[iter, 'SODIUM_LEVEL_LAST'] = last_sodium_value
-                target_df.at[iter, 'SODIUM_LEVEL_AVG_136_FLAG'] = 1 if stat.mean(sodium_values) < 136 else 0
-
-            # get all the calcium records
-            calcium_df = adm_labs_df[adm_labs_df['ITEM'] == 'CALCIUM']
-            calcium_values = [try_float(x) for x in list(calcium_df['OBS_VALUE'].values)]
-            calcium_dates = list(calcium_df['OBS_DTM'].values)
-            calcium_dates_values = list(zip(calcium_dates, calcium_values))
-            calcium_dates_values.sort(key=lambda x: time.strptime(x[0].split()[0], '%m/%d/%Y'))
-            if len(calcium_values) > 0:
-                target_df.at[iter, 'CALCIUM_LEVEL_AVG'] = stat.mean(calcium_values)
-                target_df.at[iter, 'CALCIUM_LEVEL_MIN'] = min(calcium_values)
-                target_df.at[iter, 'CALCIUM_LEVEL_MAX'] = max(calcium_values)
-                _, first_calcium_value = calcium_dates_values[0]
-                target_df.at[iter, 'CALCIUM_LEVEL_FIRST'] = first_calcium_value
-                _, last_calcium_value = calcium_dates_values[-1]
-                target_df.at[iter, 'CALCIUM_LEVEL_LAST'] = last_calcium_value
-                target_df.at[iter, 'CALCIUM_LEVEL_AVG_86_FLAG'] = 1 if stat.mean(calcium_values) < 8.6 else 0
-
-            # get all the creatinine records
-            creatinine_df = adm_labs_df[adm_labs_df['ITEM'] == 'CREATININE']
-            creatinine_values = [try_float(x) for x in list(creatinine_df['OBS_VALUE'].values)]
-            creatinine_dates = list(creatinine_df['OBS_DTM'].values)
-            creatinine_dates_values = list(zip(creatinine_dates, creatinine_values))
-            creatinine_dates_values.sort(key=lambda x: time.strptime(x[0].split()[0], '%m/%d/%Y'))
-            if len(creatinine_values) > 0:
-                target_df.at[iter, 'CREATININE_LEVEL_AVG'] = stat.mean(creatinine_values)
-                target_df.at[iter, 'CREATININE_LEVEL_MIN'] = min(creatinine_values)
-                target_df.at[iter, 'CREATININE_LEVEL_MAX'] = max(creatinine_values)
-                _, first_creatinine_value = creatinine_dates_values[0]
-                target_df.at[iter, 'CREATININE_LEVEL_FIRST'] = first_creatinine_value
-                _, last_creatinine_value = creatinine_dates_values[-1]
-                target_df.at[iter, 'CREATININE_LEVEL_LAST'] = last_creatinine_value
-
-            # get all the hemoglobin records
-            hemoglobin_df = adm_labs_df[adm_labs_df['ITEM'] == 'Hemoglobin']
-            hemoglobin_values = [try_float(x) for x in list(hemoglobin_df['OBS_VALUE'].values)]
-            hemoglobin_dates = list(hemoglobin_df['OBS_DTM'].values)
-            hemoglobin_dates_values = list(zip(hemoglobin_dates, hemoglobin_values))
-            hemoglobin_dates_values.sort(key=lambda x: time.strptime(x[0].split()[0], '%m/%d/%Y'))
-            if len(hemoglobin_values) > 0:
-                target_df.at[iter, 'HEMOGLOBIN_LEVEL_AVG'] = stat.mean(hemoglobin_values)
-                target_df.at[iter, 'HEMOGLOBIN_LEVEL_MIN'] = min(hemoglobin_values)
-                target_df.at[iter, 'HEMOGLOBIN_LEVEL_MAX'] = max(hemoglobin_values)
-                _, first_hemoglobin_value = hemoglobin_dates_values[0]
-                target_df.at[iter, 'HEMOGLOBIN_LEVEL_FIRST'] = first_hemoglobin_value
-                _, last_hemoglobin_value = hemoglobin_dates_values[-1]
-                target_df.at[iter, 'HEMOGLOBIN_LEVEL_LAST'] = last_hemoglobin_value
-
-            # get all the ck Isoenzyme records
-            cki_df = adm_labs_df[adm_labs_df['ITEM'] == 'Creatine Kinase, Isoenzyme MB']
-            cki_values = [try_float(x) for x in list(cki_df['OBS_VALUE'].values)]
-            cki_dates = list(cki_df['OBS_DTM'].values)
-            cki_dates_values = list(zip(cki_dates, cki_values))
-            cki_dates_values.sort(key=lambda x: time.strptime(x[0].split()[0], '%m/%d/%Y'))
-            if len(cki_values) > 0:
-                target_df.at[iter, 'CKI_LEVEL_AVG'] = stat.mean(cki_values)
-                target_df.at[iter, 'CKI_LEVEL_MIN'] = min(cki_values)
-                target_df.at[iter, 'CKI_LEVEL_MAX'] = max(cki_values)
-                _, first_cki_value = cki_dates_values[0]
-                target_df.at[iter, 'CKI_LEVEL_FIRST'] = first_cki_value
-                _, last_cki_value = cki_dates_values[-1]
-                target_df.at[iter, 'CKI_LEVEL_LAST'] = last_cki_value
-
-
-            # get all the ck total records
-            ckt_df = adm_labs_df[adm_labs_df['ITEM'] == 'Creatine Kinase, Total, Ser/Pla']
-            ckt_values = [try_float(x) for x in list(ckt_df['OBS_VALUE'].values)]
-            ckt_dates = list(ckt_df['OBS_DTM'].values)
-            ckt_dates_values = list(zip(ckt_dates, ckt_values))
-            ckt_dates_values.sort(key=lambda x: time.strptime(x[0].split()[0], '%m/%d/%Y'))
-            if len(ckt_values) > 0:
-                target_df.at[iter, 'CKT_LEVEL_AVG'] = stat.mean(ckt_values)
-                target_df.at[iter, 'CKT_LEVEL_MIN'] = min(ckt_values)
-                target_df.at[iter, 'CKT_LEVEL_MAX'] = max(ckt_values)
-                _, first_ckt_value = ckt_dates_values[0]
-                target_df.at[iter, 'CKT_LEVEL_FIRST'] = first_ckt_value
-                _, last_ckt_value = ckt_dates_values[-1]
-                target_df.at[iter, 'CKT_LEVEL_LAST'] = last_ckt_value
-
-            # get all the bnp total records
-            bnp_df1 = adm_labs_df[adm_labs_df['ITEM'] == 'proBrain Natriuretic Peptide, NT']
-            bnp_df2 = adm_labs_df[adm_labs_df['ITEM'] == 'PROBRAIN NATRIURETIC PEPTIDE_NT']
-            bnp_df = pd.concat([bnp_df1, bnp_df2])
-            bnp_values = [try_float(x) for x in list(bnp_df['OBS_VALUE'].values)]
-            bnp_dates = list(bnp_df['OBS_DTM'].values)
-            bnp_dates_values = list(zip(bnp_dates, bnp_values))
-            bnp_dates_values.sort(key=lambda x: time.strptime(x[0].split()[0], '%m/%d/%Y'))
-            if len(bnp_values) > 0:
-                target_df.at[iter, 'BNP_LEVEL_AVG'] = stat.mean(bnp_values)
-                target_df.at[iter, 'BNP_LEVEL_MIN'] = min(bnp_values)
-                target_df.at[iter, 'BNP_LEVEL_MAX'] = max(bnp_values)
-                _, first_bnp_value = bnp_dates_values[0]
-                target_df.at[iter, 'BNP_LEVEL_FIRST'] = first_bnp_value
-                _, last_bnp_value = bnp_dates_values[-1]
-                target_df.at[iter, 'BNP_LEVEL_LAST'] = last_bnp_value
-
-    return target_df
-
-def PRESENTATION_DISEASE(target_df, diagnoses_df, visits_df, med_orders_df, procedures_df):
+    columns['SODIUM_LEVEL_AVG'] = [0.0] * len(target_df)
+    columns['SODIUM_LEVEL_MIN'] = [0.0] * len(target_df)
+    columns['SODIUM_LEVEL_MAX'] = [0.0] * len(target_df)
+    columns['SODIUM_LEVEL_FIRST'] = [0.0] * len(target_df)
+    columns['SODIUM_LEVEL_LAST'] = [0.0] * len(target_df)
+    columns['SODIUM_LEVEL_AVG_136_FLAG'] = [0] * len(target_df)
+
+    columns['CALCIUM_LEVEL_AVG'] = [0.0] * len(target_df)
+    columns['CALCIUM_LEVEL_MIN'] = [0.0] * len(target_df)
+    columns['CALCIUM_LEVEL_MAX'] = [0.0] * len(target_df)
+    columns['CALCIUM_LEVEL_FIRST'] = [0.0] * len(target_df)
+    columns['CALCIUM_LEVEL_LAST'] = [0.0] * len(target_df)
+    columns['CALCIUM_LEVEL_AVG_86_FLAG'] = [0] * len(target_df)
+
+    columns['CREATININE_LEVEL_AVG'] = [0.0] * len(target_df)
+    columns['CREATININE_LEVEL_MIN'] = [0.0] * len(target_df)
+    columns['CREATININE_LEVEL_MAX'] = [0.0] * len(target_df)
+    columns['CREATININE_LEVEL_FIRST'] = [0.0] * len(target_df)
+    columns['CREATININE_LEVEL_LAST'] = [0.0] * len(target_df)
+
+    columns['HEMOGLOBIN_LEVEL_AVG'] = [0.0] * len(target_df)
+    columns['HEMOGLOBIN_LEVEL_MIN'] = [0.0] * len(target_df)
+    columns['HEMOGLOBIN_LEVEL_MAX'] = [0.0] * len(target_df)
+    columns['HEMOGLOBIN_LEVEL_FIRST'] = [0.0] * len(target_df)
+    columns['HEMOGLOBIN_LEVEL_LAST'] = [0.0] * len(target_df)
+
+    columns['CKI_LEVEL_AVG'] = [0.0] * len(target_df)
+    columns['CKI_LEVEL_MIN'] = [0.0] * len(target_df)
+    columns['CKI_LEVEL_MAX'] = [0.0] * len(target_df)
+    columns['CKI_LEVEL_FIRST'] = [0.0] * len(target_df)
+    columns['CKI_LEVEL_LAST'] = [0.0] * len(target_df)
+
+    columns['CKT_LEVEL_AVG'] = [0.0] * len(target_df)
+    columns['CKT_LEVEL_MIN'] = [0.0] * len(target_df)
+    columns['CKT_LEVEL_MAX'] = [0.0] * len(target_df)
+    columns['CKT_LEVEL_FIRST'] = [0.0] * len(target_df)
+    columns['CKT_LEVEL_LAST'] = [0.0] * len(target_df)
+
+    columns['BNP_LEVEL_AVG'] = [0.0] * len(target_df)
+    columns['BNP_LEVEL_MIN'] = [0.0] * len(target_df)
+    columns['BNP_LEVEL_MAX'] = [0.0] * len(target_df)
+    columns['BNP_LEVEL_FIRST'] = [0.0] * len(target_df)
+    columns['BNP_LEVEL_LAST'] = [0.0] * len(target_df)
+
+    # summarize the index visit labs of all analytes at once
+    summary = aggregate_labs(labs_df, index_events, LABORATORY_ANALYTES).reindex(pat_ids)
+    for analyte in LABORATORY_ANALYTES:
+        for statistic in LAB_STATISTICS:
+            column = analyte + '_LEVEL_' + statistic
+            columns[column] = summary[column].fillna(0.0).values
+    columns['SODIUM_LEVEL_AVG_136_FLAG'] = (summary['SODIUM_LEVEL_AVG'] < 136).astype(int).values
+    columns['CALCIUM_LEVEL_AVG_86_FLAG'] = (summary['CALCIUM_LEVEL_AVG'] < 8.6).astype(int).values
+
+    return get_section_df(columns, pat_ids)
+
+def PRESENTATION_DISEASE(target_df, diagnoses_df, visits_df, med_orders_df, procedures_df, index_events):
     '''
     Presentation and disease variables
     :param target_df:
     :param diagnoses_df:
     :return:
     '''
+    pat_ids = target_df['PERSON_ID'].values
+    columns = {}
     # initializing columns
-    target_df['TRANSFER_PATIENT_FLAG'] = [0] * len(target_df)
-    target_df['CHEST_PAIN_FLAG'] = [0] * len(target_df)
-    target_df['CARDIAC_ARREST_FLAG'] = [0] * len(target_df)
-    target_df['REVASCULARIZATION_FLAG'] = [0] * len(target_df)
-    target_df['VESSELS_1_FLAG'] = [0] * len(target_df)
-    target_df['VESSELS_2_FLAG'] = [0] * len(target_df)
-    target_df['VESSELS_3_FLAG'] = [0] * len(target_df)
-    target_df['VESSELS_4_FLAG'] = [0] * len(target_df)
-    target_df['VESSELS_COUNT'] = [0] * len(target_df)
-    target_df['CLOPIDOGREL_FLAG'] = [0] * len(target_df)
-    target_df['AMI_LOCATION'] = ['NA'] * len(target_df)
-
-    for iter, row in target_df.iterrows():
-        pat_id = row['PERSON_ID']
-        # get the patients all visit rows
-        all_visits_df = diagnoses_df[diagnoses_df['PAT_ID'] == pat_id]
-        ACUTE_MYOCARDIAL_INFARCTION_df = all_visits_df[all_visits_df['CODE'].isin(ACUTE_MYOCARDIAL_INFARCTION_CODE)]
-        all_adm_dates = list(ACUTE_MYOCARDIAL_INFARCTION_df['ADM_DATE'].values)
-        all_visit_no = list(ACUTE_MYOCARDIAL_INFARCTION_df['VISIT_NO'].values)
-
-        # get the earlist adm and visit_nod
-        if len(all_adm_dates) > 0:
-            date_pairs = list(zip(all_adm_dates, all_visit_no))
-            date_pairs.sort(key=lambda x: time.strptime(x[0], '%m/%d/%Y'))
-            earliest_adm_date, earliest_visit_no = date_pairs[0]
+    columns['TRANSFER_PATIENT_FLAG'] = [0] * len(target_df)
+    columns['CHEST_PAIN_FLAG'] = [0] * len(target_df)
+    columns['CARDIAC_ARREST_FLAG'] = [0] * len(target_df)
+    columns['REVASCULARIZATION_FLAG'] = [0] * len(target_df)
+    columns['VESSELS_1_FLAG'] = [0] * len(target_df)
+    columns['VESSELS_2_FLAG'] = [0] * len(target_df)
+    columns['VESSELS_3_FLAG'] = [0] * len(target_df)
+    columns['VESSELS_4_FLAG'] = [0] * len(target_df)
+    columns['VESSELS_COUNT'] = [0] * len(target_df)
+    columns['CLOPIDOGREL_FLAG'] = [0] * len(target_df)
+    columns['AMI_LOCATION'] = ['NA'] * len(target_df)
+    revascularization_code_set = set(REVASCULARIZATION_CODE)
+
+    for position, pat_id in enumerate(pat_ids):
+        # get the index AMI admission
+        if pat_id in index_events.index:
+            earliest_visit_no = index_events.at[pat_id, 'INDEX_VISIT_NO']
 
             # compute TRANSFER_PATIENT_FLAG
-            target_df.at[iter, 'TRANSFER_PATIENT_FLAG'] = 1 if get_one_value_by_foreign_key(visits_df, 'VISIT_NO',
+            columns['TRANSFER_PATIENT_FLAG'][position] = 1 if get_one_value_by_foreign_key(visits_df, 'VISIT_NO',
                     earliest_visit_no, 'PAT_CLASS') == 'INPATIENT' else 0
 
             # compute CHEST_PAIN_FLAG
-            target_df.at[iter, 'CHEST_PAIN_FLAG'] = 1 if set(CHEST_PAIN_CODE) & \
+            columns['CHEST_PAIN_FLAG'][position] = 1 if set(CHEST_PAIN_CODE) & \
                     set(get_values_by_foreign_key(diagnoses_df, 'VISIT_NO', earliest_visit_no, 'CODE')) else 0
 
             # compute CARDIAC_ARREST_FLAG
-            target_df.at[iter, 'CARDIAC_ARREST_FLAG'] = 1 if set(CARDIAC_ARREST_CODE) & \
+            columns['CARDIAC_ARREST_FLAG'][position] = 1 if set(CARDIAC_ARREST_CODE) & \
                     set(get_values_by_foreign_key(diagnoses_df, 'VISIT_NO', earliest_visit_no, 'CODE')) else 0
 
             # compute the REVASCULARIZATION_FLAG
-            r_flag = 0
-            pat_procedure = procedures_df[procedures_df['PAT_ID'] == pat_id]
-            REVASCULARIZATION_df = pat_procedure[pat_procedure['CODE'].isin(REVASCULARIZATION_CODE)]
-            for r_iter, r_row in REVASCULARIZATION_df.iterrows():
-                r_flag = 1
-            target_df.at[iter, 'REVASCULARIZATION_FLAG'] = r_flag
+            revascularization_codes = [code for code in get_values_by_key(procedures_df, 'PAT_ID', pat_id, 'CODE')
+                                       if code in revascularization_code_set]
+            columns['REVASCULARIZATION_FLAG'][position] = 1 if revascularization_codes else 0
 
             # compute VESSELS_1_FLAG ...
-            vessel_codes = list(set(REVASCULARIZATION_df['CODE'].values))
+            vessel_codes = list(set(revascularization_codes))
             vessel_count = 0
             additional_vessel = 0
             for code in vessel_codes:
@@ -842,191 +2028,117 @@ def PRESENTATION_DISEASE(target_df, diagnoses_df, visits_df, med_orders_df, proc
                 if code == ADDITIONAL_VESSEL_CODE:
                     additional_vessel = 1
             if vessel_count == 1 and additional_vessel == 0:
-                target_df.at[iter, 'VESSELS_1_FLAG'] = 1
+                columns['VESSELS_1_FLAG'][position] = 1
             elif vessel_count == 1 and additional_vessel == 1:
-                target_df.at[iter, 'VESSELS_2_FLAG'] = 1
+                columns['VESSELS_2_FLAG'][position] = 1
             elif vessel_count == 2 and additional_vessel == 1:
-                target_df.at[iter, 'VESSELS_3_FLAG'] = 1
+                columns['VESSELS_3_FLAG'][position] = 1
             elif vessel_count == 3 and additional_vessel == 1:
-                target_df.at[iter, 'VESSELS_4_FLAG'] = 1
-            target_df.at[iter, 'VESSELS_COUNT'] = vessel_count + additional_vessel
+                columns['VESSELS_4_FLAG'][position] = 1
+            columns['VESSELS_COUNT'][position] = vessel_count + additional_vessel
 
             # get CLOPIDOGREL_FLAG
-            target_df.at[iter, 'CLOPIDOGREL_FLAG'] = 1 if set(CLOPIDOGREL_NAMES) & \
+            columns['CLOPIDOGREL_FLAG'][position] = 1 if set(CLOPIDOGREL_NAMES) & \
                     set(get_values_by_foreign_key(med_orders_df, 'VISIT_NO', earliest_visit_no, 'ITEM')) else 0
 
             # get AMI_LOCATION
             ami_visits = set(AMI_LOCATION.keys()).intersection(
                 set(get_values_by_foreign_key(diagnoses_df, 'VISIT_NO', earliest_visit_no, 'CODE')))
             if len(ami_visits) > 0:
-                target_df.at[iter, 'AMI_LOCATION'] = AMI_LOCATION[list(ami_visits)[0]]
+                columns['AMI_LOCATION'][position] = AMI_LOCATION[list(ami_visits)[0]]
 
-    return target_df
+    return get_section_df(columns, pat_ids)
 
-def ADMINISTRATIVE_DATA(target_df, diagnoses_df, visits_df):
+def ADMINISTRATIVE_DATA(target_df, visits_df, index_events):
     '''
     get administrative data table
     :param target_df:
     :param diagnose_df:
     :return:
     '''
+    pat_ids = target_df['PERSON_ID'].values
+    columns = {}
 
     # initialize table columns with default values
-    target_df['INDEX_LOS'] = [0] * len(target_df)
-    target_df['ED_VISIT_PRIOR_180_DAYS_COUNT'] = [0] * len(target_df)
-    target_df['ADMISSION_PRIOR_30_DAYS_COUNT'] = [0] * len(target_df)
-    target_df['ED_VISIT_PRIOR_30_DAYS_COUNT'] = [0] * len(target_df)
-    target_df['ED_VISIT_PRIOR_30_DAYS_TIME_IN_ED'] = [0.0] * len(target_df)
-    target_df['ED_VISIT_PRIOR_30_DAYS_MINUTES_IN_ED'] = [0.0] * len(target_df)
-    target_df['ED_TO_IP_VISIT_PRIOR_30_DAYS_COUNT'] = [0] * len(target_df)
-
-    for iter, row in target_df.iterrows():
-        pat_id = row['PERSON_ID']
-        # get the patients all visit rows
-        all_diagnoses_df = diagnoses_df[diagnoses_df['PAT_ID'] == pat_id]
-        all_visits_df = visits_df[visits_df['PAT_ID'] == pat_id]
-        ACUTE_MYOCARDIAL_INFARCTION_df = all_diagnoses_df[all_diagnoses_df['CODE'].isin(ACUTE_MYOCARDIAL_INFARCTION_CODE)]
-        all_adm_dates = list(ACUTE_MYOCARDIAL_INFARCTION_df['ADM_DATE'].values)
-        all_visit_no = list(ACUTE_MYOCARDIAL_INFARCTION_df['VISIT_NO'].values)
-
-        # get the earlist adm and visit_nod
-        if len(all_adm_dates) > 0:
-            date_pairs = list(zip(all_adm_dates,all_visit_no))
-            date_pairs.sort(key=lambda x: time.strptime(x[0], '%m/%d/%Y'))
-            earliest_adm_date, earliest_visit_no = date_pairs[0]
-
-            # copy the LOS value
-            try:
-                target_df.at[iter, 'INDEX_LOS'] = row['LOS']
-            except:
-                # compute LOS
-                earliest_dsch_date = get_one_value_by_foreign_key(visits_df, 'VISIT_NO', earliest_visit_no, 'DSCH_DATE')
-                target_df.at[iter, 'INDEX_LOS'] = get_date_diff(earliest_dsch_date, earliest_adm_date) + 1
-
-            # compute ED_Visit_Prior_180_Days_Count and ED_Visit_Prior_30_Days_Count, ED_Visit_Prior_30_Days_Time_In_ED
-            # ED_to_IP_Visit_Prior_30_Days_Count
-            ED_visit_180 = 0
-            ED_visit_30 = 0
-            ED_visit_30_time = 0
-            ED_to_IP_Visit_Prior_30_Days_Count = 0
-            ED_dates = get_values_by_foreign_key(all_visits_df, 'PAT_CLASS', 'EMERGENCY', 'DSCH_DATE')
-            ED_time = get_values_by_foreign_key(all_visits_df, 'PAT_CLASS', 'EMERGENCY', 'CLINICAL_LOS')
-            for i, date in enumerate(ED_dates):
-                time_diff = get_date_diff(earliest_adm_date, date)
-                if 0 <= time_diff <= 180:
-                    ED_visit_180 += 1
-                if 0 <= time_diff <= 30:
-                    ED_visit_30 += 1
-                    ED_visit_30_time += try_float(ED_time[i])
-                if 0<= time_diff <= 1:
-                    ED_to_IP_Visit_Prior_30_Days_Count += 1
-
-            target_df.at[iter, 'ED_VISIT_PRIOR_180_DAYS_COUNT'] = ED_visit_180
-            target_df.at[iter, 'ED_VISIT_PRIOR_30_DAYS_COUNT'] = ED_visit_30
-            target_df.at[iter, 'ED_VISIT_PRIOR_30_DAYS_TIME_IN_ED'] = ED_visit_30_time
-            target_df.at[iter, 'ED_VISIT_PRIOR_30_DAYS_MINUTES_IN_ED'] = ED_visit_30_time * 24 * 60
-            target_df.at[iter, 'ED_TO_IP_VISIT_PRIOR_30_DAYS_COUNT'] = ED_to_IP_Visit_Prior_30_Days_Count
-
-            # compute Admission_Prior_30_Days_Count
-            total_admission = 0
-            inpatient_dates = get_values_by_foreign_key(all_visits_df, 'PAT_CLASS', 'INPATIENT', 'DSCH_DATE')
-            for date in inpatient_dates:
-                time_diff = get_date_diff(earliest_adm_date, date)
-                if time_diff <= 30 and time_diff >=0 :
-                    total_admission += 1
-            target_df.at[iter, 'ADMISSION_PRIOR_30_DAYS_COUNT'] = total_admission
-
-    return target_df
-
-def DISCHARGE_INFORMATION(target_df, diagnoses_df, visits_df, med_orders_df):
+    columns['INDEX_LOS'] = [0] * len(target_df)
+    columns['ED_VISIT_PRIOR_180_DAYS_COUNT'] = [0] * len(target_df)
+    columns['ADMISSION_PRIOR_30_DAYS_COUNT'] = [0] * len(target_df)
+    columns['ED_VISIT_PRIOR_30_DAYS_COUNT'] = [0] * len(target_df)
+    columns['ED_VISIT_PRIOR_30_DAYS_TIME_IN_ED'] = [0.0] * len(target_df)
+    columns['ED_VISIT_PRIOR_30_DAYS_MINUTES_IN_ED'] = [0.0] * len(target_df)
+    columns['ED_TO_IP_VISIT_PRIOR_30_DAYS_COUNT'] = [0] * len(target_df)
+
+    # copy the LOS value of the index admission, or compute it if the hospital score section did not run
+    has_index = index_events.index.get_indexer(pat_ids) >= 0
+    if 'LOS' in target_df.columns:
+        columns['INDEX_LOS'] = np.where(has_index, target_df['LOS'].values, 0)
+    else:
+        index_days = index_events.reindex(pat_ids)
+        los = get_day_diff(index_days['INDEX_DSCH_DAY'].fillna(MISSING_DATE).values,
+                           index_days['INDEX_ADM_DAY'].fillna(MISSING_DATE).values) + 1
+        columns['INDEX_LOS'] = np.where(has_index, los, 0)
+
+    # count the emergency and inpatient visits before the index admission
+    visit_counts = count_visit_windows(ADMINISTRATIVE_VISIT_WINDOWS, visits_df, index_events)\
+        .reindex(pat_ids, fill_value=0)
+    for window_spec in ADMINISTRATIVE_VISIT_WINDOWS:
+        columns[window_spec['column']] = visit_counts[window_spec['column']].values
+    columns['ED_VISIT_PRIOR_30_DAYS_MINUTES_IN_ED'] = columns['ED_VISIT_PRIOR_30_DAYS_TIME_IN_ED'] * 24 * 60
+
+    return get_section_df(columns, pat_ids)
+
+def DISCHARGE_INFORMATION(target_df, diagnoses_df, visits_df, med_orders_df, index_events):
     '''
     Get discharge information table columns
     :param target_df:
     :return:
     '''
-
-    target_df['UNSTABLE_ANGINA_FLAG'] = [0] * len(target_df)
-    target_df['STEMI_FLAG'] = [0] * len(target_df)
-    target_df['NSTEMI_FLAG'] = [0] * len(target_df)
-    target_df['TRANSFER_AT_DISCHARGE_FLAG'] = [0] * len(target_df)
-    target_df['DISCH_MED_BB_FLAG'] = [0] * len(target_df)
-    target_df['DISCH_MED_ANTIDEP_FLAG'] = [0] * len(target_df)
-    target_df['DISCH_MED_ACE_ARB_FLAG'] = [0] * len(target_df)
-    target_df['DISCH_MED_ASPIRIN_FLAG'] = [0] * len(target_df)
-    target_df['DISCH_MED_BB_METHOD'] = [0] * len(target_df)
-    target_df['DISCH_MED_ANTIDEP_METHOD'] = [0] * len(target_df)
-    target_df['DISCH_MED_ACE_ARB_METHOD'] = [0] * len(target_df)
-    target_df['DISCH_MED_ASPIRIN_METHOD'] = [0] * len(target_df)
-
-
-    for iter, row in target_df.iterrows():
-        pat_id = row['PERSON_ID']
-        # get the patients all visit rows
-        all_visits_df = diagnoses_df[diagnoses_df['PAT_ID'] == pat_id]
-        ACUTE_MYOCARDIAL_INFARCTION_df = all_visits_df[all_visits_df['CODE'].isin(ACUTE_MYOCARDIAL_INFARCTION_CODE)]
-        all_adm_dates = list(ACUTE_MYOCARDIAL_INFARCTION_df['ADM_DATE'].values)
-        all_visit_no = list(ACUTE_MYOCARDIAL_INFARCTION_df['VISIT_NO'].values)
-
-        # get the earlist adm and visit_nod
-        if len(all_adm_dates) > 0:
-            date_pairs = list(zip(all_adm_dates, all_visit_no))
-            date_pairs.sort(key=lambda x: time.strptime(x[0], '%m/%d/%Y'))
-            earliest_adm_date, earliest_visit_no = date_pairs[0]
-            last_dsch_date, last_visit_no = date_pairs[-1]
+    pat_ids = target_df['PERSON_ID'].values
+    columns = {}
+
+    columns['UNSTABLE_ANGINA_FLAG'] = [0] * len(target_df)
+    columns['STEMI_FLAG'] = [0] * len(target_df)
+    columns['NSTEMI_FLAG'] = [0] * len(target_df)
+    columns['TRANSFER_AT_DISCHARGE_FLAG'] = [0] * len(target_df)
+    columns['DISCH_MED_BB_FLAG'] = [0] * len(target_df)
+    columns['DISCH_MED_ANTIDEP_FLAG'] = [0] * len(target_df)
+    columns['DISCH_MED_ACE_ARB_FLAG'] = [0] * len(target_df)
+    columns['DISCH_MED_ASPIRIN_FLAG'] = [0] * len(target_df)
+    columns['DISCH_MED_BB_METHOD'] = [0] * len(target_df)
+    columns['DISCH_MED_ANTIDEP_METHOD'] = [0] * len(target_df)
+    columns['DISCH_MED_ACE_ARB_METHOD'] = [0] * len(target_df)
+    columns['DISCH_MED_ASPIRIN_METHOD'] = [0] * len(target_df)
+
+
+    for position, pat_id in enumerate(pat_ids):
+        # get the index AMI admission
+        if pat_id in index_events.index:
+            earliest_visit_no = index_events.at[pat_id, 'INDEX_VISIT_NO']
 
             CODE = get_values_by_foreign_key(diagnoses_df, 'VISIT_NO', earliest_visit_no, 'CODE')
             dsch_time = get_values_by_foreign_key(diagnoses_df, 'VISIT_NO', earliest_visit_no, 'CODE')
-            target_df.at[iter, 'UNSTABLE_ANGINA_FLAG'] = 1 if (set(CODE) & set(UNSTABLE_ANGINA_FLAG_CODE)) else 0
-            target_df.at[iter, 'STEMI_FLAG'] = 1 if 'I21.3' in CODE else 0
+            columns['UNSTABLE_ANGINA_FLAG'][position] = 1 if (set(CODE) & set(UNSTABLE_ANGINA_FLAG_CODE)) else 0
+            columns['STEMI_FLAG'][position] = 1 if 'I21.3' in CODE else 0
             for co in CODE:
                 if co[:3] =='410' and co!='410.71':
-                    target_df.at[iter, 'STEMI_FLAG'] = 1
-            target_df.at[iter, 'NSTEMI_FLAG'] = 1 if set(CODE) & set(NSTEMI_FLAG_CODE) else 0
-
-            all_order_items = get_values_by_foreign_key(med_orders_df, 'VISIT_NO', last_visit_no, 'ITEM')
-            all_order_types = get_values_by_foreign_key(med_orders_df, 'VISIT_NO', last_visit_no, 'ORDER_TYPE')
-
-            for order_id, item in enumerate(all_order_items):
-                for name in DISCH_MED_BB_FLAG_PATTERN:
-                    if name in all_order_items[order_id]:
-                        target_df.at[iter, 'DISCH_MED_BB_FLAG'] = 1
-                        if all_order_types[order_id] == 'DISCHARGE PRESCRIPTION' or 'OUTPATIENT PRESCRIPTION':
-                            target_df.at[iter, 'DISCH_MED_BB_METHOD'] = 1
-                        elif all_order_types[order_id] == 'INPATIENT MEDICATION' or 'FACILITY-ADMINISTERED MEDICATION':
-                            target_df.at[iter, 'DISCH_MED_BB_METHOD'] = 2
-                        elif all_order_types[order_id] == 'HISTORICAL MEDICATION':
-                            target_df.at[iter, 'DISCH_MED_BB_METHOD'] = 3
-
-                for name in DISCH_MED_ANTIDEP_FLAG_PATTERN:
-                    if name in all_order_items[order_id]:
-                        target_df.at[iter, 'DISCH_MED_ANTIDEP_FLAG'] = 1
-                        if all_order_types[order_id] == 'DISCHARGE PRESCRIPTION' or 'OUTPATIENT PRESCRIPTION':
-                            target_df.at[iter, 'DISCH_MED_ANTIDEP_METHOD'] = 1
-                        elif all_order_types[order_id] == 'INPATIENT MEDICATION' or 'FACILITY-ADMINISTERED MEDICATION':
-                            target_df.at[iter, 'DISCH_MED_ANTIDEP_METHOD'] = 2
-                        elif all_order_types[order_id] == 'HISTORICAL MEDICATION':
-                            target_df.at[iter, 'DISCH_MED_ANTIDEP_METHOD'] = 3
-                for name in DISCH_MED_ACE_ARB_FLAG_PATTERN:
-                    if name in all_order_items[order_id]:
-                        target_df.at[iter, 'DISCH_MED_ACE_ARB_FLAG'] = 1
-                        if all_order_types[order_id] == 'DISCHARGE PRESCRIPTION' or 'OUTPATIENT PRESCRIPTION':
-                            target_df.at[iter, 'DISCH_MED_ACE_ARB_METHOD'] = 1
-                        elif all_order_types[order_id] == 'INPATIENT MEDICATION' or 'FACILITY-ADMINISTERED MEDICATION':
-                            target_df.at[iter, 'DISCH_MED_ACE_ARB_METHOD'] = 2
-                        elif all_order_types[order_id] == 'HISTORICAL MEDICATION':
-                            target_df.at[iter, 'DISCH_MED_ACE_ARB_METHOD'] = 3
-                for name in DISCH_MED_ASPIRIN_FLAG_PATTERN:
-                    if name in all_order_items[order_id]:
-                        target_df.at[iter, 'DISCH_MED_ASPIRIN_FLAG'] = 1
-                        if all_order_types[order_id] == 'DISCHARGE PRESCRIPTION' or 'OUTPATIENT PRESCRIPTION':
-                            target_df.at[iter, 'DISCH_MED_ASPIRIN_METHOD'] = 1
-                        elif all_order_types[order_id] == 'INPATIENT MEDICATION' or 'FACILITY-ADMINISTERED MEDICATION':
-                            target_df.at[iter, 'DISCH_MED_ASPIRIN_METHOD'] = 2
-                        elif all_order_types[order_id] == 'HISTORICAL MEDICATION':
-                            target_df.at[iter, 'DISCH_MED_ASPIRIN_METHOD'] = 3
-
-
-    return target_df
+                    columns['STEMI_FLAG'][position] = 1
+            columns['NSTEMI_FLAG'][position] = 1 if set(CODE) & set(NSTEMI_FLAG_CODE) else 0
+
+    # classes of the medications ordered during the last AMI visit. The order type test of the method was always
+    # true, so the method is 1 whenever the flag is set.
+    last_visit_nos = index_events['LAST_AMI_VISIT_NO']
+    orders = med_orders_df[med_orders_df['VISIT_NO'].isin(last_visit_nos.values)]
+    classes = pd.DataFrame({category: medication_in_class(orders['ITEM'].values, category)
+                            for category in MEDICATION_CATEGORIES}, index=orders['VISIT_NO'].values)
+    classes = classes.groupby(level=0, observed=True).any().reindex(last_visit_nos.values, fill_value=False)
+    classes.index = last_visit_nos.index
+    classes = classes.reindex(pat_ids, fill_value=False)
+    for category in MEDICATION_CATEGORIES:
+        flag = category[:-len('_PATTERN')]
+        columns[flag] = classes[category].values.astype(int)
+        columns[flag[:-len('_FLAG')] + '_METHOD'] = columns[flag]
+
+    return get_section_df(columns, pat_ids)
 
 def DEMOGRAPHICS_ADDITIONS(target_df, visit_df, diagnoses_df):
     '''
@@ -1034,25 +2146,30 @@ def DEMOGRAPHICS_ADDITIONS(target_df, visit_df, diagnoses_df):
     :param target_df:
     :return:
     '''
+    pat_ids = target_df['PERSON_ID'].values
+    columns = {}
 
     # initialize table columns with default values
-    target_df['AGE_AT_ADMIT'] = ['NA'] * len(target_df)
-    target_df['INDEX_ADMISSION_FLAG'] = [1] * len(target_df)
-    target_df['DISCHARGE_LOCATION'] = ['NA'] * len(target_df)
-    target_df['TRANSFER_AT_DISCHARGE_FLAG'] = [0] * len(target_df)
-    target_df['REHAB_FLAG'] = [0] * len(target_df)
+    columns['AGE_AT_ADMIT'] = ['NA'] * len(target_df)
+    columns['INDEX_ADMISSION_FLAG'] = [1] * len(target_df)
+    columns['DISCHARGE_LOCATION'] = ['NA'] * len(target_df)
+    columns['TRANSFER_AT_DISCHARGE_FLAG'] = [0] * len(target_df)
+    columns['REHAB_FLAG'] = [0] * len(target_df)
+
+    admit_dates = target_df['ADMIT_DATE'].values
+    birth_dates = target_df['DOB'].values
+    ami_code_set = set(ACUTE_MYOCARDIAL_INFARCTION_CODE)
 
-    for iter, row in target_df.iterrows():
+    for position, pat_id in enumerate(pat_ids):
         try:
-            target_df.at[iter, 'AGE_AT_ADMIT'] = get_date_diff(row['ADMIT_DATE'], row['DOB'])/365 + 1
+            columns['AGE_AT_ADMIT'][position] = get_date_diff(admit_dates[position], birth_dates[position])/365 + 1
         except:
             pass
 
-        pat_id = row['PERSON_ID']
-        # get the patients all visit rows
-        all_visits_df = diagnoses_df[diagnoses_df['PAT_ID'] == pat_id]
-        ACUTE_MYOCARDIAL_INFARCTION_df = all_visits_df[all_visits_df['CODE'].isin(ACUTE_MYOCARDIAL_INFARCTION_CODE)]
-        all_visit_no = list(ACUTE_MYOCARDIAL_INFARCTION_df['VISIT_NO'].values)
+        # get the patients all AMI visit rows
+        all_visit_no = [visit_no for code, visit_no in zip(get_values_by_key(diagnoses_df, 'PAT_ID', pat_id, 'CODE'),
+                                                           get_values_by_key(diagnoses_df, 'PAT_ID', pat_id, 'VISIT_NO'))
+                        if code in ami_code_set]
         all_adm_dates = [get_one_value_by_foreign_key(visit_df, 'VISIT_NO', vn ,'ADM_DATE') for vn in all_visit_no]
         all_dsch_dates = [get_one_value_by_foreign_key(visit_df, 'VISIT_NO', vn ,'DSCH_DATE') for vn in all_visit_no]
         assert len(all_dsch_dates) == len(all_adm_dates)
@@ -1070,599 +2187,150 @@ def DEMOGRAPHICS_ADDITIONS(target_df, visit_df, diagnoses_df):
             earliest_adm_date, earliest_visit_no = date_pairs[-1]
             last_dsch_date, last_dsch_no = date_pairs[-1]
 
-            target_df.at[iter, 'DISCHARGE_LOCATION'] = get_one_value_by_foreign_key(visit_df, 'DSCH_DATE', last_dsch_date, 'VISIT_TYPE')
-            target_df.at[iter, 'REHAB_FLAG'] = 1 if get_one_value_by_foreign_key(diagnoses_df, 'VISIT_NO', earliest_visit_no, 'CODE') in REHAB_FLAG_CODE else 0
+            columns['DISCHARGE_LOCATION'][position] = get_one_value_by_foreign_key(visit_df, 'DSCH_DATE', last_dsch_date, 'VISIT_TYPE')
+            columns['REHAB_FLAG'][position] = 1 if get_one_value_by_foreign_key(diagnoses_df, 'VISIT_NO', earliest_visit_no, 'CODE') in REHAB_FLAG_CODE else 0
 
-    return target_df
+    return get_section_df(columns, pat_ids)
 
-def PATIENT_HISTORY(target_df, diagnoses_df, visits_df):
+def PATIENT_HISTORY(target_df, diagnoses_df, visits_df, index_events):
     '''
     get patient history features
     :return:
     '''
+    pat_ids = target_df['PERSON_ID'].values
+    columns = {}
     # initialize table columns with default values
-    target_df['HISTORY_CHEST_PAIN_FLAG'] = [0] * len(target_df)
-    target_df['HISTORY_AMI_FLAG'] = [0] * len(target_df)
-    target_df['HISTORY_CABG_FLAG'] = [0] * len(target_df)
-    target_df['HISTORY_PCI_FLAG'] = [0] * len(target_df)
-    target_df['HISTORY_PVD_FLAG'] = [0] * len(target_df)
-    target_df['HISTORY_ANGINA_FLAG'] = [0] * len(target_df)
-    target_df['HISTORY_UNSTABLE_ANGINA_FLAG'] = [0] * len(target_df)
-    target_df['HISTORY_HYPERTENTION_FLAG'] = [0] * len(target_df)
-    target_df['HISTORY_DEPRESSION_FLAG'] = [0] * len(target_df)
-    target_df['FAMILY_DEPRESSION_FLAG'] = [0] * len(target_df)
-    target_df['MAJOR_DEPRESSION_COUNT'] = [0] * len(target_df)
-
-    for iter, row in target_df.iterrows():
-        pat_id = row['PERSON_ID']
-        # get the patients all visit rows
-        all_diagnoses_df = diagnoses_df[diagnoses_df['PAT_ID'] == pat_id]
-        ACUTE_MYOCARDIAL_INFARCTION_df = all_diagnoses_df[all_diagnoses_df['CODE'].isin(ACUTE_MYOCARDIAL_INFARCTION_CODE)]
-        all_adm_dates = list(ACUTE_MYOCARDIAL_INFARCTION_df['ADM_DATE'].values)
-        all_visit_no = list(ACUTE_MYOCARDIAL_INFARCTION_df['VISIT_NO'].values)
-
-        # get the earlist adm and visit_nod
-        if len(all_adm_dates) > 0:
-            date_pairs = list(zip(all_adm_dates,all_visit_no))
-            date_pairs.sort(key=lambda x: time.strptime(x[0], '%m/%d/%Y'))
-            earliest_adm_date, earliest_visit_no = date_pairs[0]
-
-            # compute History_Chest_Pain_Flag
-            chest_pain_dates = []
-            for name in CHEST_PAIN_NAMES:
-                try: # if chest_pain_date is not empty
-                    chest_pain_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE_DESC', name, 'ADM_DATE')
-                except:
-                    chest_pain_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE_DESC', name, 'ADM_DATE')
-            for date in chest_pain_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'HISTORY_CHEST_PAIN_FLAG'] = 1
-
-            # compute History_AMI_Flag
-            AMI_dates = []
-            for code in AMI_FLAG_CODE:
-                try: # if AMI_dates is not empty
-                    AMI_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    AMI_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in AMI_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'HISTORY_AMI_FLAG'] = 1
-
-            CABG_dates = []
-            for code in CABG_FLAG_CODE:
-                try:  # if AMI_dates is not empty
-                    CABG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    CABG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in CABG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'HISTORY_CABG_FLAG'] = 1
-
-            PCI_dates = []
-            for code in PCI_FLAG_CODE:
-                try:  # if AMI_dates is not empty
-                    PCI_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    PCI_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in PCI_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'HISTORY_PCI_FLAG'] = 1
-
-            PVD_dates = []
-            for code in PVD_FLAG_CODE:
-                try:  # if AMI_dates is not empty
-                    PVD_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    PVD_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in PVD_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'HISTORY_PVD_FLAG'] = 1
-
-            ANGINA_dates = []
-            for code in ANGINA_FLAG_CODE:
-                try:  # if AMI_dates is not empty
-                    ANGINA_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    ANGINA_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in ANGINA_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'HISTORY_ANGINA_FLAG'] = 1
-
-
-            UNSTABLE_ANGINA_dates = []
-            for code in UNSTABLE_ANGINA_FLAG_CODE:
-                try:  # if AMI_dates is not empty
-                    UNSTABLE_ANGINA_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    UNSTABLE_ANGINA_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in UNSTABLE_ANGINA_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'HISTORY_UNSTABLE_ANGINA_FLAG'] = 1
-
-            HYPERTENSION_dates = []
-            for code in HYPERTENSION_FLAG_CODE:
-                try:  # if AMI_dates is not empty
-                    HYPERTENSION_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    HYPERTENSION_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in HYPERTENSION_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'HISTORY_HYPERTENSION_FLAG'] = 1
-
-            DEPRESSION_dates = []
-            for code in DEPRESSION_FLAG_CODE:
-                try:  # if AMI_dates is not empty
-                    DEPRESSION_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    DEPRESSION_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in DEPRESSION_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'HISTORY_DEPRESSION_FLAG'] = 1
-                    target_df.at[iter, 'MAJOR_DEPRESSION_COUNT'] += 1
-
-            # compute Family_Depression_Flag
-            family_depression_dates = []
-            for code in FAMILY_DEPRESSION_CODE:
-                try:  # if family_depression_dates is not empty
-                    family_depression_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    family_depression_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in family_depression_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'FAMILY_DEPRESSION_FLAG'] = 1
-
-    return target_df
-
-def IN_HOSPITAL_OUTCOMES(target_df, diagnoses_df, procedures_df):
+    columns['HISTORY_CHEST_PAIN_FLAG'] = [0] * len(target_df)
+    columns['HISTORY_AMI_FLAG'] = [0] * len(target_df)
+    columns['HISTORY_CABG_FLAG'] = [0] * len(target_df)
+    columns['HISTORY_PCI_FLAG'] = [0] * len(target_df)
+    columns['HISTORY_PVD_FLAG'] = [0] * len(target_df)
+    columns['HISTORY_ANGINA_FLAG'] = [0] * len(target_df)
+    columns['HISTORY_UNSTABLE_ANGINA_FLAG'] = [0] * len(target_df)
+    columns['HISTORY_HYPERTENTION_FLAG'] = [0] * len(target_df)
+    columns['HISTORY_DEPRESSION_FLAG'] = [0] * len(target_df)
+    columns['FAMILY_DEPRESSION_FLAG'] = [0] * len(target_df)
+    columns['MAJOR_DEPRESSION_COUNT'] = [0] * len(target_df)
+
+    # evaluate all the flags together
+    flags = evaluate_flag_specs(PATIENT_HISTORY_FLAGS, diagnoses_df, index_events)\
+        .reindex(pat_ids, fill_value=0)
+    for flag_spec in PATIENT_HISTORY_FLAGS:
+        if flag_spec['column'] in columns:
+            columns[flag_spec['column']] = flags[flag_spec['column']].values
+
+    # HISTORY_HYPERTENSION_FLAG is only added once a patient has it, and is empty for the others
+    if flags['HISTORY_HYPERTENSION_FLAG'].any():
+        columns['HISTORY_HYPERTENSION_FLAG'] = np.where(flags['HISTORY_HYPERTENSION_FLAG'].values > 0, 1.0, np.nan)
+
+    return get_section_df(columns, pat_ids)
+
+def IN_HOSPITAL_OUTCOMES(target_df, diagnoses_df, procedures_df, index_events):
     '''
     get in-hospital outcomes features
     :return:
     '''
+    pat_ids = target_df['PERSON_ID'].values
+    columns = {}
     # initialize table columns with default values
-    target_df['ECHOCARDIOGRAPHY_FLAG'] = [0] * len(target_df)
-    target_df['IN_HOSPITAL_HF_FLAG'] = [0] * len(target_df)
-    target_df['IN_HOSPITAL_ISCHEMIA_FLAG'] = [0] * len(target_df)
-    target_df['CARDIAC_PROCEDURE_FLAG'] = [0] * len(target_df)
-
-    for iter, row in target_df.iterrows():
-        pat_id = row['PERSON_ID']
-        # get the patients all visit rows
-        all_diagnoses_df = diagnoses_df[diagnoses_df['PAT_ID'] == pat_id]
-        ACUTE_MYOCARDIAL_INFARCTION_df = all_diagnoses_df[all_diagnoses_df['CODE'].isin(ACUTE_MYOCARDIAL_INFARCTION_CODE)]
-        all_adm_dates = list(ACUTE_MYOCARDIAL_INFARCTION_df['ADM_DATE'].values)
-        all_visit_no = list(ACUTE_MYOCARDIAL_INFARCTION_df['VISIT_NO'].values)
-
-        # get the earlist adm and visit_nod
-        if len(all_adm_dates) > 0:
-            date_pairs = list(zip(all_adm_dates,all_visit_no))
-            date_pairs.sort(key=lambda x: time.strptime(x[0], '%m/%d/%Y'))
-            earliest_adm_date, earliest_visit_no = date_pairs[0]
-
-            # get ECHOCARDIOGRAPHY_FLAG
-            procedure_codes = get_values_by_foreign_key(procedures_df, 'VISIT_NO', earliest_visit_no,'CODE_DESC')
-            target_df.at[iter, 'ECHOCARDIOGRAPHY_FLAG'] = 1 if set(procedure_codes) & set(ECHOCARDIOGRAPHY_CODE) else 0
-
-            diagnoses_codes = get_values_by_foreign_key(all_diagnoses_df, 'VISIT_NO', earliest_visit_no,'CODE')
-            target_df.at[iter, 'IN_HOSPITAL_HF_FLAG'] = 1 if set(diagnoses_codes) & set(IN_HOSPITAL_HF_CODE) else 0
-            target_df.at[iter, 'IN_HOSPITAL_ISCHEMIA_FLAG'] = 1 if set(diagnoses_codes) & set(IN_HOSPITAL_ISCHEMIA_CODE) else 0
-
-            for pattern in CARDIAC_PROCEDURE_FLAG_PATTERN:
-                matcher = re.compile(pattern)
-                for code in procedure_codes:
-                    if matcher.match(code):
-                        target_df.at[iter, 'CARDIAC_PROCEDURE_FLAG'] = 1
-
-    return target_df
-
-def COMORBIDITIES(target_df):
+    columns['ECHOCARDIOGRAPHY_FLAG'] = [0] * len(target_df)
+    columns['IN_HOSPITAL_HF_FLAG'] = [0] * len(target_df)
+    columns['IN_HOSPITAL_ISCHEMIA_FLAG'] = [0] * len(target_df)
+    columns['CARDIAC_PROCEDURE_FLAG'] = [0] * len(target_df)
+
+    # classify the procedures and diagnoses of the index visit; procedures are looked up by visit number only
+    procedures = get_index_visit_categories(procedures_df, 'CODE_DESC',
+                                            ['ECHOCARDIOGRAPHY_CODE', 'CARDIAC_PROCEDURE_FLAG_PATTERN'],
+                                            index_events, same_patient=False)\
+        .reindex(pat_ids, fill_value=0)
+    diagnoses = get_index_visit_categories(diagnoses_df, 'CODE', ['IN_HOSPITAL_HF_CODE', 'IN_HOSPITAL_ISCHEMIA_CODE'],
+                                           index_events)\
+        .reindex(pat_ids, fill_value=0)
+
+    columns['ECHOCARDIOGRAPHY_FLAG'] = procedures['ECHOCARDIOGRAPHY_CODE'].values
+    columns['IN_HOSPITAL_HF_FLAG'] = diagnoses['IN_HOSPITAL_HF_CODE'].values
+    columns['IN_HOSPITAL_ISCHEMIA_FLAG'] = diagnoses['IN_HOSPITAL_ISCHEMIA_CODE'].values
+    columns['CARDIAC_PROCEDURE_FLAG'] = procedures['CARDIAC_PROCEDURE_FLAG_PATTERN'].values
+
+    return get_section_df(columns, pat_ids)
+
+def COMORBIDITIES(target_df, diagnoses_df, index_events):
     '''
     get comorbidities features
     :param target_df:
     :return:
     '''
+    pat_ids = target_df['PERSON_ID'].values
+    columns = {}
     # initialize table columns with default values
-    target_df['AGE_80_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_ARRHYTHMIA_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_ANEMIA_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_HYPERTENSION_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_COPD_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_CKD_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_STROKE_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_TOBACCO_USE_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_DEPRESSION_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_HYPERCHOLESTEROLEMIA_FLAG'] = [0] * len(target_df)
-
-    target_df['COMORBID_CAD_FLAG'] = [0] * len(target_df)
-    target_df['PRIOR_REVASCULARIZATION_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_DIABETES_CC_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_DIABETES_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_CHF_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_MI_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_PERIPHERAL_VASCULAR_DISEASE_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_CEREBROVASCULAR_DISEASE_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_DEMENTIA_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_CHRONIC_PULMONARY_DISEASE_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_RHEUMATOLOGIC_DISEASE_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_PEPTIC_ULCER_DISEASE_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_MILD_LIVER_DISEASE_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_RENAL_DISEASE_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_MODERATE_OR_SEVERE_LIVER_DISEASE_FLAG'] = [0] * len(target_df)
-    target_df['COMORBID_AIDS_FLAG'] = [0] * len(target_df)
-
-    for iter, row in target_df.iterrows():
-        pat_id = row['PERSON_ID']
-        # get the patients all visit rows
-        all_diagnoses_df = diagnoses_df[diagnoses_df['PAT_ID'] == pat_id]
-        ACUTE_MYOCARDIAL_INFARCTION_df = all_diagnoses_df[
-            all_diagnoses_df['CODE'].isin(ACUTE_MYOCARDIAL_INFARCTION_CODE)]
-        all_adm_dates = list(ACUTE_MYOCARDIAL_INFARCTION_df['ADM_DATE'].values)
-        all_visit_no = list(ACUTE_MYOCARDIAL_INFARCTION_df['VISIT_NO'].values)
-
-        # get the earlist adm and visit_nod
-        if len(all_adm_dates) > 0:
-            date_pairs = list(zip(all_adm_dates, all_visit_no))
-            date_pairs.sort(key=lambda x: time.strptime(x[0], '%m/%d/%Y'))
-            earliest_adm_date, earliest_visit_no = date_pairs[0]
-
-            diagnoses_codes = get_values_by_foreign_key(all_diagnoses_df, 'VISIT_NO', earliest_visit_no, 'CODE')
-
-            COMORBID_ARRHYTHMIA_FLAG_dates = []
-            COMORBID_ARRHYTHMIA_FLAG_CODE = []
-            for pattern in COMORBID_ARRHYTHMIA_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        COMORBID_ARRHYTHMIA_FLAG_CODE.append(code)
-            for code in COMORBID_ARRHYTHMIA_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_ARRHYTHMIA_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    COMORBID_ARRHYTHMIA_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in COMORBID_ARRHYTHMIA_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_ARRHYTHMIA_FLAG'] = 1
-
-            COMORBID_ANEMIA_FLAG_dates = []
-            COMORBID_ANEMIA_FLAG_CODE = []
-            for pattern in COMORBID_ANEMIA_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        COMORBID_ANEMIA_FLAG_CODE.append(code)
-            for code in COMORBID_ANEMIA_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_ANEMIA_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    COMORBID_ANEMIA_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in COMORBID_ANEMIA_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_ANEMIA_FLAG'] = 1
-
-
-            COMORBID_HYPERTENSION_FLAG_dates = []
-            COMORBID_HYPERTENSION_FLAG_CODE = []
-            for pattern in COMORBID_HYPERTENSION_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        COMORBID_HYPERTENSION_FLAG_CODE.append(code)
-            for code in COMORBID_HYPERTENSION_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_HYPERTENSION_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    COMORBID_HYPERTENSION_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in COMORBID_HYPERTENSION_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_HYPERTENSION_FLAG'] = 1
-
-            COMORBID_COPD_FLAG_dates = []
-            COMORBID_COPD_FLAG_CODE = []
-            for pattern in COMORBID_COPD_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        COMORBID_COPD_FLAG_CODE.append(code)
-            for code in COMORBID_COPD_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_COPD_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    COMORBID_COPD_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in COMORBID_COPD_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_COPD_FLAG'] = 1
-                    target_df.at[iter, 'COMORBID_CHRONIC_PULMONARY_DISEASE_FLAG'] = 1
-
-
-            COMORBID_CKD_FLAG_dates = []
-            COMORBID_CKD_FLAG_CODE = []
-            for pattern in COMORBID_CKD_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        COMORBID_CKD_FLAG_CODE.append(code)
-            for code in COMORBID_CKD_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_CKD_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    COMORBID_CKD_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in COMORBID_CKD_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_CKD_FLAG'] = 1
-
-
-            COMORBID_STROKE_FLAG_dates = []
-            COMORBID_STROKE_FLAG_CODE = []
-            for pattern in COMORBID_STROKE_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        COMORBID_STROKE_FLAG_CODE.append(code)
-            for code in COMORBID_STROKE_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_STROKE_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    COMORBID_STROKE_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in COMORBID_STROKE_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_STROKE_FLAG'] = 1
-                    target_df.at[iter, 'COMORBID_CEREBROVASCULAR_DISEASE_FLAG'] = 1
-
-            COMORBID_TOBACCO_USE_FLAG_dates = []
-            for code in COMORBID_TOBACCO_USE_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_TOBACCO_USE_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    COMORBID_TOBACCO_USE_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in COMORBID_TOBACCO_USE_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_TOBACCO_USE_FLAG'] = 1
-
-            COMORBID_DEPRESSION_FLAG_dates = []
-            for code in COMORBID_DEPRESSION_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_DEPRESSION_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code,'ADM_DATE')
-                except:
-                    COMORBID_DEPRESSION_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code,'ADM_DATE')
-            for date in COMORBID_DEPRESSION_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_DEPRESSION_FLAG'] = 1
-
-            COMORBID_HYPERCHOLESTEROLEMIA_FLAG_dates = []
-            COMORBID_HYPERCHOLESTEROLEMIA_FLAG_CODE = []
-            for pattern in COMORBID_HYPERCHOLESTEROLEMIA_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        COMORBID_HYPERCHOLESTEROLEMIA_FLAG_CODE.append(code)
-            for code in COMORBID_HYPERCHOLESTEROLEMIA_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_HYPERCHOLESTEROLEMIA_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    COMORBID_HYPERCHOLESTEROLEMIA_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in COMORBID_HYPERCHOLESTEROLEMIA_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_HYPERCHOLESTEROLEMIA_FLAG'] = 1
-
-
-            COMORBID_CAD_FLAG_dates = []
-            COMORBID_CAD_FLAG_CODE = []
-            for pattern in COMORBID_CAD_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        COMORBID_CAD_FLAG_CODE.append(code)
-            for code in COMORBID_CAD_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_CAD_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    COMORBID_CAD_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in COMORBID_CAD_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_CAD_FLAG'] = 1
-                    target_df.at[iter, 'COMORBID_MI_FLAG'] = 1
-
-            PRIOR_REVASCULARIZATION_FLAG_dates = []
-            PRIOR_REVASCULARIZATION_FLAG_CODE = []
-            for pattern in PRIOR_REVASCULARIZATION_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        PRIOR_REVASCULARIZATION_FLAG_CODE.append(code)
-            for code in PRIOR_REVASCULARIZATION_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    PRIOR_REVASCULARIZATION_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    PRIOR_REVASCULARIZATION_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in PRIOR_REVASCULARIZATION_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'PRIOR_REVASCULARIZATION_FLAG'] = 1
-
-            COMORBID_DIABETES_CC_FLAG_dates = []
-            COMORBID_DIABETES_CC_FLAG_CODE = []
-            for pattern in COMORBID_DIABETES_CC_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        COMORBID_DIABETES_CC_FLAG_CODE.append(code)
-            for code in COMORBID_DIABETES_CC_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_DIABETES_CC_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    COMORBID_DIABETES_CC_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in COMORBID_DIABETES_CC_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_DIABETES_CC_FLAG'] = 1
-                    target_df.at[iter, 'COMORBID_DIABETES_FLAG'] = 1
-
-            COMORBID_CHF_FLAG_dates = []
-            for code in COMORBID_CHF_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_CHF_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code,'ADM_DATE')
-                except:
-                    COMORBID_CHF_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code,'ADM_DATE')
-            for date in COMORBID_CHF_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_CHF_FLAG'] = 1
-
-            COMORBID_PERIPHERAL_VASCULAR_DISEASE_FLAG_dates = []
-            for code in COMORBID_PERIPHERAL_VASCULAR_DISEASE_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_PERIPHERAL_VASCULAR_DISEASE_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    COMORBID_PERIPHERAL_VASCULAR_DISEASE_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in COMORBID_PERIPHERAL_VASCULAR_DISEASE_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_PERIPHERAL_VASCULAR_DISEASE_FLAG'] = 1
-
-            COMORBID_DEMENTIA_FLAG_dates = []
-            COMORBID_DEMENTIA_FLAG_CODE = []
-            for pattern in COMORBID_DEMENTIA_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        COMORBID_DEMENTIA_FLAG_CODE.append(code)
-            for code in COMORBID_DEMENTIA_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_DEMENTIA_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code,'ADM_DATE')
-                except:
-                    COMORBID_DEMENTIA_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code,'ADM_DATE')
-            for date in COMORBID_DEMENTIA_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_DEMENTIA_FLAG'] = 1
-
-            COMORBID_RHEUMATOLOGIC_DISEASE_FLAG_dates = []
-            COMORBID_RHEUMATOLOGIC_DISEASE_FLAG_CODE = []
-            for pattern in COMORBID_RHEUMATOLOGIC_DISEASE_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        COMORBID_RHEUMATOLOGIC_DISEASE_FLAG_CODE.append(code)
-            for code in COMORBID_RHEUMATOLOGIC_DISEASE_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_RHEUMATOLOGIC_DISEASE_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code,'ADM_DATE')
-                except:
-                    COMORBID_RHEUMATOLOGIC_DISEASE_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in COMORBID_RHEUMATOLOGIC_DISEASE_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_RHEUMATOLOGIC_DISEASE_FLAG'] = 1
-
-            COMORBID_PEPTIC_ULCER_DISEASE_FLAG_dates = []
-            COMORBID_PEPTIC_ULCER_DISEASE_FLAG_CODE = []
-            for pattern in COMORBID_PEPTIC_ULCER_DISEASE_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        COMORBID_PEPTIC_ULCER_DISEASE_FLAG_CODE.append(code)
-            for code in COMORBID_PEPTIC_ULCER_DISEASE_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_PEPTIC_ULCER_DISEASE_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE',code, 'ADM_DATE')
-                except:
-                    COMORBID_PEPTIC_ULCER_DISEASE_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE',code, 'ADM_DATE')
-            for date in COMORBID_PEPTIC_ULCER_DISEASE_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_PEPTIC_ULCER_DISEASE_FLAG'] = 1
-
-            COMORBID_MILD_LIVER_DISEASE_FLAG_dates = []
-            COMORBID_MILD_LIVER_DISEASE_FLAG_CODE = []
-            for pattern in COMORBID_MILD_LIVER_DISEASE_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        COMORBID_MILD_LIVER_DISEASE_FLAG_CODE.append(code)
-            for code in COMORBID_MILD_LIVER_DISEASE_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_MILD_LIVER_DISEASE_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE',code, 'ADM_DATE')
-                except:
-                    COMORBID_MILD_LIVER_DISEASE_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code,'ADM_DATE')
-            for date in COMORBID_MILD_LIVER_DISEASE_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_MILD_LIVER_DISEASE_FLAG'] = 1
-                    target_df.at[iter, 'COMORBID_MODERATE_OR_SEVERE_LIVER_DISEASE_FLAG'] = 1
-
-            COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG_dates = []
-            COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG_CODE = []
-            for pattern in COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG_CODE.append(code)
-            for code in COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code,'ADM_DATE')
-                except:
-                    COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code,'ADM_DATE')
-            for date in COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG'] = 1
-
-            COMORBID_RENAL_DISEASE_FLAG_dates = []
-            COMORBID_RENAL_DISEASE_FLAG_CODE = []
-            for pattern in COMORBID_RENAL_DISEASE_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        COMORBID_RENAL_DISEASE_FLAG_CODE.append(code)
-            for code in COMORBID_RENAL_DISEASE_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_RENAL_DISEASE_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE',code, 'ADM_DATE')
-                except:
-                    COMORBID_RENAL_DISEASE_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE',code, 'ADM_DATE')
-            for date in COMORBID_RENAL_DISEASE_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_RENAL_DISEASE_FLAG'] = 1
-
-            COMORBID_AIDS_FLAG_dates = []
-            COMORBID_AIDS_FLAG_CODE = []
-            for pattern in COMORBID_AIDS_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        COMORBID_AIDS_FLAG_CODE.append(code)
-            for code in COMORBID_AIDS_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    COMORBID_AIDS_FLAG_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code,'ADM_DATE')
-                except:
-                    COMORBID_AIDS_FLAG_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code,'ADM_DATE')
-            for date in COMORBID_AIDS_FLAG_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'COMORBID_AIDS_FLAG'] = 1
-
-
-    target_df['COMORBID_DIABETES_CC_FLAG_SCORE'] = target_df['COMORBID_DIABETES_CC_FLAG'] * 2
-    target_df['COMORBID_DIABETES_FLAG_SCORE'] = target_df['COMORBID_DIABETES_FLAG']
-    target_df['COMORBID_CHF_FLAG_SCORE'] = target_df['COMORBID_CHF_FLAG']
-    target_df['COMORBID_MI_FLAG_SCORE'] = target_df['COMORBID_MI_FLAG']
-    target_df['COMORBID_PERIPHERAL_VASCULAR_DISEASE_FLAG_SCORE'] = target_df['COMORBID_PERIPHERAL_VASCULAR_DISEASE_FLAG']
-    target_df['COMORBID_CEREBROVASCULAR_DISEASE_FLAG_SCORE'] = target_df['COMORBID_CEREBROVASCULAR_DISEASE_FLAG']
-    target_df['COMORBID_DEMENTIA_FLAG_SCORE'] = target_df['COMORBID_DEMENTIA_FLAG']
-    target_df['COMORBID_CHRONIC_PULMONARY_DISEASE_FLAG_SCORE'] = target_df['COMORBID_CHRONIC_PULMONARY_DISEASE_FLAG']
-    target_df['COMORBID_RHEUMATOLOGIC_DISEASE_FLAG_SCORE'] = target_df['COMORBID_RHEUMATOLOGIC_DISEASE_FLAG']
-    target_df['COMORBID_PEPTIC_ULCER_DISEASE_FLAG_SCORE'] = target_df['COMORBID_PEPTIC_ULCER_DISEASE_FLAG']
-    target_df['COMORBID_MILD_LIVER_DISEASE_FLAG_SCORE'] = target_df['COMORBID_MILD_LIVER_DISEASE_FLAG']
-    target_df['COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG_SCORE'] = target_df['COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG'] * 2
-    target_df['COMORBID_RENAL_DISEASE_FLAG_SCORE'] = target_df['COMORBID_RENAL_DISEASE_FLAG'] * 2
-    target_df['COMORBID_MODERATE_OR_SEVERE_LIVER_DISEASE_FLAG_SCORE'] = target_df['COMORBID_MODERATE_OR_SEVERE_LIVER_DISEASE_FLAG'] * 3
-    target_df['COMORBID_AIDS_FLAG_SCORE'] = target_df['COMORBID_AIDS_FLAG'] * 6
-
-    target_df['CHARLSON_DEYO_SCORE'] = target_df['COMORBID_DIABETES_CC_FLAG_SCORE'] + \
-                                       target_df['COMORBID_DIABETES_FLAG_SCORE'] + \
-                                       target_df['COMORBID_CHF_FLAG_SCORE'] + \
-                                       target_df['COMORBID_MI_FLAG_SCORE'] + \
-                                       target_df['COMORBID_PERIPHERAL_VASCULAR_DISEASE_FLAG_SCORE'] + \
-                                       target_df['COMORBID_CEREBROVASCULAR_DISEASE_FLAG_SCORE'] + \
-                                       target_df['COMORBID_DEMENTIA_FLAG_SCORE'] + \
-                                       target_df['COMORBID_CHRONIC_PULMONARY_DISEASE_FLAG_SCORE'] + \
-                                       target_df['COMORBID_RHEUMATOLOGIC_DISEASE_FLAG_SCORE'] + \
-                                       target_df['COMORBID_PEPTIC_ULCER_DISEASE_FLAG_SCORE'] + \
-                                       target_df['COMORBID_MILD_LIVER_DISEASE_FLAG_SCORE'] + \
-                                       target_df['COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG_SCORE'] + \
-                                       target_df['COMORBID_RENAL_DISEASE_FLAG_SCORE'] + \
-                                       target_df['COMORBID_MODERATE_OR_SEVERE_LIVER_DISEASE_FLAG_SCORE'] + \
-                                       target_df['COMORBID_AIDS_FLAG_SCORE']
-
-    return target_df
+    columns['AGE_80_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_ARRHYTHMIA_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_ANEMIA_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_HYPERTENSION_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_COPD_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_CKD_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_STROKE_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_TOBACCO_USE_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_DEPRESSION_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_HYPERCHOLESTEROLEMIA_FLAG'] = [0] * len(target_df)
+
+    columns['COMORBID_CAD_FLAG'] = [0] * len(target_df)
+    columns['PRIOR_REVASCULARIZATION_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_DIABETES_CC_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_DIABETES_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_CHF_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_MI_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_PERIPHERAL_VASCULAR_DISEASE_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_CEREBROVASCULAR_DISEASE_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_DEMENTIA_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_CHRONIC_PULMONARY_DISEASE_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_RHEUMATOLOGIC_DISEASE_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_PEPTIC_ULCER_DISEASE_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_MILD_LIVER_DISEASE_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_RENAL_DISEASE_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_MODERATE_OR_SEVERE_LIVER_DISEASE_FLAG'] = [0] * len(target_df)
+    columns['COMORBID_AIDS_FLAG'] = [0] * len(target_df)
+
+    # evaluate all the flags together
+    flags = evaluate_flag_specs(COMORBIDITY_FLAGS, diagnoses_df, index_events)\
+        .reindex(pat_ids, fill_value=0)
+    for flag_spec in COMORBIDITY_FLAGS:
+        columns[flag_spec['column']] = flags[flag_spec['column']].values
+
+    columns['COMORBID_DIABETES_CC_FLAG_SCORE'] = columns['COMORBID_DIABETES_CC_FLAG'] * 2
+    columns['COMORBID_DIABETES_FLAG_SCORE'] = columns['COMORBID_DIABETES_FLAG']
+    columns['COMORBID_CHF_FLAG_SCORE'] = columns['COMORBID_CHF_FLAG']
+    columns['COMORBID_MI_FLAG_SCORE'] = columns['COMORBID_MI_FLAG']
+    columns['COMORBID_PERIPHERAL_VASCULAR_DISEASE_FLAG_SCORE'] = columns['COMORBID_PERIPHERAL_VASCULAR_DISEASE_FLAG']
+    columns['COMORBID_CEREBROVASCULAR_DISEASE_FLAG_SCORE'] = columns['COMORBID_CEREBROVASCULAR_DISEASE_FLAG']
+    columns['COMORBID_DEMENTIA_FLAG_SCORE'] = columns['COMORBID_DEMENTIA_FLAG']
+    columns['COMORBID_CHRONIC_PULMONARY_DISEASE_FLAG_SCORE'] = columns['COMORBID_CHRONIC_PULMONARY_DISEASE_FLAG']
+    columns['COMORBID_RHEUMATOLOGIC_DISEASE_FLAG_SCORE'] = columns['COMORBID_RHEUMATOLOGIC_DISEASE_FLAG']
+    columns['COMORBID_PEPTIC_ULCER_DISEASE_FLAG_SCORE'] = columns['COMORBID_PEPTIC_ULCER_DISEASE_FLAG']
+    columns['COMORBID_MILD_LIVER_DISEASE_FLAG_SCORE'] = columns['COMORBID_MILD_LIVER_DISEASE_FLAG']
+    columns['COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG_SCORE'] = columns['COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG'] * 2
+    columns['COMORBID_RENAL_DISEASE_FLAG_SCORE'] = columns['COMORBID_RENAL_DISEASE_FLAG'] * 2
+    columns['COMORBID_MODERATE_OR_SEVERE_LIVER_DISEASE_FLAG_SCORE'] = columns['COMORBID_MODERATE_OR_SEVERE_LIVER_DISEASE_FLAG'] * 3
+    columns['COMORBID_AIDS_FLAG_SCORE'] = columns['COMORBID_AIDS_FLAG'] * 6
+
+    columns['CHARLSON_DEYO_SCORE'] = columns['COMORBID_DIABETES_CC_FLAG_SCORE'] + \
+                                       columns['COMORBID_DIABETES_FLAG_SCORE'] + \
+                                       columns['COMORBID_CHF_FLAG_SCORE'] + \
+                                       columns['COMORBID_MI_FLAG_SCORE'] + \
+                                       columns['COMORBID_PERIPHERAL_VASCULAR_DISEASE_FLAG_SCORE'] + \
+                                       columns['COMORBID_CEREBROVASCULAR_DISEASE_FLAG_SCORE'] + \
+                                       columns['COMORBID_DEMENTIA_FLAG_SCORE'] + \
+                                       columns['COMORBID_CHRONIC_PULMONARY_DISEASE_FLAG_SCORE'] + \
+                                       columns['COMORBID_RHEUMATOLOGIC_DISEASE_FLAG_SCORE'] + \
+                                       columns['COMORBID_PEPTIC_ULCER_DISEASE_FLAG_SCORE'] + \
+                                       columns['COMORBID_MILD_LIVER_DISEASE_FLAG_SCORE'] + \
+                                       columns['COMORBID_HEMIPLEGIA_OR_PARAPLEGIA_FLAG_SCORE'] + \
+                                       columns['COMORBID_RENAL_DISEASE_FLAG_SCORE'] + \
+                                       columns['COMORBID_MODERATE_OR_SEVERE_LIVER_DISEASE_FLAG_SCORE'] + \
+                                       columns['COMORBID_AIDS_FLAG_SCORE']
+
+    return get_section_df(columns, pat_ids)
 
 def LACE_SCORE(target_df):
     '''
@@ -1670,341 +2338,154 @@ def LACE_SCORE(target_df):
     :param target_df:
     :return:
     '''
+    pat_ids = target_df['PERSON_ID'].values
 
-    target_df['LACE_ACUITY_SCORE'] = [0] * len(target_df)
-    target_df['LACE_LOS_SCORE'] = [0] * len(target_df)
-    target_df['LACE_CHARLSON_SCORE'] = [0] * len(target_df)
-    target_df['LACE_ED_SCORE'] = [0] * len(target_df)
-    target_df['LACE_SCORE'] = [0] * len(target_df)
-
-
-    for iter, row in target_df.iterrows():
-        pat_id = row['PERSON_ID']
-        # get the patients all visit rows
-        all_diagnoses_df = diagnoses_df[diagnoses_df['PAT_ID'] == pat_id]
-        ACUTE_MYOCARDIAL_INFARCTION_df = all_diagnoses_df[
-            all_diagnoses_df['CODE'].isin(ACUTE_MYOCARDIAL_INFARCTION_CODE)]
-        all_adm_dates = list(ACUTE_MYOCARDIAL_INFARCTION_df['ADM_DATE'].values)
-        all_visit_no = list(ACUTE_MYOCARDIAL_INFARCTION_df['VISIT_NO'].values)
-
-        # get the earlist adm and visit_nod
-        if len(all_adm_dates) > 0:
-            date_pairs = list(zip(all_adm_dates, all_visit_no))
-            date_pairs.sort(key=lambda x: time.strptime(x[0], '%m/%d/%Y'))
-            earliest_adm_date, earliest_visit_no = date_pairs[0]
-
-        target_df.at[iter, 'LACE_ACUITY_SCORE'] = target_df.at[iter, 'NONELECTIVE_ADMISSION_FLAG'] *3
-
-        # compute Lace LOS SCORE
-        if 0 < target_df.at[iter,'LOS'] <= 1:
-            target_df.at[iter, 'LACE_LOS_SCORE'] = 1
-        elif 1 < target_df.at[iter,'LOS']<= 2:
-            target_df.at[iter, 'LACE_LOS_SCORE'] = 2
-        elif 2 < target_df.at[iter,'LOS'] <= 3:
-            target_df.at[iter, 'LACE_LOS_SCORE'] = 3
-        elif 3 < target_df.at[iter,'LOS'] <= 6:
-            target_df.at[iter, 'LACE_LOS_SCORE'] = 4
-        elif 6 < target_df.at[iter,'LOS'] <= 13:
-            target_df.at[iter, 'LACE_LOS_SCORE'] = 5
-        elif 13 < target_df.at[iter,'LOS']:
-            target_df.at[iter, 'LACE_LOS_SCORE'] = 7
-
-        # compute LACE_CHARLSON_SCORE
-        target_df.at[iter, 'LACE_CHARLSON_SCORE'] = target_df.at[iter, 'CHARLSON_DEYO_SCORE']
-        if target_df.at[iter, 'LACE_CHARLSON_SCORE'] >= 4:
-            target_df.at[iter, 'LACE_CHARLSON_SCORE'] = 5
-
-        target_df.at[iter, 'LACE_ED_SCORE'] = target_df.at[iter, 'ED_VISIT_PRIOR_180_DAYS_COUNT']
-        if target_df.at[iter, 'LACE_ED_SCORE'] >= 4:
-            target_df.at[iter, 'LACE_ED_SCORE'] = 4
-
-        target_df.at[iter, 'LACE_SCORE'] = target_df.at[iter, 'LACE_ACUITY_SCORE'] + target_df.at[iter, 'LACE_LOS_SCORE'] \
-                                        + target_df.at[iter, 'LACE_CHARLSON_SCORE'] + target_df.at[iter, 'LACE_ED_SCORE']
+    # score the features of the earlier sections
+    columns = evaluate_score_table(LACE_SCORE_TABLE, target_df)
+    columns['LACE_SCORE'] = sum(columns.values())
 
-    return target_df
+    return get_section_df(columns, pat_ids)
 
-def ENRICHD_SCORE(target_df, diagnoses_df):
+def ENRICHD_SCORE(target_df, diagnoses_df, index_events):
     '''
     get ENRICHD score features
     :param target_df:
     :return:
     '''
-
-    target_df['KILLIP_CLASS'] = ['NA'] * len(target_df)
-    target_df['LVEF_FLAG'] = [0] * len(target_df)
-    target_df['POST_MI_CABG_FLAG'] = [0] * len(target_df)
-    target_df['CHF_FLAG'] = [0] * len(target_df)
-    target_df['HISTORY_STROKE_FLAG'] = [0] * len(target_df)
-
-    for iter, row in target_df.iterrows():
-        pat_id = row['PERSON_ID']
-        # get the patients all visit rows
-        all_diagnoses_df = diagnoses_df[diagnoses_df['PAT_ID'] == pat_id]
-        ACUTE_MYOCARDIAL_INFARCTION_df = all_diagnoses_df[
-            all_diagnoses_df['CODE'].isin(ACUTE_MYOCARDIAL_INFARCTION_CODE)]
-        all_adm_dates = list(ACUTE_MYOCARDIAL_INFARCTION_df['ADM_DATE'].values)
-        all_visit_no = list(ACUTE_MYOCARDIAL_INFARCTION_df['VISIT_NO'].values)
-
-        # get the earlist adm and visit_nod
-        if len(all_adm_dates) > 0:
-            date_pairs = list(zip(all_adm_dates, all_visit_no))
-            date_pairs.sort(key=lambda x: time.strptime(x[0], '%m/%d/%Y'))
-            earliest_adm_date, earliest_visit_no = date_pairs[0]
-
-            KILLIP_CLASS_dates = []
-            for code in KILLIP_CLASS_CODE_I:
-                try:  # if chest_pain_date is not empty
-                    KILLIP_CLASS_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    KILLIP_CLASS_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in KILLIP_CLASS_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'KILLIP_CLASS'] = 'I'
-
-            diagnoses_codes = get_values_by_foreign_key(all_diagnoses_df, 'VISIT_NO', earliest_visit_no, 'CODE')
-            if set(diagnoses_codes) & set(KILLIP_CLASS_CODE_II):
-                target_df.at[iter,'KILLIP_CLASS'] = 'II'
-            if set(diagnoses_codes) & set(KILLIP_CLASS_CODE_III):
-                target_df.at[iter,'KILLIP_CLASS'] = 'III'
-            if set(diagnoses_codes) & set(KILLIP_CLASS_CODE_IV):
-                target_df.at[iter,'KILLIP_CLASS'] = 'IV'
-
-            target_df.at[iter,'LVEF_FLAG'] = 1 if set(diagnoses_codes) & set(LVEF_CODE) else 0
-
-            post1,post2 = False, False
-            if set(diagnoses_codes) & set(POST_MI_CABG_FLAG_CODE1):
-                post1 = True
-            for pattern in POST_MI_CABG_FLAG_PATTERN2:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        post2 = True
-            target_df.at[iter,'POST_MI_CABG_FLAG'] = 1 if (post1 and post2) else 0
-
-            CHF_dates = []
-            for code in CHF_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    CHF_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    CHF_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in CHF_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'CHF_FLAG'] = 1
-
-            HISTORY_STROKE_dates = []
-            HISTORY_STROKE_FLAG_CODE = []
-            for pattern in HISTORY_STROKE_FLAG_PATTERN:
-                matcher = re.compile(pattern)
-                for code in diagnoses_codes:
-                    if matcher.match(code):
-                        HISTORY_STROKE_FLAG_CODE.append(code)
-            for code in HISTORY_STROKE_FLAG_CODE:
-                try:  # if chest_pain_date is not empty
-                    HISTORY_STROKE_dates += get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-                except:
-                    HISTORY_STROKE_dates = get_values_by_foreign_key(all_diagnoses_df, 'CODE', code, 'ADM_DATE')
-            for date in HISTORY_STROKE_dates:
-                if get_date_diff(earliest_adm_date, date) > 0:
-                    target_df.at[iter, 'HISTORY_STROKE_FLAG'] = 1
-
-    return target_df
-
-def GRACE_SCORE(target_df, labs_df):
+    pat_ids = target_df['PERSON_ID'].values
+    columns = {}
+
+    columns['KILLIP_CLASS'] = ['NA'] * len(target_df)
+    columns['LVEF_FLAG'] = [0] * len(target_df)
+    columns['POST_MI_CABG_FLAG'] = [0] * len(target_df)
+    columns['CHF_FLAG'] = [0] * len(target_df)
+    columns['HISTORY_STROKE_FLAG'] = [0] * len(target_df)
+
+    # evaluate the flags over the patient history together
+    flags = evaluate_flag_specs(ENRICHD_FLAGS, diagnoses_df, index_events)\
+        .reindex(pat_ids, fill_value=0)
+    # and the codes of the index visit
+    index_codes = get_index_visit_categories(diagnoses_df, 'CODE',
+                                             ['KILLIP_CLASS_CODE_II', 'KILLIP_CLASS_CODE_III', 'KILLIP_CLASS_CODE_IV',
+                                              'LVEF_CODE', 'POST_MI_CABG_FLAG_CODE1', 'POST_MI_CABG_FLAG_PATTERN2'],
+                                             index_events)\
+        .reindex(pat_ids, fill_value=0)
+
+    # the most severe killip class wins
+    columns['KILLIP_CLASS'] = np.select([index_codes['KILLIP_CLASS_CODE_IV'].values > 0,
+                                           index_codes['KILLIP_CLASS_CODE_III'].values > 0,
+                                           index_codes['KILLIP_CLASS_CODE_II'].values > 0,
+                                           flags['KILLIP_CLASS_I_FLAG'].values > 0],
+                                          ['IV', 'III', 'II', 'I'], 'NA').astype(object)
+    columns['LVEF_FLAG'] = index_codes['LVEF_CODE'].values
+    columns['POST_MI_CABG_FLAG'] = index_codes['POST_MI_CABG_FLAG_CODE1'].values & \
+                                     index_codes['POST_MI_CABG_FLAG_PATTERN2'].values
+    columns['CHF_FLAG'] = flags['CHF_FLAG'].values
+    columns['HISTORY_STROKE_FLAG'] = flags['HISTORY_STROKE_FLAG'].values
+
+    return get_section_df(columns, pat_ids)
+
+def GRACE_SCORE(target_df, diagnoses_df, labs_df, index_events):
     '''
     get grace score features
     :param target_df:
     :return:
     '''
-
-    target_df['IN_HOSPITAL_PCI_FLAG'] = ['NA'] * len(target_df)
-    target_df['SYSTOLIC_BP_AVG'] = ['NA'] * len(target_df)
-    target_df['HEART_RATE_AVG'] = ['NA'] * len(target_df)
-    target_df['ST_SEGMENT_AVG'] = ['NA'] * len(target_df)
-    target_df['TROPONIN_AVG'] = [0] * len(target_df)
-    target_df['CARDIAC_MARKER_ELEVATION_FLAG'] = [0] * len(target_df)
-    target_df['GRACE_SCORE_AGE'] = [0] * len(target_df)
-    target_df['GRACE_SCORE_HEART_RATE'] = [0] * len(target_df)
-    target_df['GRACE_SCORE_SYSTOLIC_BP'] = [0] * len(target_df)
-    target_df['GRACE_SCORE_CREATININE_LEVEL_FIRST'] = [0] * len(target_df)
-    target_df['GRACE_SCORE_KILLIP_CLASS'] = [0] * len(target_df)
-    target_df['GRACE_SCORE_CARDIAC_MARKER_ELEVATION'] = [0] * len(target_df)
-    target_df['GRACE_SCORE_CARDIAC_ARREST'] = [0] * len(target_df)
-    target_df['GRACE_SCORE_STEMI'] = [0] * len(target_df)
-
-    target_df['AKI_STAGE_VARIABLE'] = [0] * len(target_df)
-    target_df['AKI_FLAG'] = [0] * len(target_df)
-    target_df['AKI_STAGE_MAX'] = [0] * len(target_df)
-    target_df['AKI_STAGE_MIN'] = [0] * len(target_df)
-    target_df['AKI_RECOVERED_FLAG'] = [0] * len(target_df)
-    target_df['AKI_UNRESOLVED_FLAG'] = [0] * len(target_df)
-    target_df['AKI_DURATION'] = [0] * len(target_df)
-
-    for iter, row in target_df.iterrows():
-        pat_id = row['PERSON_ID']
-        # get the patients all visit rows
-        all_diagnoses_df = diagnoses_df[diagnoses_df['PAT_ID'] == pat_id]
-        ACUTE_MYOCARDIAL_INFARCTION_df = all_diagnoses_df[all_diagnoses_df['CODE'].isin(ACUTE_MYOCARDIAL_INFARCTION_CODE)]
-        all_adm_dates = list(ACUTE_MYOCARDIAL_INFARCTION_df['ADM_DATE'].values)
-        all_visit_no = list(ACUTE_MYOCARDIAL_INFARCTION_df['VISIT_NO'].values)
-
-        # get the earlist adm and visit_nod
-        if len(all_adm_dates) > 0:
-            date_pairs = list(zip(all_adm_dates, all_visit_no))
-            date_pairs.sort(key=lambda x: time.strptime(x[0], '%m/%d/%Y'))
-            earliest_adm_date, earliest_visit_no = date_pairs[0]
-
-            diagnoses_codes = get_values_by_foreign_key(all_diagnoses_df, 'VISIT_NO', earliest_visit_no,'CODE')
-            target_df.at[iter,'IN_HOSPITAL_PCI_FLAG'] = 1 if set(IN_HOSPITAL_PCI_CODE) & set(diagnoses_codes) else 0
-
-            adm_labs_df = labs_df[labs_df['VISIT_NO'] == earliest_visit_no]
-
-            # get all the sodium records
-            Troponin_df1 = adm_labs_df[adm_labs_df['ITEM'] == 'Troponin I']
-            Troponin_df2 = adm_labs_df[adm_labs_df['ITEM'] == 'Troponin-I']
-            Troponin_values = [try_float(x) for x in list(Troponin_df1['OBS_VALUE_NUM'].values)] + \
-                              [try_float(x) for x in list(Troponin_df2['OBS_VALUE_NUM'].values)]
-            if len(Troponin_values) > 0:
-                target_df.at[iter, 'TROPONIN_AVG'] = np.mean(Troponin_values)
-                target_df.at[iter, 'CARDIAC_MARKER_ELEVATION_FLAG'] = 1 if np.mean(Troponin_values) > 0.4 else 0
-
-            creatinine_df = adm_labs_df[adm_labs_df['ITEM'] == 'CREATININE']
-            all_time_labs_df = labs_df[labs_df['PAT_ID'] == pat_id]
-            anchor_creatinines = [try_float(x) for x in list(creatinine_df['OBS_VALUE'].values)]
-            anchor_dates = list(creatinine_df['OBS_DTM'].values)
-            baseline_creatinines = [try_float(x) for x in list(all_time_labs_df['OBS_VALUE'].values)]
-            baseline_dates = list(all_time_labs_df['OBS_DTM'].values)
-            for date_serial in range(len(anchor_dates)):
-                anchor_dates[date_serial] = anchor_dates[date_serial].split()[0]
-            for date_serial in range(len(baseline_dates)):
-                baseline_dates[date_serial] = baseline_dates[date_serial].split()[0]
+    pat_ids = target_df['PERSON_ID'].values
+    columns = {}
+
+    columns['IN_HOSPITAL_PCI_FLAG'] = ['NA'] * len(target_df)
+    columns['SYSTOLIC_BP_AVG'] = ['NA'] * len(target_df)
+    columns['HEART_RATE_AVG'] = ['NA'] * len(target_df)
+    columns['ST_SEGMENT_AVG'] = ['NA'] * len(target_df)
+    columns['TROPONIN_AVG'] = [0] * len(target_df)
+    columns['CARDIAC_MARKER_ELEVATION_FLAG'] = [0] * len(target_df)
+    columns['GRACE_SCORE_AGE'] = [0] * len(target_df)
+    columns['GRACE_SCORE_HEART_RATE'] = [0] * len(target_df)
+    columns['GRACE_SCORE_SYSTOLIC_BP'] = [0] * len(target_df)
+    columns['GRACE_SCORE_CREATININE_LEVEL_FIRST'] = [0] * len(target_df)
+    columns['GRACE_SCORE_KILLIP_CLASS'] = [0] * len(target_df)
+    columns['GRACE_SCORE_CARDIAC_MARKER_ELEVATION'] = [0] * len(target_df)
+    columns['GRACE_SCORE_CARDIAC_ARREST'] = [0] * len(target_df)
+    columns['GRACE_SCORE_STEMI'] = [0] * len(target_df)
+
+    columns['AKI_STAGE_VARIABLE'] = [0] * len(target_df)
+    columns['AKI_FLAG'] = [0] * len(target_df)
+    columns['AKI_STAGE_MAX'] = [0] * len(target_df)
+    columns['AKI_STAGE_MIN'] = [0] * len(target_df)
+    columns['AKI_RECOVERED_FLAG'] = [0] * len(target_df)
+    columns['AKI_UNRESOLVED_FLAG'] = [0] * len(target_df)
+    columns['AKI_DURATION'] = [0] * len(target_df)
+
+    # average troponin of the index visit
+    troponin = aggregate_labs(labs_df, index_events, ['TROPONIN'], 'OBS_VALUE_NUM')\
+        .reindex(pat_ids)['TROPONIN_LEVEL_AVG']
+    if troponin.notna().any():
+        columns['TROPONIN_AVG'] = troponin.fillna(0.0).values
+    columns['CARDIAC_MARKER_ELEVATION_FLAG'] = (troponin > 0.4).astype(int).values
+
+    for position, pat_id in enumerate(pat_ids):
+        # get the index AMI admission
+        if pat_id in index_events.index:
+            earliest_visit_no = index_events.at[pat_id, 'INDEX_VISIT_NO']
+
+            # the codes of the patients own rows of the index visit
+            diagnoses_codes = [code for code, visit_no in zip(get_values_by_key(diagnoses_df, 'PAT_ID', pat_id, 'CODE'),
+                                                              get_values_by_key(diagnoses_df, 'PAT_ID', pat_id, 'VISIT_NO'))
+                               if visit_no == earliest_visit_no]
+            columns['IN_HOSPITAL_PCI_FLAG'][position] = 1 if set(IN_HOSPITAL_PCI_CODE) & set(diagnoses_codes) else 0
+
+            # the creatinine results of the index visit, read through the key index of the visits
+            adm_items = get_values_by_key(labs_df, 'VISIT_NO', earliest_visit_no, 'ITEM')
+            is_creatinine = np.array([item == 'CREATININE' for item in adm_items], dtype=bool)
+            anchor_creatinines = [try_float(x) for x in
+                                  get_values_by_key(labs_df, 'VISIT_NO', earliest_visit_no, 'OBS_VALUE')[is_creatinine]]
+            anchor_dates = list(get_values_by_key(labs_df, 'VISIT_NO', earliest_visit_no, 'OBS_DTM_DAY')[is_creatinine])
+            baseline_creatinines = [try_float(x) for x in list(get_values_by_key(labs_df, 'PAT_ID', pat_id, 'OBS_VALUE'))]
+            baseline_dates = list(get_values_by_key(labs_df, 'PAT_ID', pat_id, 'OBS_DTM_DAY'))
             anchor_pairs = list(zip(anchor_dates, anchor_creatinines))
             baseline_pairs = list(zip(baseline_dates, baseline_creatinines))
             if len(anchor_pairs) > 0 and len(baseline_pairs) > 0:
-                anchor_pairs.sort(key=lambda x: time.strptime(x[0], '%m/%d/%Y'))
+                anchor_pairs.sort(key=lambda x: x[0])
                 last_anchor_date, last_anchor_creatinine = anchor_pairs[-1]
-                baseline_pairs.sort(key=lambda x: time.strptime(x[0], '%m/%d/%Y'))
+                baseline_pairs.sort(key=lambda x: x[0])
                 last_baseline_date, last_baseline_creatinine = baseline_pairs[-1]
                 anchor_dates, anchor_creatinines = [ i for i, j in anchor_pairs ], [ j for i, j in anchor_pairs ]
                 baseline_dates, baseline_creatinines = [ i for i, j in baseline_pairs ], [ j for i, j in baseline_pairs ]
 
                 if last_anchor_creatinine/(last_baseline_creatinine + 0.001) >= 1.5 or last_anchor_creatinine - last_baseline_creatinine >= 0.3:
-                    target_df.at[iter, 'AKI_STAGE_VARIABLE'] = 1
+                    columns['AKI_STAGE_VARIABLE'][position] = 1
                 elif last_anchor_creatinine/(last_baseline_creatinine + 0.001) >= 2.0:
-                    target_df.at[iter, 'AKI_STAGE_VARIABLE'] = 2
+                    columns['AKI_STAGE_VARIABLE'][position] = 2
                 elif last_anchor_creatinine/(last_baseline_creatinine + 0.001) >= 3.0:
-                    target_df.at[iter, 'AKI_STAGE_VARIABLE'] = 3
+                    columns['AKI_STAGE_VARIABLE'][position] = 3
 
-                if target_df.at[iter, 'AKI_STAGE_VARIABLE'] > 0 :
-                    target_df.at[iter, 'AKI_UNRESOLVED_FLAG'] = 1
+                if columns['AKI_STAGE_VARIABLE'][position] > 0 :
+                    columns['AKI_UNRESOLVED_FLAG'][position] = 1
 
                 AKI_dates = []
                 for anchor_serial, anchor in enumerate(anchor_creatinines):
                     if anchor/(last_baseline_creatinine + 0.001) >= 1.5 or anchor - last_baseline_creatinine >= 0.3:
-                        target_df.at[iter, 'AKI_FLAG'] = 1
-                        if target_df.at[iter, 'AKI_STAGE_VARIABLE'] == 0:
-                            target_df.at[iter,'AKI_RECOVERED_FLAG'] = 1
+                        columns['AKI_FLAG'][position] = 1
+                        if columns['AKI_STAGE_VARIABLE'][position] == 0:
+                            columns['AKI_RECOVERED_FLAG'][position] = 1
                         AKI_dates.append(anchor_dates[anchor_serial])
 
-                target_df.at[iter, 'AKI_STAGE_MAX'] = max([a/(last_baseline_creatinine + 0.001) for a in anchor_creatinines])
-                target_df.at[iter, 'AKI_STAGE_MIN'] = min([a/(last_baseline_creatinine + 0.001) for a in anchor_creatinines])
+                columns['AKI_STAGE_MAX'][position] = max([a/(last_baseline_creatinine + 0.001) for a in anchor_creatinines])
+                columns['AKI_STAGE_MIN'][position] = min([a/(last_baseline_creatinine + 0.001) for a in anchor_creatinines])
 
                 if len(AKI_dates) > 1:
-                    target_df.at[iter, 'AKI_DURATION'] = get_date_diff(AKI_dates[-1], AKI_dates[0])
-
-
-                # compute GRACE_SCORE_AGE
-        age = target_df.at[iter, 'AGE_AT_ADMIT']
-        if 0 < age <= 30:
-            target_df.at[iter, 'GRACE_SCORE_AGE'] = 0
-        elif 30 < age <= 39:
-            target_df.at[iter, 'GRACE_SCORE_AGE'] = 8
-        elif 39 < age <= 49:
-            target_df.at[iter, 'GRACE_SCORE_AGE'] = 25
-        elif 49 < age <= 59:
-            target_df.at[iter, 'GRACE_SCORE_AGE'] = 41
-        elif 59 < age <= 69:
-            target_df.at[iter, 'GRACE_SCORE_AGE'] = 58
-        elif 69 < age <= 79:
-            target_df.at[iter, 'GRACE_SCORE_AGE'] = 75
-        elif 79 < age <= 89:
-            target_df.at[iter, 'GRACE_SCORE_AGE'] = 91
-        elif 89 < age:
-            target_df.at[iter, 'GRACE_SCORE_AGE'] = 100
-
-        # compute GRACE_SCORE_HEART_RATE
-        heart_rate = try_float(target_df.at[iter,'HEART_RATE_AVG'])
-        if heart_rate < 50:
-            target_df.at[iter, 'GRACE_SCORE_HEART_RATE'] = 0
-        elif 50 <= heart_rate < 70:
-            target_df.at[iter, 'GRACE_SCORE_HEART_RATE'] = 3
-        elif 70 <= heart_rate < 90:
-            target_df.at[iter, 'GRACE_SCORE_HEART_RATE'] = 9
-        elif 90 <= heart_rate < 110:
-            target_df.at[iter, 'GRACE_SCORE_HEART_RATE'] = 15
-        elif 110 <= heart_rate < 150:
-            target_df.at[iter, 'GRACE_SCORE_HEART_RATE'] = 24
-        elif 150 <= heart_rate < 200:
-            target_df.at[iter, 'GRACE_SCORE_HEART_RATE'] = 38
-        elif heart_rate >= 200:
-            target_df.at[iter, 'GRACE_SCORE_HEART_RATE'] = 46
-
-        # compute GRACE_SCORE_SYSTOLIC_BP
-        systolic_bp_avg = try_float(target_df.at[iter, 'SYSTOLIC_BP_AVG'])
-        if systolic_bp_avg < 80:
-            target_df.at[iter, 'GRACE_SCORE_SYSTOLIC_BP'] = 0
-        elif 80 <= systolic_bp_avg < 100:
-            target_df.at[iter, 'GRACE_SCORE_SYSTOLIC_BP'] = 53
-        elif 100 <= systolic_bp_avg < 120:
-            target_df.at[iter, 'GRACE_SCORE_SYSTOLIC_BP'] = 43
-        elif 120 <= systolic_bp_avg < 140:
-            target_df.at[iter, 'GRACE_SCORE_SYSTOLIC_BP'] = 34
-        elif 14 <= systolic_bp_avg < 160:
-            target_df.at[iter, 'GRACE_SCORE_SYSTOLIC_BP'] = 24
-        elif 160 <= systolic_bp_avg < 200:
-            target_df.at[iter, 'GRACE_SCORE_SYSTOLIC_BP'] = 10
-        elif 200 <= systolic_bp_avg:
-            target_df.at[iter, 'GRACE_SCORE_SYSTOLIC_BP'] = 0
-
-        # compute GRACE_SCORE_CREATININE_LEVEL_FIRST
-        c_level =  try_float(target_df.at[iter, 'CREATININE_LEVEL_FIRST'])
-        if 0 < c_level < 0.4:
-            target_df.at[iter, 'GRACE_SCORE_CREATININE_LEVEL_FIRST'] = 1
-        elif 0.4 <= c_level < 0.8:
-            target_df.at[iter, 'GRACE_SCORE_CREATININE_LEVEL_FIRST'] = 4
-        elif 0.8 <= c_level < 1.2:
-            target_df.at[iter, 'GRACE_SCORE_CREATININE_LEVEL_FIRST'] = 7
-        elif 1.2 <= c_level < 1.6:
-            target_df.at[iter, 'GRACE_SCORE_CREATININE_LEVEL_FIRST'] = 10
-        elif 1.6 <= c_level < 2.0:
-            target_df.at[iter, 'GRACE_SCORE_CREATININE_LEVEL_FIRST'] = 13
-        elif 2.0 <= c_level < 4.0:
-            target_df.at[iter, 'GRACE_SCORE_CREATININE_LEVEL_FIRST'] = 21
-        elif 4.0 <= c_level:
-            target_df.at[iter, 'GRACE_SCORE_CREATININE_LEVEL_FIRST'] = 28
-
-        # compute GRACE_SCORE_KILLIP_CLASS
-        k_class =  target_df.at[iter, 'KILLIP_CLASS']
-        if k_class == 'I':
-            target_df.at[iter, 'GRACE_SCORE_KILLIP_CLASS'] = 0
-        elif k_class == 'II':
-            target_df.at[iter, 'GRACE_SCORE_KILLIP_CLASS'] = 20
-        elif k_class == 'III':
-            target_df.at[iter, 'GRACE_SCORE_KILLIP_CLASS'] = 39
-        elif k_class == 'IV':
-            target_df.at[iter, 'GRACE_SCORE_KILLIP_CLASS'] = 59
-
-        # compute GRACE_SCORE_CARDIAC_MARKER_ELEVATION, GRACE_SCORE_CARDIAC_ARREST, and GRACE_SCORE_STEMI
-        target_df.at[iter,'GRACE_SCORE_CARDIAC_MARKER_ELEVATION'] = target_df.at[iter, 'CARDIAC_MARKER_ELEVATION_FLAG'] * 14
-        target_df.at[iter,'GRACE_SCORE_CARDIAC_ARREST'] = target_df.at[iter, 'CARDIAC_ARREST_FLAG'] * 39
-        target_df.at[iter,'GRACE_SCORE_STEMI'] = target_df.at[iter, 'STEMI_FLAG'] * 28
-
-    # compute total
-    target_df['GRACE_SCORE'] = target_df['GRACE_SCORE_AGE'] + target_df['GRACE_SCORE_HEART_RATE'] + \
-                                target_df['GRACE_SCORE_SYSTOLIC_BP'] + target_df['GRACE_SCORE_CREATININE_LEVEL_FIRST'] + \
-                                target_df['GRACE_SCORE_KILLIP_CLASS'] + target_df['GRACE_SCORE_CARDIAC_MARKER_ELEVATION'] + \
-                                target_df['GRACE_SCORE_CARDIAC_ARREST'] + target_df['GRACE_SCORE_STEMI']
+                    columns['AKI_DURATION'][position] = get_day_diff(AKI_dates[-1], AKI_dates[0])
 
-    return target_df
+    # score the features of this and the earlier sections, and compute total
+    sources = {name: target_df[name].values
+               for name in ['AGE_AT_ADMIT', 'CREATININE_LEVEL_FIRST', 'KILLIP_CLASS', 'CARDIAC_ARREST_FLAG', 'STEMI_FLAG']}
+    sources.update(columns)
+    components = evaluate_score_table(GRACE_SCORE_TABLE, sources)
+    columns.update(components)
+    columns['GRACE_SCORE'] = sum(components.values())
+
+    return get_section_df(columns, pat_ids)
 
 def POLYNOMIAL_TERMS(target_df):
     '''
@@ -2012,272 +2493,732 @@ def POLYNOMIAL_TERMS(target_df):
     :param target_df:
     :return:
     '''
+    pat_ids = target_df['PERSON_ID'].values
+    columns = compute_terms(target_df, POLYNOMIAL_TERM_SPECS)
 
-    target_df['QUAD_CREATININE_MAX'] = target_df['CREATININE_LEVEL_MAX'] ** 2
-    target_df['CUBIC_CREATININE_MAX'] = target_df['CREATININE_LEVEL_MAX'] ** 3
-
-    target_df['QUAD_HEMOGLOBIN_MAX'] = target_df['HEMOGLOBIN_LEVEL_MAX'] ** 2
-    target_df['CUBIC_HEMOGLOBIN_MAX'] = target_df['HEMOGLOBIN_LEVEL_MAX'] ** 3
-
-    target_df['QUAD_LOS_NEW'] = target_df['LOS'] ** 2
-    target_df['CUBIC_LOS_NEW'] = target_df['LOS'] ** 3
-
-    target_df['QUAD_HOSPITAL_SCORE'] = target_df['HOSPITAL_SCORE'] ** 2
-    target_df['CUBIC_HOSPITAL_SCORE'] = target_df['HOSPITAL_SCORE'] ** 3
-
-    target_df['QUAD_GRACE_SCORE'] = target_df['GRACE_SCORE'] ** 2
-    target_df['CUBIC_GRACE_SCORE'] = target_df['GRACE_SCORE'] ** 3
-
-    target_df['QUAD_LACE_SCORE'] = target_df['LACE_SCORE'] ** 2
-    target_df['CUBIC_LACE_SCORE'] = target_df['LACE_SCORE'] ** 3
-
-    target_df['QUAD_AKI_DURATION'] = target_df['AKI_DURATION'] ** 2
-    target_df['CUBIC_AKI_DURATION'] = target_df['AKI_DURATION'] ** 3
-
-    return target_df
+    return get_section_df(columns, pat_ids)
 
 def INTERACTION_TERMS(target_df):
     '''
-    get interaction terms featurs
+    get interaction terms featurs. The columns are sparse when scipy is installed.
     :param target_df:
     :return:
     '''
-    target_df['i_AKI_BNP_CAT'] = target_df['AKI_FLAG'] * target_df['BNP_FIRST_CAT']
-    target_df['i_AKI_CARDIAC_A'] = target_df['AKI_FLAG'] * target_df['CARDIAC_ARREST_FLAG']
-    target_df['i_AKI_Sodium'] = target_df['AKI_FLAG'] * target_df['SODIUM_LEVEL_AVG_136_FLAG']
-    target_df['i_AKI_CK_MAX'] = target_df['AKI_FLAG'] * target_df['CK_LEVEL_MAX']
-    target_df['i_AKI_CKD'] = target_df['AKI_FLAG'] * target_df['COMORBID_CKD_FLAG']
-    target_df['i_AKI_DEMENTIA'] = target_df['AKI_FLAG'] * target_df['COMORBID_DEMENTIA_FLAG']
-    target_df['i_AKI_STROKE'] = target_df['AKI_FLAG'] * target_df['COMORBID_STROKE_FLAG']
-    target_df['i_AKI_CUB_GRACE'] = target_df['AKI_FLAG'] * target_df['CUBIC_GRACE_SCORE']
-    target_df['i_AKI_CUB_HEMOG'] = target_df['AKI_FLAG'] * target_df['CUBIC_HEMOG_MAX']
-    target_df['i_AKI_MED_ACE'] = target_df['AKI_FLAG'] * target_df['DISCH_MED_ACE_ARB_FLAG']
-    target_df['i_AKI_MED_ANTIDEP'] = target_df['AKI_FLAG'] * target_df['DISCH_MED_ANTIDEP_FLAG']
-    target_df['i_AKI_PRIOR_ED_COUNT'] = target_df['AKI_FLAG'] * target_df['ED_VISIT_PRIOR_30_DAYS_COUNT']
-    target_df['i_AKI_PVD'] = target_df['AKI_FLAG'] * target_df['HISTORY_PVD_FLAG']
-    target_df['i_AKI_HOSPITAL'] = target_df['AKI_FLAG'] * target_df['HOSPITAL_SCORE']
-    target_df['I_AKI_INHOSP_ISCHEMI'] = target_df['AKI_FLAG'] * target_df['IN_HOSPITAL_ISCHEMIA_FLAG']
-    target_df['i_AKI_LACE'] = target_df['AKI_FLAG'] * target_df['LACE_SCORE']
-    target_df['i_AKI_NONELECTIVE'] = target_df['AKI_FLAG'] * target_df['NONELECTIVE_ADMISSION_FLAG']
-    target_df['i_AKI_ONCOLOGY'] = target_df['AKI_FLAG'] * target_df['ONCOLOGY_FLAG']
-    target_df['i_AKI_DIS_METAB_90D'] = target_df['AKI_FLAG'] * target_df['PRIOR_DIS_MAGN_METAB_90D']
-    target_df['i_AKI_PRIOR_YR_COUNT'] = target_df['AKI_FLAG'] * target_df['PRIOR_YEAR_ADMISSIONs_COUNT']
-    target_df['i_AKI_QUAD_GRACE'] = target_df['AKI_FLAG'] * target_df['QUAD_GRACE_SCORE']
-    target_df['i_AKI_REVASC'] = target_df['AKI_FLAG'] * target_df['REVASCULARIZATION_FLAG']
-    target_df['i_AKI_TRANSFER_PT'] = target_df['AKI_FLAG'] * target_df['TRANSFER_PATIENT_FLAG']
-    target_df['i_AKI_VESSE_COUNT'] = target_df['AKI_FLAG'] * target_df['VESSELS_COUNT']
-
-    target_df['i_BNP_CARDIAC_A'] = target_df['BNP_FIRST_CAT'] * target_df['CARDIAC_ARREST_FLAG']
-    target_df['i_BNP_SODIUM'] = target_df['BNP_FIRST_CAT'] * target_df['SODIUM_LEVEL_AVG_136_FLAG']
-    target_df['i_BNP_CK_MAX'] = target_df['BNP_FIRST_CAT'] * target_df['CK_LEVEL_MAX']
-    target_df['i_BNP_CKD'] = target_df['BNP_FIRST_CAT'] * target_df['COMORBID_CKD_FLAG']
-    target_df['i_BNP_DEMENTIA'] = target_df['BNP_FIRST_CAT'] * target_df['COMORBID_DEMENTIA_FLAG']
-    target_df['i_BNP_STROKE'] = target_df['BNP_FIRST_CAT'] * target_df['COMORBID_STROKE_FLAG']
-    target_df['i_BNP_CUB_GRACE'] = target_df['BNP_FIRST_CAT'] * target_df['CUBIC_GRACE_SCORE']
-    target_df['i_BNP_CUB_HEMOG'] = target_df['BNP_FIRST_CAT'] * target_df['CUBIC_HEMOG_MAX']
-    target_df['i_BNP_MED_ACE'] = target_df['BNP_FIRST_CAT'] * target_df['DISCH_MED_ACE_ARB_FLAG']
-    target_df['i_BNP_MED_ANTIDEP'] = target_df['BNP_FIRST_CAT'] * target_df['DISCH_MED_ANTIDEP_FLAG']
-    target_df['i_BNP_PRIOR_ED_COUNT'] = target_df['BNP_FIRST_CAT'] * target_df['ED_VISIT_PRIOR_30_DAYS_COUNT']
-    target_df['i_BNP_PVD'] = target_df['BNP_FIRST_CAT'] * target_df['HISTORY_PVD_FLAG']
-    target_df['i_BNP_HOSPITAL'] = target_df['BNP_FIRST_CAT'] * target_df['HOSPITAL_SCORE']
-    target_df['i_BNP_INHOSP_ISCHEMIA'] = target_df['BNP_FIRST_CAT'] * target_df['IN_HOSPITAL_ISCHEMIA_FLAG']
-    target_df['i_BNP_LACE'] = target_df['BNP_FIRST_CAT'] * target_df['LACE_SCORE']
-    target_df['i_BNP_NONELECTIVE'] = target_df['BNP_FIRST_CAT'] * target_df['NONELECTIVE_ADMISSION_FLAG']
-    target_df['i_BNP_ONCOLOGY'] = target_df['BNP_FIRST_CAT'] * target_df['ONCOLOGY_FLAG']
-    target_df['i_BNP_DIS_METAB_90D'] = target_df['BNP_FIRST_CAT'] * target_df['PRIOR_DIS_MAGN_METAB_90D']
-    target_df['i_BNP_PRIOR_YR_COUNT'] = target_df['BNP_FIRST_CAT'] * target_df['PRIOR_YEAR_ADMISSIONS_COUNT']
-    target_df['i_BNP_QUAD_GRACE'] = target_df['BNP_FIRST_CAT'] * target_df['QUAD_GRACE_SCORE']
-    target_df['i_BNP_REVASCULARIZATION'] = target_df['BNP_FIRST_CAT'] * target_df['REVASCULARIZATION_FLAG']
-    target_df['i_BNP_TRANSFER_PT'] = target_df['BNP_FIRST_CAT'] * target_df['TRANSFER_PATIENT_FLAG']
-    target_df['i_BNP_VESSEL_COUNT'] = target_df['BNP_FIRST_CAT'] * target_df['VESSELS_COUNT']
-    target_df['i_BNP_AKI_DUR'] = target_df['BNP_FIRST_CAT'] * target_df['AKI_DURATION']
-
-    target_df['i_CARDIAC_A_Sodium'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['SODIUM_LEVEL_AVG_136_FLAG']
-    target_df['i_CARDIAC_A_CK_MAX'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['CK_LEVEL_MAX']
-    target_df['i_CARDIAC_A_CKD'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['COMORBID_CKD_FLAG']
-    target_df['i_CARDIAC_A_DEMENTIA'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['COMORBID_DEMENTIA_FLAG']
-    target_df['i_CARDIAC_A_STROKE'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['COMORBID_STROKE_FLAG']
-    target_df['i_CARDIAC_A_CUB_GRACE'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['CUBIC_GRACE_SCORE']
-    target_df['i_CARDIAC_A_CUB_HEMOG'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['CUBIC_HEMOG_MAX']
-    target_df['i_CARDIAC_A_MED_ACE'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['DISCH_MED_ACE_ARB_FLAG']
-    target_df['i_CARDIAC_A_MED_ANTIDEP'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['DISCH_MED_ANTIDEP_FLAG']
-    target_df['i_CARDIAC_A_PRIOR_ED_COUNT'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['ED_VISIT_PRIOR_30_DAYS_COUNT']
-    target_df['i_CARDIAC_A_PVD'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['HISTORY_PVD_FLAG']
-    target_df['i_CARDIAC_A_HOSPITAL'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['HOSPITAL_SCORE']
-    target_df['i_CARDIAC_A_INHOSP_ISCHEMIA'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['IN_HOSPITAL_ISCHEMIA_FLAG']
-    target_df['i_CARDIAC_A_LACE'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['LACE_SCORE']
-    target_df['i_CARDIAC_A_NONELECTIVE'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['NONELECTIVE_ADMISSION_FLAG']
-    target_df['i_CARDIAC_A_ONCOLOGY'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['ONCOLOGY_FLAG']
-    target_df['i_CARDIAC_A_DIS_METAB_90D'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['PRIOR_DIS_MAGN_METAB_90D']
-    target_df['i_CARDIAC_A_PRIOR_YR_COUNT'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['PRIOR_YEAR_ADMISSIONS_COUNT']
-    target_df['i_CARDIAC_A_QUAD_GRACE'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['QUAD_GRACE_SCORE']
-    target_df['i_CARDIAC_A_REVASCULARIZATION'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['REVASCULARIZATION_FLAG']
-    target_df['i_CARDIAC_A_TRANSFER_PT'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['TRANSFER_PATIENT_FLAG']
-    target_df['i_CARDIAC_A_VESSEL_C'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['VESSELS_COUNT']
-    target_df['i_CARDIAC_A_AKI_DUR'] = target_df['CARDIAC_ARREST_FLAG'] * target_df['AKI_DURATION']
-    target_df['i_SODIUM_CK_MAX'] = target_df['SODIUM_LEVEL_AVG_136_FLAG'] * target_df['CK_LEVEL_MAX']
+    pat_ids = target_df['PERSON_ID'].values
+    names = [name for name, factors in INTERACTION_TERM_SPECS]
+    try:
+        matrix = compute_terms(target_df, INTERACTION_TERM_SPECS, sparse=True)
+    except ImportError:
+        return pd.DataFrame(compute_terms(target_df, INTERACTION_TERM_SPECS), index=pat_ids)
 
-    return target_df
+    return pd.DataFrame.sparse.from_spmatrix(matrix, index=pat_ids, columns=names)
 
-def DATA_MANAGEMENT(target_df, visits_df):
+def DATA_MANAGEMENT(target_df, visits_df, index_events):
     '''
     get Variables created for data management/outcome
     :param target_df:
     :return:
     '''
+    pat_ids = target_df['PERSON_ID'].values
+    columns = {}
+
+    columns['GAP'] = [0] * len(target_df)
+    columns['LOS_NEW'] = target_df['LOS'].values
+    columns['NEW_LOS5_FLAG'] = target_df['LOS5_FLAG'].values
+    columns['PREVIOUS_30_DAY'] = [0] * len(target_df)
+    columns['PREVIOUS_30D_SUM'] = [0] * len(target_df)
+    columns['MORE_PREVIOUS_YR'] = [0] * len(target_df)
+    columns['MORE_PREVIOUS_YR_SUM'] = [0] * len(target_df)
+    columns['READMISSIONS'] = [0] * len(target_df)
+    columns['READMISSIONS_SUM'] = [0] * len(target_df)
+    columns['FLG_30D'] = [0] * len(target_df)
+    columns['FLG_30D_SUM'] = [0] * len(target_df)
+    columns['OUTCOME_30DRED'] = [0] * len(target_df)
+    columns['NEW_LOS5_FLAG_SUM'] = [0] * len(target_df)
+    # PREVIOUS_YR and PREVIOUS_YR_SUM were always written as floats
+    prior_year_counts = target_df['PRIOR_YEAR_ADMISSIONS_COUNT'].values
+    columns['PREVIOUS_YR'] = (prior_year_counts > 0).astype(float)
+    columns['PREVIOUS_YR_SUM'] = prior_year_counts.astype(float)
+
+    # count the admissions before and the readmissions after the index admission
+    visit_counts = count_visit_windows(DATA_MANAGEMENT_VISIT_WINDOWS, visits_df, index_events)\
+        .reindex(pat_ids, fill_value=0)
+    for window_spec in DATA_MANAGEMENT_VISIT_WINDOWS:
+        columns[window_spec['column']] = visit_counts[window_spec['column']].values
+    columns['READMISSIONS'] = (columns['READMISSIONS_SUM'] > 0).astype(int)
+    columns['PREVIOUS_30_DAY'] = (columns['PREVIOUS_30D_SUM'] > 0).astype(int)
+    columns['FLG_30D'] = (columns['FLG_30D_SUM'] > 0).astype(int)
+    columns['MORE_PREVIOUS_YR'] = (columns['MORE_PREVIOUS_YR_SUM'] > 0).astype(int)
+
+    # VISIT_NO is only added once a patient has an index AMI admission, and is empty for the others
+    index_visit_no = index_events['INDEX_VISIT_NO'].reindex(pat_ids)
+    if index_visit_no.notna().any():
+        columns['VISIT_NO'] = index_visit_no.values
+
+    return get_section_df(columns, pat_ids)
+
+def get_cohort_sources(target_df):
+    '''
+    compute the columns the cohort thresholds of POST_VANDERNILT are taken over
+    :param target_df:
+    :return: dict of source column name to its values, see COHORT_THRESHOLDS
+    '''
+    columns = {}
+    columns['CREATININE_LEVEL_DIFF'] = target_df['CREATININE_LEVEL_MAX'].values - target_df['CREATININE_LEVEL_MIN'].values
+    columns['HEMOGLOBIN_LEVEL_DIFF'] = target_df['HEMOGLOBIN_LEVEL_MAX'].values - target_df['HEMOGLOBIN_LEVEL_MIN'].values
+    columns['BNP_LEVEL_DIFF'] = target_df['BNP_LEVEL_MAX'].values - target_df['BNP_LEVEL_MIN'].values
+    return columns
 
-    target_df['GAP'] = [0] * len(target_df)
-    target_df['LOS_NEW'] = target_df['LOS']
-    target_df['NEW_LOS5_FLAG'] = target_df['LOS5_FLAG']
-    target_df['PREVIOUS_30_DAY'] = [0] * len(target_df)
-    target_df['PREVIOUS_30D_SUM'] = [0] * len(target_df)
-    target_df['MORE_PREVIOUS_YR'] = [0] * len(target_df)
-    target_df['MORE_PREVIOUS_YR_SUM'] = [0] * len(target_df)
-    target_df['READMISSIONS'] = [0] * len(target_df)
-    target_df['READMISSIONS_SUM'] = [0] * len(target_df)
-    target_df['FLG_30D'] = [0] * len(target_df)
-    target_df['FLG_30D_SUM'] = [0] * len(target_df)
-    target_df['OUTCOME_30DRED'] = [0] * len(target_df)
-    target_df['NEW_LOS5_FLAG_SUM'] = [0] * len(target_df)
+def POST_VANDERNILT(target_df, thresholds=None):
+    '''
+    more variables
+    :param target_df:
+    :param thresholds: dict of flag column name to a threshold frozen from another cohort, see COHORT_THRESHOLDS.
+    The thresholds are computed over target_df when not given.
+    :return: the section columns and the thresholds used
+    '''
+    pat_ids = target_df['PERSON_ID'].values
+    columns = get_cohort_sources(target_df)
 
+    # 1 for the patients at or above the threshold of the difference, the top quarter of the cohort, 2 for the others
+    if thresholds is None:
+        thresholds = compute_cohort_thresholds(columns)
+    for spec in COHORT_THRESHOLDS:
+        columns[spec['column']] = np.where(columns[spec['source']] >= thresholds[spec['column']], 1.0, 2.0)
 
-    for iter, row in target_df.iterrows():
-        pat_id = row['PERSON_ID']
-        # get the patients all visit rows
-        all_visits_df = diagnoses_df[diagnoses_df['PAT_ID'] == pat_id]
-        ACUTE_MYOCARDIAL_INFARCTION_df = all_visits_df[all_visits_df['CODE'].isin(ACUTE_MYOCARDIAL_INFARCTION_CODE)]
-        all_adm_dates = list(ACUTE_MYOCARDIAL_INFARCTION_df['ADM_DATE'].values)
-        all_visit_no = list(ACUTE_MYOCARDIAL_INFARCTION_df['VISIT_NO'].values)
-        target_df.at[iter, 'PREVIOUS_YR'] = 1 if target_df.at[iter, 'PRIOR_YEAR_ADMISSIONS_COUNT'] > 0 else 0
-        target_df.at[iter, 'PREVIOUS_YR_SUM'] = target_df.at[iter, 'PRIOR_YEAR_ADMISSIONS_COUNT']
-        # get the earlist adm and visit_no
-        if len(all_adm_dates) > 0:
-            date_pairs = list(zip(all_adm_dates, all_visit_no))
-            date_pairs.sort(key=lambda x: time.strptime(x[0], '%m/%d/%Y'))
-            earliest_adm_date, earliest_visit_no = date_pairs[0]
-            target_df.at[iter, 'VISIT_NO'] = earliest_visit_no
-
-            # compute
-            all_admissions_df = visits_df[visits_df['PAT_ID'] == pat_id]
-            prior_30_day_admission = 0
-            post_30_day_admission = 0
-            readmissions = 0
-            more_previous_yr = 0
-
-            for adm_iter, adm_row in all_admissions_df.iterrows():
-                if 0 < get_date_diff(adm_row['ADM_DATE'], earliest_adm_date):
-                    readmissions += 1
-                    if get_date_diff(adm_row['ADM_DATE'], earliest_adm_date) <= 30:
-                        post_30_day_admission += 1
-                if 0 < get_date_diff(earliest_adm_date, adm_row['DSCH_DATE']) <= 30:
-                    prior_30_day_admission += 1
-                elif 365 < get_date_diff(earliest_adm_date, adm_row['DSCH_DATE']) :
-                    more_previous_yr += 1
-
-            target_df.at[iter, 'READMISSIONS_SUM'] = readmissions
-            target_df.at[iter, 'READMISSIONS'] = 1 if readmissions > 0 else 0
-            target_df.at[iter, 'PREVIOUS_30D_SUM'] = prior_30_day_admission
-            target_df.at[iter, 'PREVIOUS_30_DAY'] = 1 if prior_30_day_admission > 0 else 0
-            target_df.at[iter, 'FLG_30D_SUM'] = post_30_day_admission
-            target_df.at[iter, 'FLG_30D'] = 1 if post_30_day_admission > 0 else 0
-            target_df.at[iter, 'MORE_PREVIOUS_YR_SUM'] = more_previous_yr
-            target_df.at[iter, 'MORE_PREVIOUS_YR'] = 1 if more_previous_yr > 0 else 0
+    return get_section_df(columns, pat_ids), thresholds
 
-    return target_df
 
-def POST_VANDERNILT(target_df):
+def get_section_dependencies(sections):
     '''
-    more variables
-    :param target_df:
-    :return:
+    find the sections every section has to run after: the earlier sections producing a column it requires or
+    produces, and the earlier sections requiring a column it produces, so every column is read and written in
+    the order of the sections
+    :param sections: list of section specs, see SECTIONS
+    :return: dict of section name to the set of the names of the sections it depends on
+    '''
+    dependencies = {}
+    for position, section in enumerate(sections):
+        dependencies[section['section']] = set(
+            earlier['section'] for earlier in sections[:position]
+            if set(earlier['produces']) & (set(section['requires']) | set(section['produces']))
+            or set(earlier['requires']) & set(section['produces']))
+    return dependencies
+
+def select_sections(sections, columns=None):
+    '''
+    find the sections needed for some columns: the sections producing them, and the earlier sections producing
+    the columns those require, in turn
+    :param sections: list of section specs, see SECTIONS
+    :param columns: names of the needed columns, None for all the columns
+    :return: list of the needed section specs, in the order of sections
+    '''
+    if columns is None:
+        return list(sections)
+    unknown = [column for column in columns if not any(column in section['produces'] for section in sections)]
+    if unknown:
+        raise ValueError('no section produces the columns %s' % ', '.join(unknown))
+
+    needed = set(section['section'] for section in sections if set(section['produces']) & set(columns))
+    for position in reversed(range(len(sections))):
+        section = sections[position]
+        if section['section'] in needed:
+            needed.update(earlier['section'] for earlier in sections[:position]
+                          if set(earlier['produces']) & set(section['requires']))
+    return [section for section in sections if section['section'] in needed]
+
+def get_source_columns(sections):
     '''
-    target_df['CREATININE_LEVEL_DIFF'] = target_df['CREATININE_LEVEL_MAX'] - target_df['CREATININE_LEVEL_MIN']
-    target_df['HEMOGLOBIN_LEVEL_DIFF'] = target_df['HEMOGLOBIN_LEVEL_MAX'] - target_df['HEMOGLOBIN_LEVEL_MIN']
-    target_df['BNP_LEVEL_DIFF'] = target_df['BNP_LEVEL_MAX'] - target_df['BNP_LEVEL_MIN']
+    find the source table columns to read for the sections: the used columns of their input tables, and only
+    PAT_ID of the other tables, which still list the patients
+    :param sections: list of section specs, see SECTIONS
+    :return: dict of table name to the list of columns to read
+    '''
+    names = set()
+    for section in sections:
+        for name in section['inputs']:
+            # the index events are found in the diagnoses and the visits
+            names.update(['diagnoses', 'visits_w_prov_type'] if name == 'index_events' else [name])
+    return {name: table['columns'] if name in names else ['PAT_ID'] for name, table in SOURCE_TABLES.items()}
+
+def plan_columns(columns=None):
+    '''
+    find what a run has to compute and read for some columns of the target table
+    :param columns: names of the requested columns, None for all the columns
+    :return: (section_columns, cohort, source_columns) with the columns to ask build_target for, None for all,
+    whether the cohort sections run, and the columns to read of every source table
+    '''
+    if columns is None:
+        return None, True, get_source_columns(SECTIONS)
+    cohort_columns = [column for section in COHORT_SECTIONS for column in section['produces']]
+    cohort = bool(set(columns) & set(cohort_columns))
+    section_columns = [column for column in columns if column not in cohort_columns and column != 'PERSON_ID']
+    if cohort:
+        section_columns += [column for section in COHORT_SECTIONS for column in section['requires']]
+    return section_columns, cohort, get_source_columns(select_sections(SECTIONS, section_columns))
+
+def call_section(section, target_df, inputs, legacy=False):
+    '''
+    run a section on its inputs, profiled as a stage of the run
+    :param section: section spec, see SECTIONS
+    :param target_df: target table with the PERSON_ID column
+    :param inputs: dict of the source tables by name and of 'index_events'
+    :param legacy: run the row-loop implementation of legacy.py instead, which reads the source tables itself
+    :return: section_df
+    '''
+    arguments = [inputs[name] for name in section['inputs']]
+    with profile_stage(section['section'], sum(len(df) for df in arguments), len(target_df)):
+        if legacy:
+            import legacy
+            return legacy.call_section(section, target_df)
+        return globals()[section['section']](target_df, *arguments)
+
+def run_sections(target_df, sections, inputs, threads=1, legacy_sections=()):
+    '''
+    Run the sections in waves. Every wave runs the sections whose dependencies have all run, on threads when more
+    than one is given, and then adds their columns to target_df. The columns are ordered as if the sections had
+    run one after another.
+    :param target_df: target table with the PERSON_ID column
+    :param sections: list of section specs, see SECTIONS
+    :param inputs: dict of the source tables by name and of 'index_events'
+    :param threads: number of threads a wave runs on
+    :param legacy_sections: names of the sections to run with their row-loop implementation, see legacy.py
+    :return: target_df
+    '''
+    dependencies = get_section_dependencies(sections)
+    section_columns = {}
+    pending = list(sections)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+    try:
+        while pending:
+            wave = [section for section in pending if dependencies[section['section']] <= set(section_columns)]
+            if executor is not None:
+                section_dfs = list(executor.map(lambda section: call_section(
+                    section, target_df, inputs, section['section'] in legacy_sections), wave))
+            else:
+                section_dfs = [call_section(section, target_df, inputs, section['section'] in legacy_sections)
+                               for section in wave]
+            for section, section_df in zip(wave, section_dfs):
+                target_df = add_columns(target_df, section_df)
+                section_columns[section['section']] = list(section_df.columns)
+            pending = [section for section in pending if section['section'] not in section_columns]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    columns = ['PERSON_ID']
+    for section in sections:
+        for column in section_columns[section['section']]:
+            if column not in columns:
+                columns.append(column)
+    return target_df[columns]
+
+def build_target(tables, pat_ids, threads=1, columns=None, legacy_sections=()):
+    '''
+    Generate the columns of the per-patient sections for the given patients. Everything the sections
+    compute for a patient only depends on the rows of that patient and of the visits they reach.
+    :param tables: dict of the source tables by name, with the date columns added
+    :param pat_ids: sorted patient ids, one target row each
+    :param threads: number of threads the independent sections run on
+    :param columns: only run the sections needed for these columns, all the sections when None
+    :param legacy_sections: names of the sections to run with their row-loop implementation, see legacy.py
+    :return: target_df
+    '''
+    sections = select_sections(SECTIONS, columns)
 
-    for iter, row in target_df.iterrows():
-        if target_df.at[iter,'CREATININE_LEVEL_DIFF'] >= np.percentile(target_df['CREATININE_LEVEL_DIFF'].values, 75):
-            target_df.at[iter, 'CREATININE_75DIFF_FLAG'] = 1
-        else:
-            target_df.at[iter, 'CREATININE_75DIFF_FLAG'] = 2
+    # index the rows of each patient once, so the sections do not scan the whole table per patient
+    for df in tables.values():
+        build_key_index(df, 'PAT_ID')
 
-        if target_df.at[iter,'HEMOGLOBIN_LEVEL_DIFF'] >= np.percentile(target_df['HEMOGLOBIN_LEVEL_DIFF'].values, 75):
-            target_df.at[iter, 'HEMOGLOBIN_75DIFF_FLAG'] = 1
-        else:
-            target_df.at[iter, 'HEMOGLOBIN_75DIFF_FLAG'] = 2
+    # find the index AMI admission of every patient once for all sections
+    inputs = dict(tables)
+    if any('index_events' in section['inputs'] for section in sections):
+        with profile_stage('resolve_index_events', len(tables['diagnoses']) + len(tables['visits_w_prov_type']),
+                           len(pat_ids)):
+            inputs['index_events'] = resolve_index_events(tables['diagnoses'], tables['visits_w_prov_type'])
+
+    # name the primary key of the target table as 'PERSON_ID'
+    target_df = pd.DataFrame({'PERSON_ID': get_person_ids(tables, pat_ids)})
+
+    # generate table columns by sections
+    return run_sections(target_df, sections, inputs, threads, legacy_sections)
+
+def slice_tables(tables, pat_ids):
+    '''
+    Cut the rows a shard of patients needs out of every source table: the rows of the patients themselves,
+    the rows of other patients that share one of their visit numbers, since several sections look up the
+    index visit in the whole table, and the visits that share a date with theirs, which the discharge
+    location is looked up by. The rows keep their table order so lookups find the same first row.
+    :param tables: dict of the source tables by name
+    :param pat_ids:
+    :return: dict of the sliced source tables by name
+    '''
+    rows = {name: df['PAT_ID'].isin(pat_ids).values for name, df in tables.items()}
+    visit_tables = [name for name, df in tables.items() if 'VISIT_NO' in df.columns]
+    visit_nos = pd.unique(np.concatenate([tables[name]['VISIT_NO'].values[rows[name]] for name in visit_tables]))
+    for name in visit_tables:
+        rows[name] = rows[name] | tables[name]['VISIT_NO'].isin(visit_nos).values
 
-        if target_df.at[iter,'BNP_LEVEL_DIFF'] >= np.percentile(target_df['BNP_LEVEL_DIFF'].values, 75):
-            target_df.at[iter, 'BNP_LEVEL_75DIFF_FLAG'] = 1
+    visits_df = tables['visits_w_prov_type']
+    visit_rows = rows['visits_w_prov_type']
+    dates = pd.unique(np.concatenate([visits_df['DSCH_DATE'].values[visit_rows],
+                                      visits_df['ADM_DATE'].values[visit_rows]]))
+    rows['visits_w_prov_type'] = visit_rows | visits_df['DSCH_DATE'].isin(dates).values
+
+    return {name: df[rows[name]] for name, df in tables.items()}
+
+def build_target_in_shards(tables, pat_ids, workers, threads=1, columns=None, legacy_sections=()):
+    '''
+    Generate the columns of the per-patient sections in a pool of worker processes. The patients are split
+    into shards by a hash of their id and every worker gets only the rows its shard needs. The shard
+    results are merged back into one table in the order of pat_ids.
+    :param tables: dict of the source tables by name, with the date columns added
+    :param pat_ids: sorted patient ids, one target row each
+    :param workers: number of worker processes
+    :param threads: number of threads the independent sections of a shard run on
+    :param columns: only run the sections needed for these columns, all the sections when None
+    :param legacy_sections: names of the sections to run with their row-loop implementation, see legacy.py
+    :return: target_df
+    '''
+    shard_of = pd.util.hash_array(np.asarray(pat_ids, dtype=object)) % workers
+    shards = [pat_ids[shard_of == shard] for shard in range(workers)]
+    shards = [shard_ids for shard_ids in shards if len(shard_ids) > 0]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        settings = (_PROFILE['enabled'], _PROFILE['directory'])
+        futures = [executor.submit(call_profiled, settings, build_target, slice_tables(tables, shard_ids), shard_ids,
+                                   threads, columns, legacy_sections) for shard_ids in shards]
+        shard_dfs = []
+        for future in futures:
+            shard_df, records = future.result()
+            shard_dfs.append(shard_df)
+            _PROFILE['records'].extend(records)
+
+    return merge_targets(shard_dfs)
+
+def merge_targets(target_dfs):
+    '''
+    Merge target tables of disjoint sets of patients into one table sorted by PERSON_ID.
+    :param target_dfs: list of target_df
+    :return: target_df
+    '''
+    columns = merge_columns([part_df.columns for part_df in target_dfs])
+    target_df = pd.concat(target_dfs, ignore_index=True, sort=False)[columns]
+    target_df = target_df.iloc[np.argsort(target_df['PERSON_ID'].values, kind='stable')]
+    return target_df.reset_index(drop=True)
+
+def merge_columns(column_lists):
+    '''
+    Merge the column orders of target tables of disjoint sets of patients. Columns that only some tables have,
+    such as VISIT_NO, go after the column they follow in their table.
+    :param column_lists: list of the column lists of the tables
+    :return: list of all the columns
+    '''
+    columns = []
+    for part_columns in column_lists:
+        for position, column in enumerate(part_columns):
+            if column not in columns:
+                columns.insert(columns.index(part_columns[position - 1]) + 1 if position > 0 else 0, column)
+    return columns
+
+def sum_hashes(keys, hashes):
+    '''
+    add up the row hashes of every key, wrapping around, so the sum does not depend on the order of the keys
+    :param keys: array of keys, missing keys are left out
+    :param hashes: uint64 array aligned with keys
+    :return: Series of the uint64 sums indexed by key
+    '''
+    labels, uniques = pd.factorize(keys)
+    present = labels >= 0
+    sums = np.zeros(len(uniques), dtype=np.uint64)
+    np.add.at(sums, labels[present], hashes[present])
+    return pd.Series(sums, index=uniques)
+
+def get_row_hashes(df, key):
+    '''
+    hash the rows of a table together with their position among the rows of the same key, so that
+    reordering the rows of a key changes their hashes but rows of other keys do not
+    :param df:
+    :param key: key column
+    :return: uint64 array aligned with the rows
+    '''
+    positions = df.groupby(key, sort=False, dropna=False).cumcount().values
+    return pd.util.hash_array(pd.util.hash_pandas_object(df, index=False).values + positions.astype(np.uint64))
+
+def get_patient_fingerprints(tables, pat_ids):
+    '''
+    Hash, for every patient, the source rows slice_tables cuts for them: their own rows, the rows sharing one
+    of their visit numbers and the visits sharing a date with theirs. A patient keeps the same fingerprint as
+    long as these rows do not change.
+    :param tables: dict of the source tables by name, with the date columns added
+    :param pat_ids:
+    :return: Series of uint64 fingerprints indexed by patient id
+    '''
+    parts = []
+    visit_tables = [name for name, df in tables.items() if 'VISIT_NO' in df.columns]
+    patient_visits = pd.concat([tables[name][['PAT_ID', 'VISIT_NO']] for name in visit_tables])\
+        .dropna().drop_duplicates()
+    for name, df in tables.items():
+        parts.append(sum_hashes(df['PAT_ID'].values, get_row_hashes(df, 'PAT_ID')))
+        if name in visit_tables:
+            visit_hashes = sum_hashes(df['VISIT_NO'].values, get_row_hashes(df, 'VISIT_NO'))
+            parts.append(sum_hashes(patient_visits['PAT_ID'].values,
+                                    visit_hashes.reindex(patient_visits['VISIT_NO'].values, fill_value=0).values))
+
+    # the dates of the visits a patient reaches, and the hashes of the visits discharged on each date
+    visits_df = tables['visits_w_prov_type']
+    reached = pd.concat([visits_df[['PAT_ID', 'ADM_DATE', 'DSCH_DATE']],
+                         patient_visits.merge(visits_df[['VISIT_NO', 'ADM_DATE', 'DSCH_DATE']], on='VISIT_NO')
+                         [['PAT_ID', 'ADM_DATE', 'DSCH_DATE']]])
+    patient_dates = pd.concat([reached[['PAT_ID', 'ADM_DATE']].set_axis(['PAT_ID', 'DATE'], axis=1),
+                               reached[['PAT_ID', 'DSCH_DATE']].set_axis(['PAT_ID', 'DATE'], axis=1)])\
+        .dropna().drop_duplicates()
+    date_hashes = sum_hashes(visits_df['DSCH_DATE'].values, get_row_hashes(visits_df, 'DSCH_DATE'))
+    parts.append(sum_hashes(patient_dates['PAT_ID'].values,
+                            date_hashes.reindex(patient_dates['DATE'].values, fill_value=0).values))
+
+    parts = pd.DataFrame({position: part.reindex(pat_ids, fill_value=0).values for position, part in enumerate(parts)})
+    return pd.Series(pd.util.hash_pandas_object(parts, index=False).values, index=pat_ids)
+
+def build_target_incrementally(tables, pat_ids, workers, threads=1):
+    '''
+    Generate the columns of the per-patient sections again only for the patients whose source rows changed
+    since the last incremental run, and reuse the stored columns of the others. The state of the last run,
+    its per-patient target table and fingerprints, is kept in INCREMENTAL_STATE_PATH, and is only used with
+    the same version of this script.
+    :param tables: dict of the source tables by name, with the date columns added
+    :param pat_ids: sorted patient ids, one target row each
+    :param workers: number of worker processes
+    :param threads: number of threads the independent sections run on
+    :return: target_df
+    '''
+    script_hash = get_file_hash(os.path.abspath(__file__))
+    fingerprints = get_patient_fingerprints(tables, pat_ids)
+    changed = np.ones(len(pat_ids), dtype=bool)
+    kept_df = None
+    if os.path.exists(INCREMENTAL_STATE_PATH):
+        state = pd.read_pickle(INCREMENTAL_STATE_PATH)
+        if state['script'] == script_hash:
+            changed = state['fingerprints'].reindex(pat_ids).values != fingerprints.values
+            kept_df = state['target'][state['target']['PERSON_ID'].isin(pat_ids[~changed])]
+    changed_ids = pat_ids[changed]
+    print('incremental run: %d of %d patients changed' % (len(changed_ids), len(pat_ids)))
+
+    target_dfs = [kept_df] if kept_df is not None and len(kept_df) > 0 else []
+    if len(changed_ids) > 0:
+        if workers > 1:
+            target_dfs.append(build_target_in_shards(tables, changed_ids, workers, threads))
         else:
-            target_df.at[iter, 'BNP_LEVEL_75DIFF_FLAG'] = 2
+            target_dfs.append(build_target(slice_tables(tables, changed_ids), changed_ids, threads))
+    target_df = merge_targets(target_dfs)
 
+    pd.to_pickle({'script': script_hash, 'fingerprints': fingerprints, 'target': target_df}, INCREMENTAL_STATE_PATH)
     return target_df
 
 
-if __name__ == '__main__':
-    # reading files into panda dataframes
-    diagnoses_df = pd.read_csv(DIAGNOSES_PATH, dtype=object, sep='|', quoting=3, na_filter=False)
-    labs_df = pd.read_csv(LABS_PATH, dtype=object, sep='|', quoting=3, na_filter=False)
-    med_admin_df = pd.read_csv(MED_ADMIN_PATH, dtype=object, sep='|', quoting=3, na_filter=False)
-    med_orders_df = pd.read_csv(MED_ORDERS_PATH, dtype=object, sep='|', quoting=3, na_filter=False)
-    procedures_df = pd.read_csv(PROCEDURES_PATH, dtype=object, sep='|', quoting=3, na_filter=False)
-    visits_w_prov_type_df = pd.read_csv(VISITS_W_PROV_TYPE_PATH, dtype=object, sep='|', quoting=3, na_filter=False)
-    demographics_df = pd.read_csv(DEMOGRAPHICS_PATH, dtype=object, sep='|', quoting=3, na_filter=False)
-
-    # choose first columns for testing purpose. Saving some time
-    takehead = 0
-    if takehead > 0:
-        diagnoses_df = diagnoses_df.head(takehead)
-        labs_df = labs_df.head(takehead)
-        med_admin_df = med_admin_df.head(takehead)
-        med_orders_df = med_orders_df.head(takehead)
-        procedures_df = procedures_df.head(takehead)
-        visits_w_prov_type_df = visits_w_prov_type_df.head(takehead)
-        demographics_df = demographics_df.head(takehead)
-
-    # remove all quotations for data unity purpose
-    diagnoses_df = diagnoses_df.applymap(remove_quotes)
-    labs_df = labs_df.applymap(remove_quotes)
-    med_admin_df = med_admin_df.applymap(remove_quotes)
-    med_orders_df = med_orders_df.applymap(remove_quotes)
-    procedures_df = procedures_df.applymap(remove_quotes)
-    demographics_df = demographics_df.applymap(remove_quotes)
-
-    # create the target dataframe for each unique patient as primary key
-    patid_diagnoses = list(diagnoses_df['PAT_ID'].values)
-    patid_labs = list(labs_df['PAT_ID'].values)
-    patid_med_admin = list(med_admin_df['PAT_ID'].values)
-    patid_med_orders = list(med_orders_df['PAT_ID'].values)
-    patid_procedure = list(procedures_df['PAT_ID'].values)
-    patid_visits_w_prov_type = list(visits_w_prov_type_df['PAT_ID'].values)
-    patid_demographics = list(demographics_df['PAT_ID'].values)
-    patid_all = patid_diagnoses + patid_labs + patid_med_admin+ patid_med_orders\
-                + patid_procedure + patid_visits_w_prov_type + patid_demographics
-    unique_pat_id = np.unique(patid_all)
-    target_df = pd.DataFrame(unique_pat_id)
-    # name the primary key of the target table as 'PERSON_ID'
-    target_df.columns = ['PERSON_ID']
+def read_key_chunks(name, keys):
+    '''
+    Read the key columns of a source table in chunks of STREAM_CHUNK_ROWS rows, without the quotation marks
+    if load_table removes them
+    :param name: key of SOURCE_TABLES
+    :param keys: key columns to read, the ones the table does not have are left out
+    :return: generator of DataFrames
+    '''
+    table = SOURCE_TABLES[name]
+    with open(table['path'], 'rb') as f:
+        header = f.readline().decode().rstrip('\r\n')
+    if table['strip_quotes']:
+        header = header.replace('"', '')
+    header = header.split('|')
+    positions = [header.index(key) for key in keys if key in header and key in table['columns']]
+    for chunk in pd.read_csv(table['path'], sep='|', dtype=object, usecols=positions, quoting=3, na_filter=False,
+                             chunksize=STREAM_CHUNK_ROWS):
+        chunk.columns = [header[position] for position in sorted(positions)]
+        if table['strip_quotes']:
+            chunk = chunk.apply(lambda column: column.str.replace('"', '', regex=False))
+        yield chunk
+
+def get_block_bounds(block_count):
+    '''
+    Split the sorted patient ids of all the source tables into blocks of about the same number of patients,
+    and find the blocks that need the rows of every visit number: the blocks of the patients having it.
+    The tables are read in chunks, only the ids and visit numbers are kept.
+    :param block_count:
+    :return: (bounds, visit_blocks) where patient pat_id is in block bisect.bisect_right(bounds, pat_id), and
+    visit_blocks maps the visit numbers of patients of more than one block to the set of their blocks
+    '''
+    pat_ids = set()
+    visit_pat_ids = collections.defaultdict(set)
+    for name in SOURCE_TABLES:
+        for chunk in read_key_chunks(name, ['PAT_ID', 'VISIT_NO']):
+            pat_ids.update(chunk['PAT_ID'].values)
+            if 'VISIT_NO' in chunk.columns:
+                chunk = chunk.drop_duplicates()
+                for pat_id, visit_no in zip(chunk['PAT_ID'].values, chunk['VISIT_NO'].values):
+                    visit_pat_ids[visit_no].add(pat_id)
+
+    pat_ids = sorted(pat_ids)
+    bounds = sorted(set(pat_ids[len(pat_ids) * block // block_count] for block in range(1, block_count)))
+    visit_blocks = {}
+    for visit_no, visit_pats in visit_pat_ids.items():
+        blocks = set(bisect.bisect_right(bounds, pat_id) for pat_id in visit_pats)
+        if len(blocks) > 1:
+            visit_blocks[visit_no] = blocks
+    return bounds, visit_blocks
+
+def partition_table(name, bounds, visit_blocks, directory):
+    '''
+    Write the rows of a source table into one file per block of patients, line by line: the rows of the patients
+    of the block and the rows of the visit numbers the block needs. The rows keep their order.
+    :param name: key of SOURCE_TABLES
+    :param bounds: block bounds of get_block_bounds
+    :param visit_blocks: blocks of the shared visit numbers of get_block_bounds
+    :param directory: directory the block files are written to
+    :return: list of the block file paths
+    '''
+    table = SOURCE_TABLES[name]
+    paths = [os.path.join(directory, '%s.%d.txt' % (name, block)) for block in range(len(bounds) + 1)]
+    files = [open(path, 'wb') for path in paths]
+    try:
+        with open(table['path'], 'rb') as source:
+            header = source.readline()
+            fields = header.decode().rstrip('\r\n').replace('"', '').split('|')
+            pat_column = fields.index('PAT_ID')
+            visit_column = fields.index('VISIT_NO') if 'VISIT_NO' in table['columns'] else None
+            for f in files:
+                f.write(header)
+            for line in source:
+                values = line.rstrip(b'\r\n').split(b'|')
+                if len(values) <= pat_column:
+                    continue
+                pat_id = values[pat_column].decode()
+                if table['strip_quotes']:
+                    pat_id = pat_id.replace('"', '')
+                blocks = {bisect.bisect_right(bounds, pat_id)}
+                if visit_column is not None and len(values) > visit_column:
+                    visit_no = values[visit_column].decode()
+                    if table['strip_quotes']:
+                        visit_no = visit_no.replace('"', '')
+                    blocks.update(visit_blocks.get(visit_no, ()))
+                for block in blocks:
+                    files[block].write(line)
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+def iterate_patient_blocks(block_count, engine='c', directory=BLOCKS_DIRECTORY, source_columns=None):
+    '''
+    Partition the source tables by blocks of patients on disk, then read them back one block at a time.
+    The visits are read whole once, since the discharge location is looked up by date among the visits of all
+    the patients, every other table only one block at a time.
+    :param block_count:
+    :param engine: 'c' or 'pyarrow'
+    :param directory: directory of the block files
+    :param source_columns: dict of table name to the columns to read, all the used columns when None
+    :return: generator of (pat_ids, tables) with the sorted patient ids of a block and the source tables sliced
+    for them, in the order of the patient ids
+    '''
+    bounds, visit_blocks = get_block_bounds(block_count)
+    paths = {name: partition_table(name, bounds, visit_blocks, directory)
+             for name in SOURCE_TABLES if name != 'visits_w_prov_type'}
+    source_columns = source_columns or {}
+    visits_df = add_date_columns(load_table('visits_w_prov_type', engine,
+                                            columns=source_columns.get('visits_w_prov_type')))
+    block_bounds = np.array(bounds, dtype=object)
+
+    for block in range(len(bounds) + 1):
+        tables = {name: add_date_columns(load_table(name, engine, block_paths[block], source_columns.get(name)))
+                  for name, block_paths in paths.items()}
+        tables['visits_w_prov_type'] = visits_df
+        # the visits are encoded again with the vocabulary of every block
+        pat_ids = encode_keys(tables)['PAT_ID']
+        pat_ids = pat_ids[np.searchsorted(block_bounds, pat_ids, side='right') == block]
+        if len(pat_ids) > 0:
+            yield pat_ids, slice_tables(tables, pat_ids)
+        del tables
+
+def write_target_in_blocks(block_count, engine='c', workers=1, thresholds=None, threads=1, columns=None):
+    '''
+    Generate the target table one block of patients at a time and append the blocks to TARGET_PATH, so only one
+    block of the large source tables is in memory at a time. The per-patient columns of every block are kept on
+    disk until the cohort thresholds over all the blocks are known.
+    :param block_count: number of blocks of patients
+    :param engine: 'c' or 'pyarrow'
+    :param workers: number of worker processes per block
+    :param thresholds: frozen cohort thresholds, computed over all the patients when not given
+    :param threads: number of threads the independent sections run on
+    :param columns: names of the columns to compute and write, all the columns when None
+    :return: the cohort thresholds used
+    '''
+    section_columns, cohort, source_columns = plan_columns(columns)
+    os.makedirs(BLOCKS_DIRECTORY, exist_ok=True)
+    try:
+        block_paths = []
+        column_lists = []
+        sources = collections.defaultdict(list)
+        for pat_ids, tables in iterate_patient_blocks(block_count, engine, source_columns=source_columns):
+            if workers > 1:
+                block_df = build_target_in_shards(tables, pat_ids, workers, threads, section_columns)
+            else:
+                block_df = build_target(tables, pat_ids, threads, section_columns)
+            if cohort:
+                for source, values in get_cohort_sources(block_df).items():
+                    sources[source].append(values)
+            block_paths.append(os.path.join(BLOCKS_DIRECTORY, 'target.%d.pkl' % len(block_paths)))
+            column_lists.append(list(block_df.columns))
+            block_df.to_pickle(block_paths[-1])
+            del block_df, tables
+
+        if cohort and thresholds is None:
+            thresholds = compute_cohort_thresholds({source: np.concatenate(values) for source, values in sources.items()})
+        block_columns = merge_columns(column_lists)
+        first_row = 0
+        for block_path in block_paths:
+            block_df = pd.read_pickle(block_path).reindex(columns=block_columns)
+            if cohort:
+                with profile_stage('POST_VANDERNILT', len(block_df), len(block_df)):
+                    section_df, thresholds = POST_VANDERNILT(block_df, thresholds)
+                block_df = add_columns(block_df, section_df)
+            if columns is not None:
+                block_df = block_df.reindex(columns=['PERSON_ID'] + [column for column in columns if column != 'PERSON_ID'])
+            block_df.index = pd.RangeIndex(first_row, first_row + len(block_df))
+            block_df.to_csv(TARGET_PATH, mode='w' if first_row == 0 else 'a', header=first_row == 0)
+            first_row += len(block_df)
+    finally:
+        shutil.rmtree(BLOCKS_DIRECTORY, ignore_errors=True)
+    return thresholds
 
-    # generate table columns by sections
-    target_df = DEMOGRAPHICS(target_df, demographics_df, diagnoses_df)
-    target_df = PRIOR_MONTH_DIAGNOSIS(target_df, diagnoses_df)
-    target_df = HOSPITAL_SCORE(target_df, procedures_df, diagnoses_df, visits_w_prov_type_df, labs_df)
-    target_df = LABORATORIES(target_df, diagnoses_df, labs_df)
-    target_df = PRESENTATION_DISEASE(target_df, diagnoses_df, visits_w_prov_type_df, med_orders_df, procedures_df)
-    target_df = ADMINISTRATIVE_DATA(target_df, diagnoses_df, visits_w_prov_type_df)
-    target_df = DISCHARGE_INFORMATION(target_df,  diagnoses_df, visits_w_prov_type_df, med_orders_df)
-    target_df = DEMOGRAPHICS_ADDITIONS(target_df, visits_w_prov_type_df, diagnoses_df)
-    target_df = PATIENT_HISTORY(target_df, diagnoses_df, visits_w_prov_type_df)
-    target_df = IN_HOSPITAL_OUTCOMES(target_df, diagnoses_df, procedures_df)
-    target_df = COMORBIDITIES(target_df)
-    target_df = LACE_SCORE(target_df)
-    target_df = ENRICHD_SCORE(target_df, diagnoses_df)
-    target_df = GRACE_SCORE(target_df, labs_df)
-    target_df = POLYNOMIAL_TERMS(target_df)
-    target_df = DATA_MANAGEMENT(target_df, visits_w_prov_type_df)
-    target_df = POST_VANDERNILT(target_df)
-    #target_df = INTERACTION_TERMS(target_df)
-
-    # write the whole table to csv file
-    target_df.fillna('')
-    target_df.to_csv(TARGET_PATH)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert the raw data of the Dartmouth Project into a structured table.')
+    parser.add_argument('--engine', choices=['c', 'pyarrow'], default='c',
+                        help='csv parser used to read the source tables, pyarrow needs the pyarrow package')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help='parse the source tables again and rewrite their binary cache')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes that compute the per-patient sections in shards of patients')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='number of threads the sections that do not depend on each other run on')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only compute the patients whose source rows changed since the last incremental run')
+    parser.add_argument('--blocks', type=int, default=0, metavar='N',
+                        help='stream the patients in N blocks partitioned on disk, for extracts larger than memory')
+    parser.add_argument('--columns', metavar='COLUMN,...',
+                        help='only compute and write these columns, and read only the source tables they need')
+    parser.add_argument('--thresholds', metavar='PATH',
+                        help='json file of cohort thresholds to use instead of computing them over this cohort')
+    parser.add_argument('--legacy-sections', metavar='SECTION,...',
+                        help='run these sections, or all, with the row-loop implementation of legacy.py')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='write the time and memory of every section and ingestion step to a .json or .csv file')
+    parser.add_argument('--profile-dumps', metavar='DIRECTORY',
+                        help='write a cProfile dump of every section and ingestion step to DIRECTORY')
+    parser.add_argument('--save-thresholds', metavar='PATH',
+                        help='write the cohort thresholds used to a json file')
+    args = parser.parse_args()
+    if args.blocks > 0 and args.incremental:
+        parser.error('--blocks cannot be combined with --incremental')
+    if args.columns and args.incremental:
+        parser.error('--columns cannot be combined with --incremental')
+    if args.legacy_sections and (args.blocks > 0 or args.incremental):
+        parser.error('--legacy-sections cannot be combined with --blocks or --incremental')
+
+    # the sections to run with their row-loop implementation, all of them for 'all'
+    section_names = [section['section'] for section in SECTIONS + COHORT_SECTIONS]
+    legacy_sections = [name.strip() for name in args.legacy_sections.split(',')] if args.legacy_sections else []
+    if legacy_sections == ['all']:
+        legacy_sections = section_names
+    if set(legacy_sections) - set(section_names):
+        parser.error('unknown sections %s' % ', '.join(sorted(set(legacy_sections) - set(section_names))))
+    if 'POST_VANDERNILT' in legacy_sections and (args.thresholds or args.save_thresholds):
+        parser.error('the legacy POST_VANDERNILT cannot use or save --thresholds')
+
+    # find the sections and the source table columns the requested columns need
+    columns = [column.strip() for column in args.columns.split(',')] if args.columns else None
+    try:
+        section_columns, cohort, source_columns = plan_columns(columns)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.profile or args.profile_dumps:
+        start_profiling(args.profile_dumps)
+
+    # the cohort thresholds are computed over all the patients, unless they are frozen
+    thresholds = None
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+
+    if args.blocks > 0:
+        # the blocks are written to the csv file one after another
+        thresholds = write_target_in_blocks(args.blocks, args.engine, args.workers, thresholds, args.threads,
+                                            columns)
+    else:
+        # reading files into panda dataframes, without the quotation marks for data unity purpose.
+        # The parsed tables are cached next to the source files for the next run.
+        diagnoses_df = load_cached_table('diagnoses', args.engine, args.rebuild_cache,
+                                         source_columns['diagnoses'])
+        labs_df = load_cached_table('labs', args.engine, args.rebuild_cache,
+                                    source_columns['labs'])
+        med_admin_df = load_cached_table('med_admin', args.engine, args.rebuild_cache,
+                                         source_columns['med_admin'])
+        med_orders_df = load_cached_table('med_orders', args.engine, args.rebuild_cache,
+                                          source_columns['med_orders'])
+        procedures_df = load_cached_table('procedures', args.engine, args.rebuild_cache,
+                                          source_columns['procedures'])
+        visits_w_prov_type_df = load_cached_table('visits_w_prov_type', args.engine, args.rebuild_cache,
+                                                  source_columns['visits_w_prov_type'])
+        demographics_df = load_cached_table('demographics', args.engine, args.rebuild_cache,
+                                            source_columns['demographics'])
+
+        # choose first columns for testing purpose. Saving some time
+        takehead = 0
+        if takehead > 0:
+            diagnoses_df = diagnoses_df.head(takehead)
+            labs_df = labs_df.head(takehead)
+            med_admin_df = med_admin_df.head(takehead)
+            med_orders_df = med_orders_df.head(takehead)
+            procedures_df = procedures_df.head(takehead)
+            visits_w_prov_type_df = visits_w_prov_type_df.head(takehead)
+            demographics_df = demographics_df.head(takehead)
+
+        # convert the dates to day numbers once
+        for df in [diagnoses_df, labs_df, procedures_df, visits_w_prov_type_df, demographics_df]:
+            add_date_columns(df)
+
+        # encode the ids and codes of all the tables into shared integer codes, the sorted patient ids of all the
+        # tables are the vocabulary of PAT_ID. Create the target dataframe for each unique patient as primary key
+        tables = {'diagnoses': diagnoses_df, 'labs': labs_df, 'med_admin': med_admin_df, 'med_orders': med_orders_df,
+                  'procedures': procedures_df, 'visits_w_prov_type': visits_w_prov_type_df, 'demographics': demographics_df}
+        unique_pat_id = encode_keys(tables)['PAT_ID']
+
+        # generate table columns by sections, in shards of patients when more than one worker is asked for, and only
+        # for the changed patients in an incremental run
+        if args.incremental:
+            target_df = build_target_incrementally(tables, unique_pat_id, args.workers, args.threads)
+        elif args.workers > 1:
+            target_df = build_target_in_shards(tables, unique_pat_id, args.workers, args.threads, section_columns,
+                                               legacy_sections)
+        else:
+            target_df = build_target(tables, unique_pat_id, args.threads, section_columns, legacy_sections)
+
+        # the cohort level sections need all the patients together
+        if cohort and 'POST_VANDERNILT' in legacy_sections:
+            # the legacy section computes its thresholds without reporting them
+            target_df = add_columns(target_df, call_section(COHORT_SECTIONS[0], target_df, {}, legacy=True))
+        elif cohort:
+            with profile_stage('POST_VANDERNILT', len(target_df), len(target_df)):
+                section_df, thresholds = POST_VANDERNILT(target_df, thresholds)
+            target_df = add_columns(target_df, section_df)
+        if columns is not None:
+            target_df = target_df.reindex(columns=['PERSON_ID'] + [column for column in columns if column != 'PERSON_ID'])
+
+        # write the whole table to csv file
+        with profile_stage('to_csv', 0, len(target_df)):
+            target_df.to_csv(TARGET_PATH)
+
+    if args.save_thresholds:
+        with open(args.save_thresholds, 'w') as f:
+            json.dump(thresholds, f, indent=2)
+    if args.profile:
+        write_profile_report(args.profile)
@@ -0,0 +1,336 @@
+'''
+
+This code generates a synthetic cohort in the format of the IRB_90679 extracts, so run.py can be run and timed
+without the real data. Nothing in it comes from a patient: the codes are drawn from the code lists and patterns of
+run.py, mixed with codes none of them match, and everything else is random.
+
+How to use:
+
+$ python3 synthetic.py DIRECTORY --patients 10000 --seed 7
+
+The script writes the seven source tables with the file names and columns run.py reads into DIRECTORY. The same
+seed and number of patients always give the same files.
+
+Options:
+
+--patients N        number of patients, from a thousand to a million or more
+--seed N            seed of the random generator
+
+'''
+
+import argparse
+import os
+import re
+import numpy as np
+import pandas as pd
+
+import run
+
+
+# patients generated at a time, so the memory needed does not grow with the cohort. The files depend on it through
+# the random streams, so it is fixed.
+CHUNK_PATIENTS = 50000
+
+# the first day of the generated calendar, and the range of admission days after it
+FIRST_DATE = pd.Timestamp('2015-01-01')
+ADMISSION_DAYS = 1200
+# the birth days before FIRST_DATE
+BIRTH_DAYS = (8000, 30000)
+
+VISITS_PER_PATIENT = (1, 6)
+LENGTH_OF_STAY = (0, 15)
+DIAGNOSES_PER_VISIT = (1, 8)
+LABS_PER_VISIT = (0, 12)
+MEDICATIONS_PER_VISIT = (0, 4)
+PROCEDURES_PER_VISIT = (0, 3)
+# share of the patients with an AMI diagnosis, and share of their visits with one
+AMI_PATIENTS = 0.85
+AMI_VISITS = 0.6
+# share of the patients with a demographics row
+DEMOGRAPHICS_PATIENTS = 0.9
+# share of the diagnoses with a code no category of run.py matches
+OTHER_CODES = 0.5
+# chronic codes of a patient, and the share of the diagnoses with one of them, so codes come back on later visits
+CHRONIC_CODES = 4
+CHRONIC_DIAGNOSES = 0.3
+# share of the values written in stray quotation marks, as some values of the extracts are
+QUOTED_VALUES = 0.1
+
+HEADERS = {
+    'diagnoses': ['PAT_ID', 'VISIT_NO', 'ADM_DATE', 'CODE', 'CODE_VERSION', 'CODE_DESC'],
+    'labs': ['PAT_ID', 'VISIT_NO', 'ITEM', 'OBS_VALUE', 'OBS_VALUE_NUM', 'OBS_DTM'],
+    'med_admin': ['PAT_ID', 'VISIT_NO', 'ITEM'],
+    'med_orders': ['PAT_ID', 'VISIT_NO', 'ITEM', 'ORDER_TYPE'],
+    'procedures': ['PAT_ID', 'VISIT_NO', 'CODE', 'CODE_DESC', 'PROC_DT'],
+    'visits_w_prov_type': ['PAT_ID', 'VISIT_NO', 'ADM_DATE', 'DSCH_DATE', 'PAT_CLASS', 'CLINICAL_LOS', 'VISIT_TYPE'],
+    'demographics': ['PAT_ID', 'VISIT_NO', 'PAT_GENDER', 'SSN', 'ZIP', 'FIRST_NAME', 'LAST_NAME', 'MIDDLE_NAME',
+                     'DOB', 'AMI_ADM_DATE', 'AMI_DSCH_DATE'],
+}
+
+LAB_ITEMS = [item for items in run.LAB_ITEM_ALIASES.values() for item in items] + ['Glucose', 'Potassium']
+LAB_TEXT_VALUES = ['NEG', 'POS', '']
+ORDER_TYPES = ['DISCHARGE PRESCRIPTION', 'INPATIENT MEDICATION', 'HISTORICAL MEDICATION', 'OUTPATIENT PRESCRIPTION']
+OTHER_MEDICATIONS = ['ACETAMINOPHEN 500 MG', 'ONDANSETRON 4 MG', 'HEPARIN 5000 UNITS', 'atorvastatin 40 mg']
+OTHER_PROCEDURE_CODES = ['88.72', '02703ZZ', '99.04', '93306']
+PATIENT_CLASSES = ['EMERGENCY', 'INPATIENT', 'OUTPATIENT', 'OBSERVATION']
+VISIT_TYPES = ['HOME', 'SNF', 'REHAB', 'EXPIRED']
+OTHER_DESCRIPTIONS = ['SOMETHING', 'OTHER']
+
+
+def get_pattern_example(pattern):
+    '''
+    give a code pattern of run.py, return a code it matches, with every wildcard filled with 1
+    :param pattern:
+    :return:
+    '''
+    example = re.sub(r'\[\^\\\.\]\*|\.\*', '1', pattern)
+    example = re.sub(r'(?<!\\)\.', '1', example)
+    return example.replace('\\', '')
+
+def get_code_pools():
+    '''
+    collect the diagnosis codes and descriptions of the code lists and patterns of run.py. List values with
+    spaces are descriptions, like CHF_CODE, the others are codes.
+    :return: (codes, descriptions)
+    '''
+    codes = set()
+    descriptions = set(OTHER_DESCRIPTIONS)
+    for category in run.CODE_CATEGORIES:
+        for value in getattr(run, category):
+            if '_PATTERN' in category:
+                codes.add(get_pattern_example(value))
+            elif ' ' in value:
+                descriptions.add(value)
+            elif category.endswith('_NAMES'):
+                continue
+            else:
+                codes.add(value)
+    return sorted(codes), sorted(descriptions)
+
+def get_medications():
+    '''
+    collect medication names of the discharge medication classes and clopidogrel names of run.py, with some
+    names of no class
+    :return:
+    '''
+    medications = list(run.CLOPIDOGREL_NAMES) + OTHER_MEDICATIONS
+    for category in run.MEDICATION_CATEGORIES:
+        medications += ['%s %d MG' % (name, dose) for name in getattr(run, category) for dose in (10, 25)]
+    return sorted(set(medications))
+
+def get_other_codes(random, count):
+    '''
+    give random ICD-9 and ICD-10 like codes, most of which no category of run.py matches
+    :param random: np.random.RandomState
+    :param count:
+    :return:
+    '''
+    icd9 = np.char.add(np.char.add(random.randint(800, 1000, count).astype(str), '.'), random.randint(0, 10, count).astype(str))
+    icd10 = np.char.add(np.char.add(np.array(list('STUVWXY'))[random.randint(0, 7, count)],
+                                    random.randint(10, 100, count).astype(str)),
+                        np.char.add('.', random.randint(0, 10, count).astype(str)))
+    return np.where(random.random_sample(count) < 0.5, icd9, icd10)
+
+def format_days(days, separator='/'):
+    '''
+    give day numbers after FIRST_DATE, return them as mm/dd/yyyy dates
+    :param days: np.array of int
+    :param separator: '/' or '-'
+    :return: np.array of str
+    '''
+    low = days.min()
+    calendar = pd.date_range(FIRST_DATE + pd.Timedelta(days=int(low)), periods=int(days.max() - low) + 1)
+    labels = np.asarray(calendar.strftime('%m{0}%d{0}%Y'.format(separator)), dtype=object)
+    return labels[days - low]
+
+def quote(random, values):
+    '''
+    put some of the values in quotation marks
+    :param random: np.random.RandomState
+    :param values: np.array of str
+    :return: np.array of object
+    '''
+    values = np.asarray(values, dtype=object)
+    quoted = random.random_sample(len(values)) < QUOTED_VALUES
+    values[quoted] = '"' + values[quoted] + '"'
+    return values
+
+def repeat_rows(random, counts_range, visit_count):
+    '''
+    give the number of rows of every visit, return the visit of every row
+    :param random: np.random.RandomState
+    :param counts_range: (lowest, highest) number of rows of a visit
+    :param visit_count: number of visits
+    :return: np.array of the visit positions
+    '''
+    counts = random.randint(counts_range[0], counts_range[1] + 1, visit_count)
+    return np.repeat(np.arange(visit_count), counts)
+
+def generate_chunk(random, first_patient, patient_count, first_visit, pools):
+    '''
+    Generate the rows of all source tables for some patients.
+    :param random: np.random.RandomState of the chunk
+    :param first_patient: number of the first patient
+    :param patient_count: number of patients
+    :param first_visit: number of the first visit
+    :param pools: dict of the codes, descriptions and medications to draw from
+    :return: (dict of table name to a DataFrame of the HEADERS columns, number of visits)
+    '''
+    patients = first_patient + np.arange(patient_count)
+    pat_ids = np.char.add('P', np.char.zfill(patients.astype(str), 7)).astype(object)
+    visit_counts = random.randint(VISITS_PER_PATIENT[0], VISITS_PER_PATIENT[1] + 1, patient_count)
+    visit_count = visit_counts.sum()
+    visit_patients = np.repeat(np.arange(patient_count), visit_counts)
+    visit_pat_ids = pat_ids[visit_patients]
+    visit_nos = np.char.add('V', np.char.zfill((first_visit + np.arange(visit_count)).astype(str), 9)).astype(object)
+    # the visits of a patient are numbered in the order of their admissions
+    admissions = random.randint(0, ADMISSION_DAYS, visit_count)
+    admissions = admissions[np.lexsort((admissions, visit_patients))]
+    discharges = admissions + random.randint(LENGTH_OF_STAY[0], LENGTH_OF_STAY[1] + 1, visit_count)
+    admission_dates = format_days(admissions)
+    discharge_dates = format_days(discharges)
+    tables = {}
+
+    discharge_written = np.where(random.random_sample(visit_count) < 0.93, discharge_dates, '')
+    tables['visits_w_prov_type'] = pd.DataFrame({
+        'PAT_ID': visit_pat_ids, 'VISIT_NO': visit_nos, 'ADM_DATE': admission_dates,
+        'DSCH_DATE': discharge_written,
+        'PAT_CLASS': np.array(PATIENT_CLASSES, dtype=object)[random.randint(0, len(PATIENT_CLASSES), visit_count)],
+        'CLINICAL_LOS': np.char.mod('%.2f', random.random_sample(visit_count)),
+        'VISIT_TYPE': np.array(VISIT_TYPES, dtype=object)[random.randint(0, len(VISIT_TYPES), visit_count)]})
+
+    # diagnoses: codes of the code lists of run.py, other codes, and the AMI codes of the AMI patients
+    rows = repeat_rows(random, DIAGNOSES_PER_VISIT, visit_count)
+    codes = np.asarray(pools['codes'], dtype=object)[random.randint(0, len(pools['codes']), len(rows))]
+    other = random.random_sample(len(rows)) < OTHER_CODES
+    codes[other] = get_other_codes(random, other.sum())
+    chronic_codes = np.asarray(pools['codes'], dtype=object)[random.randint(0, len(pools['codes']),
+                                                                             (patient_count, CHRONIC_CODES))]
+    chronic = random.random_sample(len(rows)) < CHRONIC_DIAGNOSES
+    codes[chronic] = chronic_codes[visit_patients[rows[chronic]], random.randint(0, CHRONIC_CODES, chronic.sum())]
+    ami_patients = random.random_sample(patient_count) < AMI_PATIENTS
+    first_visits = np.cumsum(visit_counts) - visit_counts
+    ami_visits = ami_patients[visit_patients] & (random.random_sample(visit_count) < AMI_VISITS)
+    # an AMI patient without an AMI visit gets one on a random visit
+    missing = ami_patients & (np.bincount(visit_patients, ami_visits, patient_count) == 0)
+    ami_visits[first_visits[missing] + (random.random_sample(missing.sum()) * visit_counts[missing]).astype(int)] = True
+    ami_rows = np.flatnonzero(ami_visits)
+    ami_codes = np.asarray(run.ACUTE_MYOCARDIAL_INFARCTION_CODE, dtype=object)[
+        random.randint(0, len(run.ACUTE_MYOCARDIAL_INFARCTION_CODE), len(ami_rows))]
+    rows = np.concatenate([rows, ami_rows])
+    codes = np.concatenate([codes, ami_codes])
+    order = np.argsort(rows, kind='stable')
+    rows = rows[order]
+    codes = codes[order]
+    tables['diagnoses'] = pd.DataFrame({
+        'PAT_ID': visit_pat_ids[rows], 'VISIT_NO': quote(random, visit_nos[rows]), 'ADM_DATE': admission_dates[rows],
+        'CODE': quote(random, codes),
+        'CODE_VERSION': np.where(pd.Series(codes).str[:1].str.isalpha().values, 'ICD10CM', 'ICD9CM'),
+        'CODE_DESC': np.asarray(pools['descriptions'], dtype=object)[random.randint(0, len(pools['descriptions']),
+                                                                                    len(rows))]})
+
+    # labs: numbers in and out of the reference ranges, text values and empty values
+    rows = repeat_rows(random, LABS_PER_VISIT, visit_count)
+    values = np.char.mod('%.2f', random.uniform(0.1, 150, len(rows))).astype(object)
+    small = random.random_sample(len(rows)) < 0.25
+    values[small] = np.char.mod('%.1f', random.uniform(0.2, 3, small.sum()))
+    text = random.random_sample(len(rows)) < 0.25
+    values[text] = np.asarray(LAB_TEXT_VALUES, dtype=object)[random.randint(0, len(LAB_TEXT_VALUES), text.sum())]
+    days = admissions[rows] + (random.random_sample(len(rows)) * (discharges[rows] - admissions[rows] + 1)).astype(int)
+    times = np.char.mod('%02d:', random.randint(0, 24, len(rows))).astype(object) \
+        + np.char.mod('%02d', random.randint(0, 60, len(rows))).astype(object)
+    tables['labs'] = pd.DataFrame({
+        'PAT_ID': visit_pat_ids[rows], 'VISIT_NO': visit_nos[rows],
+        'ITEM': np.asarray(LAB_ITEMS, dtype=object)[random.randint(0, len(LAB_ITEMS), len(rows))],
+        'OBS_VALUE': values, 'OBS_VALUE_NUM': quote(random, values.copy()),
+        'OBS_DTM': format_days(days) + ' ' + times})
+
+    # medications, ordered and administered on the same visits
+    rows = repeat_rows(random, MEDICATIONS_PER_VISIT, visit_count)
+    medications = np.asarray(pools['medications'], dtype=object)
+    tables['med_orders'] = pd.DataFrame({
+        'PAT_ID': visit_pat_ids[rows], 'VISIT_NO': visit_nos[rows],
+        'ITEM': quote(random, medications[random.randint(0, len(medications), len(rows))]),
+        'ORDER_TYPE': np.asarray(ORDER_TYPES, dtype=object)[random.randint(0, len(ORDER_TYPES), len(rows))]})
+    tables['med_admin'] = pd.DataFrame({
+        'PAT_ID': visit_pat_ids[rows], 'VISIT_NO': visit_nos[rows],
+        'ITEM': medications[random.randint(0, len(medications), len(rows))]})
+
+    # procedures, some of them days before the admission or after the discharge
+    rows = repeat_rows(random, PROCEDURES_PER_VISIT, visit_count)
+    procedure_codes = np.asarray(pools['procedure_codes'], dtype=object)
+    procedure_descriptions = np.asarray(pools['procedure_descriptions'], dtype=object)
+    days = admissions[rows] - 2 + (random.random_sample(len(rows)) * (discharges[rows] - admissions[rows] + 5)).astype(int)
+    tables['procedures'] = pd.DataFrame({
+        'PAT_ID': visit_pat_ids[rows], 'VISIT_NO': visit_nos[rows],
+        'CODE': procedure_codes[random.randint(0, len(procedure_codes), len(rows))],
+        'CODE_DESC': procedure_descriptions[random.randint(0, len(procedure_descriptions), len(rows))],
+        'PROC_DT': format_days(days)})
+
+    # demographics on the first visit of most patients
+    rows = np.flatnonzero(random.random_sample(patient_count) < DEMOGRAPHICS_PATIENTS)
+    visits = first_visits[rows]
+    tables['demographics'] = pd.DataFrame({
+        'PAT_ID': pat_ids[rows], 'VISIT_NO': visit_nos[visits],
+        'PAT_GENDER': np.where(random.random_sample(len(rows)) < 0.5, 'M', 'F'),
+        'SSN': quote(random, np.char.mod('000-00-%04d', patients[rows] % 10000)),
+        'ZIP': np.char.mod('0375%d', patients[rows] % 10),
+        'FIRST_NAME': np.char.mod('F%d', patients[rows]), 'LAST_NAME': np.char.mod('L%d', patients[rows]),
+        'MIDDLE_NAME': '',
+        'DOB': format_days(-random.randint(BIRTH_DAYS[0], BIRTH_DAYS[1], len(rows))),
+        'AMI_ADM_DATE': format_days(admissions[visits], '-'),
+        'AMI_DSCH_DATE': format_days(discharges[visits], '-')})
+
+    return tables, visit_count
+
+def write_cohort(directory, patient_count, seed=7):
+    '''
+    Write a synthetic cohort into a directory, with the file names of run.py.
+    :param directory:
+    :param patient_count: number of patients
+    :param seed: seed of the random generator
+    :return: dict of table name to the number of rows written
+    '''
+    codes, descriptions = get_code_pools()
+    pools = {'codes': codes, 'descriptions': descriptions, 'medications': get_medications(),
+             'procedure_codes': sorted(set(run.REVASCULARIZATION_CODE + run.ONE_VESSEL_CODE
+                                           + [run.ADDITIONAL_VESSEL_CODE] + OTHER_PROCEDURE_CODES
+                                           + [get_pattern_example(pattern)
+                                              for pattern in run.CARDIAC_PROCEDURE_FLAG_PATTERN])),
+             # the cardiac procedures are found by their descriptions
+             'procedure_descriptions': run.ECHOCARDIOGRAPHY_CODE + OTHER_DESCRIPTIONS
+                                       + ['%s PROCEDURE' % get_pattern_example(pattern)
+                                          for pattern in run.CARDIAC_PROCEDURE_FLAG_PATTERN[:5]]}
+    os.makedirs(directory, exist_ok=True)
+    paths = {name: os.path.join(directory, run.SOURCE_TABLES[name]['path']) for name in HEADERS}
+    row_counts = dict.fromkeys(HEADERS, 0)
+    for name, path in paths.items():
+        with open(path, 'w') as f:
+            f.write('|'.join(HEADERS[name]) + '\n')
+
+    first_visit = 1
+    for chunk, first_patient in enumerate(range(0, patient_count, CHUNK_PATIENTS)):
+        random = np.random.RandomState([seed, chunk])
+        tables, visit_count = generate_chunk(random, first_patient,
+                                             min(CHUNK_PATIENTS, patient_count - first_patient), first_visit, pools)
+        first_visit += visit_count
+        for name, df in tables.items():
+            lines = df[HEADERS[name][0]].astype(str)
+            for column in HEADERS[name][1:]:
+                lines = lines + '|' + df[column].astype(str)
+            with open(paths[name], 'a') as f:
+                if len(lines):
+                    f.write('\n'.join(lines) + '\n')
+            row_counts[name] += len(df)
+    return row_counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic cohort in the format of the source tables.')
+    parser.add_argument('directory', help='directory to write the source tables to')
+    parser.add_argument('--patients', type=int, default=1000, metavar='N', help='number of patients')
+    parser.add_argument('--seed', type=int, default=7, metavar='N', help='seed of the random generator')
+    args = parser.parse_args()
+
+    for name, rows in write_cohort(args.directory, args.patients, args.seed).items():
+        print('%s: %d rows' % (name, rows))
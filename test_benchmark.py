@@ -0,0 +1,56 @@
+'''
+
+Checks that benchmark.py reports the stages whose time grows faster than the number of patients, on made-up times
+of the shapes run.py has had: linear stages with a fixed cost and timing noise, a sort, a quadratic per-patient scan
+hidden behind a large per-patient cost, and a stage quadratic from the start.
+
+$ python3 -m pytest test_benchmark.py
+
+'''
+
+import math
+import pandas as pd
+
+import benchmark
+
+
+SCALES = [2000, 8000, 32000]
+
+
+def get_times(stages):
+    '''
+    give functions of the number of patients, return the times of benchmark for them
+    :param stages: dict of stage name to a function of the number of patients giving its seconds
+    :return: dataframe of the times with the scaling columns, see benchmark.add_scaling
+    '''
+    times = {stage: {scale: seconds(scale) for scale in SCALES} for stage, seconds in stages.items()}
+    return benchmark.add_scaling(pd.DataFrame.from_dict(times, orient='index')[SCALES], SCALES)
+
+def get_flagged(stages):
+    return [stage for stage, _ in benchmark.find_superlinear(get_times(stages))]
+
+
+def test_linear_stages_are_not_flagged():
+    noise = {2000: 0.9, 8000: 1.0, 32000: 1.1}
+    stages = {'linear': lambda n: 1e-4 * n,
+              'fixed_cost': lambda n: 0.5 + 1e-5 * n,
+              'noisy_up': lambda n: 2e-4 * n * noise[n],
+              'noisy_down': lambda n: 2e-4 * n / noise[n],
+              'sort': lambda n: 1e-4 * n * math.log(n),
+              'short': lambda n: 4e-11 * n * n}
+    assert get_flagged(stages) == []
+
+def test_quadratic_stage_is_flagged():
+    assert get_flagged({'quadratic': lambda n: 1e-8 * n * n}) == ['quadratic']
+
+def test_hidden_quadratic_scan_is_flagged():
+    # a per-patient scan of a table as large as the cohort, behind a per-patient cost of 1ms as GRACE_SCORE had: the
+    # exponent between the two largest scales stays under 1.5, the time per patient still grows by half
+    times = get_times({'scan': lambda n: 1e-3 * n + 2e-8 * n * n})
+    assert times.loc['scan', 'exponent'] < benchmark.SUPERLINEAR_EXPONENT
+    assert [stage for stage, _ in benchmark.find_superlinear(times)] == ['scan']
+
+def test_two_scales_only_have_the_exponent():
+    times = benchmark.add_scaling(pd.DataFrame({2000: [1.0], 8000: [20.0]}, index=['quadratic']), [2000, 8000])
+    assert 'per_patient_growth' not in times.columns
+    assert [stage for stage, _ in benchmark.find_superlinear(times)] == ['quadratic']
@@ -0,0 +1,62 @@
+'''
+
+Checks that the sparse product terms of run.py equal the dense ones on factors with zeros, NaNs and infinities, where
+a zero factor makes the product zero unless another factor is missing.
+
+$ python3 -m pytest test_terms.py
+
+'''
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import run
+
+
+pytest.importorskip('scipy')
+
+
+def get_target_df(columns):
+    '''
+    give a target table with one row per combination of the factor values of the terms
+    :param columns: list of factor column names
+    :return: dataframe with PERSON_ID and the factor columns
+    '''
+    flags = np.array([0, 1, 0, 1, 0, 1, 0, 1, 1], dtype=np.int8)
+    values = np.array([0.0, 0.0, np.nan, np.nan, 2.5, -1.5, np.inf, 0.5, 3.0])
+    rng = np.random.RandomState(0)
+    target_df = pd.DataFrame({'PERSON_ID': np.arange(len(flags) * 4)})
+    for number, column in enumerate(columns):
+        column_values = flags if number % 2 == 0 else values
+        target_df[column] = np.tile(column_values, 4)[rng.permutation(len(target_df))]
+    return target_df
+
+def assert_sparse_equals_dense(target_df, terms):
+    matrix = run.compute_terms(target_df, terms, sparse=True).toarray()
+    dense = run.compute_terms(target_df, terms)
+    for number, (name, factors) in enumerate(terms):
+        np.testing.assert_array_equal(matrix[:, number], dense[name], err_msg=name)
+
+
+def test_zero_times_nan_is_nan():
+    target_df = pd.DataFrame({'PERSON_ID': [1, 2, 3, 4],
+                              'A': np.array([0, 0, 1, 1], dtype=np.int8),
+                              'B': [np.nan, 0.0, np.nan, 2.0]})
+    matrix = run.compute_terms(target_df, [('A_B', ['A', 'B'])], sparse=True)
+    np.testing.assert_array_equal(matrix.toarray()[:, 0], [np.nan, 0.0, np.nan, 2.0])
+    assert matrix.nnz == 3
+
+def test_interaction_terms_sparse_equals_dense():
+    columns = sorted({column for name, factors in run.INTERACTION_TERM_SPECS for column in factors})
+    assert_sparse_equals_dense(get_target_df(columns), run.INTERACTION_TERM_SPECS)
+
+def test_polynomial_terms_sparse_equals_dense():
+    columns = sorted({column for name, factors in run.POLYNOMIAL_TERM_SPECS for column in factors})
+    assert_sparse_equals_dense(get_target_df(columns), run.POLYNOMIAL_TERM_SPECS)
+
+def test_interaction_terms_frame_equals_dense():
+    columns = sorted({column for name, factors in run.INTERACTION_TERM_SPECS for column in factors})
+    target_df = get_target_df(columns)
+    dense = pd.DataFrame(run.compute_terms(target_df, run.INTERACTION_TERM_SPECS), index=target_df['PERSON_ID'].values)
+    pd.testing.assert_frame_equal(run.INTERACTION_TERMS(target_df).sparse.to_dense(), dense, check_dtype=False)